@@ -2,6 +2,7 @@
 
 import { useEffect, useState } from 'react';
 import { fetchWithAuth } from '@/lib/api';
+import { subscribeToEvents } from './events';
 import { Card, CardContent } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Check, LogOut } from 'lucide-react';
@@ -14,15 +15,20 @@ export default function KidDashboard({ profile: initialProfile }: { profile: any
     const [profile, setProfile] = useState(initialProfile);
     const [loading, setLoading] = useState(true);
 
+    const loadChores = async () => {
+        const res = await fetchWithAuth('/chores/');
+        // List endpoints are cursor paginated: { next, previous, results }
+        setChores((await res.json()).results);
+    };
+
     useEffect(() => {
         const loadDashboard = async () => {
             try {
-                const [choresRes, rewardsRes] = await Promise.all([
-                    fetchWithAuth('/chores/'),
-                    fetchWithAuth('/rewards/')
+                const [rewardsRes] = await Promise.all([
+                    fetchWithAuth('/rewards/'),
+                    loadChores()
                 ]);
-                setChores(await choresRes.json());
-                setRewards(await rewardsRes.json());
+                setRewards((await rewardsRes.json()).results);
             } catch (err) {
                 console.error(err);
             } finally {
@@ -30,6 +36,12 @@ export default function KidDashboard({ profile: initialProfile }: { profile: any
             }
         };
         loadDashboard();
+
+        // The server pushes this kid's balance and chore changes (e.g. a parent adding a chore)
+        return subscribeToEvents({
+            balance: (data) => setProfile((current: any) => ({ ...current, points: data.points })),
+            chore: () => loadChores(),
+        });
     }, []);
 
     const handleLogout = () => {
@@ -2,6 +2,7 @@
 
 import { useEffect, useState } from 'react';
 import { fetchWithAuth } from '@/lib/api';
+import { subscribeToEvents } from './events';
 import { Card, CardHeader, CardTitle, CardContent } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { LogOut, Smile, Frown, Check, X } from 'lucide-react';
@@ -14,18 +15,21 @@ export default function ParentDashboard({ profile: initialProfile }: { profile:
     const [profile, setProfile] = useState(initialProfile);
     const [loading, setLoading] = useState(true);
 
+    const loadKids = async () => {
+        const res = await fetchWithAuth('/profiles/');
+        setKids((await res.json()).filter((p: any) => p.role === 'KID'));
+    };
+
+    const loadRedemptions = async () => {
+        const res = await fetchWithAuth('/redemptions/?status=PENDING');
+        // List endpoints are cursor paginated: { next, previous, results }
+        setRedemptions((await res.json()).results);
+    };
+
     useEffect(() => {
         const loadData = async () => {
             try {
-                const [profilesRes, redemptionsRes] = await Promise.all([
-                    fetchWithAuth('/profiles/'),
-                    fetchWithAuth('/redemptions/')
-                ]);
-                const profilesData = await profilesRes.json();
-                const redemptionsData = await redemptionsRes.json();
-
-                setKids(profilesData.filter((p: any) => p.role === 'KID'));
-                setRedemptions(redemptionsData.filter((r: any) => r.status === 'PENDING'));
+                await Promise.all([loadKids(), loadRedemptions()]);
             } catch (err) {
                 console.error(err);
             } finally {
@@ -33,6 +37,12 @@ export default function ParentDashboard({ profile: initialProfile }: { profile:
             }
         };
         loadData();
+
+        // Balances and new redemptions are pushed by the server, no polling needed
+        return subscribeToEvents({
+            balance: (data) => setKids(current => current.map(k => k.user.id === data.user_id ? { ...k, points: data.points } : k)),
+            redemption: () => loadRedemptions(),
+        });
     }, []);
 
     const handleLogout = () => {
@@ -69,11 +79,9 @@ export default function ParentDashboard({ profile: initialProfile }: { profile:
                 // Remove from pending list
                 setRedemptions(redemptions.filter(r => r.id !== redemptionId));
 
-                // If rejected, we must refund points in UI so we re-fetch the kids data
+                // A refund also arrives as a 'balance' event, but not while the stream is reconnecting
                 if (action === 'reject') {
-                    const profilesRes = await fetchWithAuth('/profiles/');
-                    const profilesData = await profilesRes.json();
-                    setKids(profilesData.filter((p: any) => p.role === 'KID'));
+                    await loadKids();
                 }
             }
         } catch (e) {
@@ -0,0 +1,49 @@
+import { fetchWithAuth } from '@/lib/api';
+
+const EVENTS_URL = 'http://127.0.0.1:8080/api/v1/events/';
+// Wait before reconnecting, like the server's `retry:` hint
+const RECONNECT_MS = 3000;
+
+type Handlers = Record<string, (data: any) => void>;
+
+/**
+ * Open the dashboard event stream and call handlers[event] with each event's data.
+ * EventSource can't send the Bearer header, so every connection first swaps it
+ * for a short-lived stream ticket. Returns a function that closes the stream.
+ */
+export function subscribeToEvents(handlers: Handlers): () => void {
+    let source: EventSource | null = null;
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    let closed = false;
+
+    const reconnect = () => {
+        if (!closed) timer = setTimeout(connect, RECONNECT_MS);
+    };
+
+    const connect = async () => {
+        try {
+            const res = await fetchWithAuth('/events/ticket/', { method: 'POST' });
+            if (!res.ok) return reconnect();
+            const { ticket } = await res.json();
+            if (closed) return;
+            source = new EventSource(`${EVENTS_URL}?ticket=${encodeURIComponent(ticket)}`);
+            for (const [event, handler] of Object.entries(handlers)) {
+                source.addEventListener(event, (e) => handler(JSON.parse((e as MessageEvent).data)));
+            }
+            // The ticket has expired by the time EventSource would retry it, so reconnect with a new one
+            source.onerror = () => {
+                source?.close();
+                reconnect();
+            };
+        } catch (e) {
+            reconnect();
+        }
+    };
+
+    connect();
+    return () => {
+        closed = true;
+        clearTimeout(timer);
+        source?.close();
+    };
+}
@@ -1,5 +1,6 @@
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -94,6 +95,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Keeps a user's reads on the primary right after they write
+    'helpers.db.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
@@ -126,25 +129,92 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
 
+# Under ASGI Django advises against persistent connections; set CONN_MAX_AGE=0
+# there if the database runs out of connections, with a pooler such as PgBouncer in front
 CONN_MAX_AGE = config("CONN_MAX_AGE", cast=int, default=30)
 DATABASE_URL = config("DATABASE_URL", default=None)
 
-# if DATABASE_URL is not None:  
-#     import dj_database_url  
-#     DATABASES = {
-#          "default": dj_database_url.config(
-#             default=DATABASE_URL,
-#             conn_max_age=CONN_MAX_AGE,
-#             conn_health_checks=True
-#         )    
-#     }
-# else:
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Reads from views marked with helpers.db.replica_view / ReplicaListMixin
+# go to a replica, e.g. DATABASE_REPLICA_URLS=postgres://replica-1/db,postgres://replica-2/db
+DATABASE_REPLICA_URLS = config("DATABASE_REPLICA_URLS", cast=Csv(), default="")
+
+if DATABASE_URL is not None:
+    import dj_database_url
+    DATABASES = {
+        "default": dj_database_url.parse(
+            DATABASE_URL,
+            conn_max_age=CONN_MAX_AGE,
+            conn_health_checks=True,
+        )
     }
-}
+    for n, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+        DATABASES[f"replica{n}"] = {
+            **dj_database_url.parse(url, conn_max_age=CONN_MAX_AGE, conn_health_checks=True),
+            # Tests use the primary's test database instead of a copy
+            "TEST": {"MIRROR": "default"},
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["helpers.db.PrimaryReplicaRouter"]
+
+# After a user writes, their reads stay on the primary this long
+# (longer than the replicas usually lag behind). The pin is kept in the
+# cache, so replicas need CACHE_URL: every worker must see it
+REPLICA_PIN_SECONDS = config("REPLICA_PIN_SECONDS", cast=int, default=5)
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Set CACHE_URL (redis://...) to share the cache between workers, otherwise
+# each process keeps its own in memory
+
+CACHE_URL = config("CACHE_URL", default=None)
+
+if CACHE_URL is not None:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# core.cache read-through caching of rewards, chore lists and plans. Only on
+# with a shared cache: with per-process LocMem, invalidations made by commands
+# and the job worker would never reach the web processes
+
+READ_CACHE = config("READ_CACHE", cast=bool, default=CACHE_URL is not None)
+
+if DATABASE_REPLICAS and CACHE_URL is None:
+    raise ImproperlyConfigured(
+        "DATABASE_REPLICA_URLS needs CACHE_URL: without a shared cache a user's "
+        "replica pin only exists in the worker that served their write."
+    )
+
+# Live dashboard events (core.events)
+# Single-process unless EVENTS_URL (redis://...) is set; defaults to the cache's Redis.
+# Required with more than one web worker or a job worker (the Dockerfile's default shape),
+# otherwise an event only reaches streams served by the process that published it
+
+EVENTS_URL = config("EVENTS_URL", default=CACHE_URL)
+
+# Event table archival (commando.archive)
+# Rows older than ARCHIVE_AFTER_DAYS move to gzipped NDJSON segments under ARCHIVE_DIR.
+# No default: the rows are deleted, so it must be durable storage such as a mounted volume
+
+ARCHIVE_DIR = config("ARCHIVE_DIR", default=None)
+ARCHIVE_AFTER_DAYS = config("ARCHIVE_AFTER_DAYS", cast=int, default=180)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -169,7 +239,32 @@ LOGIN_REDIRECT_URL = "/core/dashboard/"
 ACCOUNT_EMAIL_REQUIRED = False
 ACCOUNT_AUTHENTICATION_METHOD = "username_email"
 ACCOUNT_EMAIL_SUBJECT_PREFIX = "[SaaS] - "
-AUTHENTICATION_BACKENDS = [    
+
+# Hand slow work (account emails, plan refreshes) to `manage.py run_worker`
+# instead of doing it in the request. Needs a worker running.
+BACKGROUND_JOBS = config("BACKGROUND_JOBS", cast=bool, default=False)
+if BACKGROUND_JOBS:
+    ACCOUNT_ADAPTER = "commando.adapters.QueuedAccountAdapter"
+
+# Recurring jobs run by `manage.py run_worker`: dotted path -> seconds between runs
+PERIODIC_JOBS = {
+    "core.models.generate_occurrences": 24 * 60 * 60,
+    # Hourly, so a streak broken at midnight shows as broken within the hour
+    "core.achievements.expire_streaks": 60 * 60,
+    "subscriptions.outbox.drain": 60,
+    "subscriptions.webhooks.process_pending": 60,
+    "commando.jobs.purge": 60 * 60,
+}
+
+# How long finished jobs stay in the queue table before commando.jobs.purge
+# deletes them. Failed ones are kept longer, to look into
+JOB_RETENTION_DAYS = config("JOB_RETENTION_DAYS", cast=int, default=7)
+FAILED_JOB_RETENTION_DAYS = config("FAILED_JOB_RETENTION_DAYS", cast=int, default=30)
+
+AUTHENTICATION_BACKENDS = [
+    # Subscription feature gates (subscriptions.pro, ...) from materialized entitlements
+    'subscriptions.backends.EntitlementBackend',
+
     # Needed to login by username in Django admin, regardless of `allauth`
     'django.contrib.auth.backends.ModelBackend',
 
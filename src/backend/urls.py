@@ -38,6 +38,7 @@ urlpatterns = [
     path("checkout/sub-price/<int:price_id>/", checkout_views.product_price_redirect_view, name='sub-price-checkout'),
     path("checkout/start/", checkout_views.checkout_redirect_view, name='stripe-checkout-start'),
     path("checkout/success/", checkout_views.checkout_finalize_view, name='stripe-checkout-end'),
+    path("checkout/webhook/", subscription_views.stripe_webhook_view, name='stripe-webhook'),
     #pricing
     path("pricing/", subscription_views.subscription_price_view, name='pricing'),
     path("pricing/<str:interval>/", subscription_views.subscription_price_view, name='pricing_interval'),
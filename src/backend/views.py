@@ -6,7 +6,7 @@ from django.conf import settings
 
 from django.http import HttpResponse
 
-from visits.models import PageVisit
+from visits.buffer import record_visit, visit_totals
 
 LOGIN_URL = settings.LOGIN_URL
 
@@ -17,21 +17,21 @@ def home_view(request, *args, **kwargs):
 
 
 def about_view(request, *args, **kwargs):
-    qs = PageVisit.objects.all()
-    page_qs = PageVisit.objects.filter(path=request.path)
+    # Cached totals, the visit itself is written behind in batches
+    page_visit_count, total_visit_count = visit_totals(request.path)
     try:
-        percent = (page_qs.count() * 100.0) / qs.count()
+        percent = (page_visit_count * 100.0) / total_visit_count
     except:
         percent = 0
     my_title = "My Page"
     html_template = "home.html"
     my_context = {
         "page_title": my_title,
-        "page_visit_count": page_qs.count(),
+        "page_visit_count": page_visit_count,
         "percent": percent,
-        "total_visit_count": qs.count(),
+        "total_visit_count": total_visit_count,
     }
-    PageVisit.objects.create(path=request.path)
+    record_visit(request.path)
     return render(request, html_template, my_context)
 
 
@@ -1,3 +1,66 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from customers.models import Customer
+from subscriptions.models import Subscription, SubscriptionPrice, UserSubscription
+
+User = get_user_model()
+
+
+# The manifest only exists after collectstatic
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class CheckoutFinalizeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer')
+        Customer.objects.create(user=self.user, stripe_id='cus_1')
+        self.plan = Subscription.objects.create(name='Pro', stripe_id='prod_pro')
+        SubscriptionPrice.objects.create(subscription=self.plan, price=10, stripe_id='price_pro')
+        start = timezone.now().replace(microsecond=0)
+        self.checkout = {
+            'customer_id': 'cus_1', 'plan_id': 'price_pro', 'sub_stripe_id': 'sub_new', 'status': 'active',
+            'current_period_start': start, 'current_period_end': start + datetime.timedelta(days=30),
+        }
+
+    def finalize(self, session_id='cs_1'):
+        return self.client.get('/checkout/success/', {'session_id': session_id})
+
+    def test_missing_session_is_rejected(self):
+        self.assertEqual(self.client.get('/checkout/success/').status_code, 400)
+
+    @mock.patch('helpers.billing.cancel_subscription')
+    @mock.patch('helpers.billing.get_checkout_customer_plan')
+    def test_reload_asks_stripe_once_and_changes_nothing(self, get_checkout_customer_plan, cancel_subscription):
+        get_checkout_customer_plan.return_value = self.checkout
+        self.assertEqual(self.finalize().status_code, 200)
+        user_sub = UserSubscription.objects.get(user=self.user)
+        self.assertEqual((user_sub.subscription, user_sub.stripe_id), (self.plan, 'sub_new'))
+        with mock.patch.object(UserSubscription, 'save') as save:
+            self.assertRedirects(self.finalize(), '/accounts/billing/', fetch_redirect_response=False)
+        save.assert_not_called()
+        get_checkout_customer_plan.assert_called_once_with('cs_1')
+        cancel_subscription.assert_not_called()
+
+    @mock.patch('helpers.billing.cancel_subscription')
+    @mock.patch('helpers.billing.get_checkout_customer_plan')
+    def test_new_subscription_replaces_the_old_one(self, get_checkout_customer_plan, cancel_subscription):
+        UserSubscription.objects.create(user=self.user, stripe_id='sub_old', status='active')
+        get_checkout_customer_plan.return_value = self.checkout
+        self.finalize()
+        cancel_subscription.assert_called_once_with('sub_old', reason='auto end new membership', feedback='other')
+        user_sub = UserSubscription.objects.get(user=self.user)
+        self.assertEqual((user_sub.subscription, user_sub.stripe_id), (self.plan, 'sub_new'))
+
+    @mock.patch('helpers.billing.get_checkout_customer_plan')
+    def test_unknown_customer_is_rejected(self, get_checkout_customer_plan):
+        get_checkout_customer_plan.return_value = {**self.checkout, 'customer_id': 'cus_other'}
+        self.assertEqual(self.finalize().status_code, 400)
+        self.assertFalse(UserSubscription.objects.exists())
@@ -1,14 +1,24 @@
+import logging
+
+import stripe
 from django.contrib import messages
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from subscriptions.models import SubscriptionPrice, Subscription, UserSubscription
+from subscriptions.models import BillingOutbox, SubscriptionPrice, Subscription, UserSubscription
+from subscriptions import outbox
 import helpers.billing
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Subquery
 from django.http import HttpResponseBadRequest
 
+logger = logging.getLogger(__name__)
+
 BASE_URL = settings.BASE_URL
+# A checkout session never changes once it's complete
+CHECKOUT_CACHE_TIMEOUT = 60 * 60
 User = get_user_model()
 
 def product_price_redirect_view(request, price_id=None, *args, **kwargs):
@@ -22,75 +32,100 @@ def checkout_redirect_view(request):
         obj = SubscriptionPrice.objects.get(id=checkout_subscription_price_id)        
     except:
         obj = None
-    customer_stripe_id = request.user.customer.stripe_id    
+    if checkout_subscription_price_id is None or obj is None:
+        return redirect("pricing")        
+    if not obj.stripe_id:
+        # Not created in Stripe yet, the worker picks it up shortly
+        messages.error(request, "This plan isn't available yet, please try again in a few minutes.")
+        return redirect("pricing")
+    customer = request.user.customer
+    if not customer.stripe_id and not customer.init_email_confirmed:
+        # The Stripe customer is only created once the email is confirmed
+        messages.error(request, "Please confirm your email address before subscribing.")
+        return redirect("pricing")
+    if not customer.stripe_id:
+        # Still queued in the billing outbox, checkout can't wait for the worker
+        if outbox.process_now(BillingOutbox.Action.CREATE_CUSTOMER, customer.id):
+            customer.refresh_from_db(fields=['stripe_id'])
+    if not customer.stripe_id:
+        # Without a customer the finalize step could never find this user
+        messages.error(request, "We couldn't reach our payment provider, please try again in a few minutes.")
+        return redirect("pricing")
+    customer_stripe_id = customer.stripe_id    
     success_url_path = reverse("stripe-checkout-end")
     pricing_url_path = reverse("pricing")
     success_url = f"{BASE_URL}{success_url_path}"
     cancel_url = f"{BASE_URL}{pricing_url_path}"
-    if checkout_subscription_price_id is None or obj is None:
-        return redirect("pricing")        
-    url = helpers.billing.start_checkout_session(
-        customer_stripe_id,
-        success_url=success_url,
-        cancel_url=cancel_url,
-        price_stripe_id=obj.stripe_id,
-        raw=False
-    )
+    try:
+        url = helpers.billing.start_checkout_session(
+            customer_stripe_id,
+            success_url=success_url,
+            cancel_url=cancel_url,
+            price_stripe_id=obj.stripe_id,
+            raw=False
+        )
+    except stripe.error.StripeError:
+        logger.exception("Could not start checkout for user %s", request.user.id)
+        messages.error(request, "We couldn't reach our payment provider, please try again in a few minutes.")
+        return redirect("pricing")
     return redirect(url)
 
+def get_checkout_data(session_id):
+    # Reloading the success page reuses the first lookup instead of asking Stripe again
+    key = f"checkout-session:{session_id}"
+    checkout_data = cache.get(key)
+    if checkout_data is None:
+        checkout_data = helpers.billing.get_checkout_customer_plan(session_id)
+        cache.set(key, checkout_data, CHECKOUT_CACHE_TIMEOUT)
+    return dict(checkout_data)
+
 def checkout_finalize_view(request):
     session_id = request.GET.get('session_id')
-    # checkout_r = helpers.billing.get_checkout_session(session_id, raw=True)
-    checkout_data = helpers.billing.get_checkout_customer_plan(session_id)    
+    if not session_id:
+        return HttpResponseBadRequest("Missing checkout session")
+    checkout_data = get_checkout_data(session_id)
     
     plan_id = checkout_data.pop('plan_id')
     customer_id = checkout_data.pop('customer_id')
     sub_stripe_id = checkout_data.pop('sub_stripe_id')
     subscription_data = {**checkout_data}
 
-    # qs = SubscriptionPrice.objects.filter(stripe_id=plan_id)    
-    try:
-        sub_obj = Subscription.objects.get(subscriptionprice__stripe_id=plan_id)
-    except:
-        sub_obj = None
-    try: 
-        user_obj = User.objects.get(customer__stripe_id=customer_id)
-    except:
-        user_obj = None
-    _user_sub_exists = False        
+    # User, their current subscription and the plan's id in one query
+    user_obj = (
+        User.objects.filter(customer__stripe_id=customer_id)
+        .select_related('usersubscription')
+        .annotate(plan_subscription_id=Subquery(
+            SubscriptionPrice.objects.filter(stripe_id=plan_id, subscription__isnull=False).values('subscription_id')[:1]
+        ))
+        .first()
+    )
+    if user_obj is None or user_obj.plan_subscription_id is None:
+        return HttpResponseBadRequest("There was an error with you account, plese contact the administrator")
     updated_sub_options = {
-        "subscription": sub_obj,
+        "subscription_id": user_obj.plan_subscription_id,
         "stripe_id": sub_stripe_id,
         "user_cancelled": False,
         **subscription_data,
     }
     try:        
-        _user_sub_obj = UserSubscription.objects.get(user=user_obj)
-        _user_sub_exists = True
+        _user_sub_obj = user_obj.usersubscription
     except UserSubscription.DoesNotExist:
-        _user_sub_obj = UserSubscription.objects.create(
-            user=user_obj,
-            **updated_sub_options
-            )        
-    except:
-        _user_sub_obj = None
-    if None in [sub_obj, user_obj, _user_sub_obj]:
-        return HttpResponseBadRequest("There was an error with you account, plese contact the administrator")
-    
-    if _user_sub_exists:
-        #cancel all subs
-        old_stripe_id = _user_sub_obj.stripe_id    
-        same_stripe_id = old_stripe_id == sub_obj.stripe_id        
-        if old_stripe_id is not None and not same_stripe_id:
-            try:                
-                helpers.billing.cancel_subscription(old_stripe_id, reason="auto end new membership", feedback="other")
-            except:
-                pass
-        #asign new sub
+        UserSubscription.objects.create(user=user_obj, **updated_sub_options)
+        context={}
+        return render(request, "checkout/success.html", context)
+
+    #cancel all subs
+    old_stripe_id = _user_sub_obj.stripe_id    
+    same_stripe_id = old_stripe_id == sub_stripe_id
+    if old_stripe_id is not None and not same_stripe_id:
+        try:                
+            helpers.billing.cancel_subscription(old_stripe_id, reason="auto end new membership", feedback="other")
+        except:
+            pass
+    #asign new sub, only if this isn't a reload of an already applied checkout
+    if any(getattr(_user_sub_obj, k) != v for k, v in updated_sub_options.items()):
         for k, v in updated_sub_options.items():
             setattr(_user_sub_obj, k, v)        
         _user_sub_obj.save()
-        messages.success(request, "Succces! Thank you for joining.")
-        return redirect(_user_sub_obj.get_absolute_url())
-    context={}
-    return render(request, "checkout/success.html", context)
\ No newline at end of file
+    messages.success(request, "Succces! Thank you for joining.")
+    return redirect(_user_sub_obj.get_absolute_url())
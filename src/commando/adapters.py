@@ -0,0 +1,37 @@
+from allauth.account.adapter import DefaultAccountAdapter
+from allauth.core import context as allauth_context
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.mail import EmailMultiAlternatives
+
+from . import jobs
+
+
+def deliver_mail(subject, body, from_email, to, headers=None, alternatives=(), content_subtype="plain"):
+    msg = EmailMultiAlternatives(subject, body, from_email, to, headers=headers)
+    msg.content_subtype = content_subtype
+    for content, mimetype in alternatives:
+        msg.attach_alternative(content, mimetype)
+    msg.send()
+
+
+class QueuedAccountAdapter(DefaultAccountAdapter):
+    """Renders allauth emails during the request and sends them from a job."""
+
+    def send_mail(self, template_prefix, email, context):
+        request = allauth_context.request
+        ctx = {
+            "request": request,
+            "email": email,
+            "current_site": get_current_site(request),
+        }
+        ctx.update(context)
+        msg = self.render_mail(template_prefix, email, ctx)
+        jobs.enqueue(deliver_mail, kwargs={
+            "subject": msg.subject,
+            "body": msg.body,
+            "from_email": msg.from_email,
+            "to": msg.to,
+            "headers": msg.extra_headers,
+            "alternatives": [list(alternative) for alternative in getattr(msg, "alternatives", [])],
+            "content_subtype": msg.content_subtype,
+        }, priority=10)
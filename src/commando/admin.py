@@ -1,3 +1,21 @@
 from django.contrib import admin
 
+from .models import ArchiveSegment, ArchiveSummary, Job
+
 # Register your models here.
+@admin.register(ArchiveSegment)
+class ArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ['table', 'month', 'rows', 'size', 'updated_at']
+    list_filter = ['table']
+    readonly_fields = ['locked_by', 'locked_until']
+
+@admin.register(ArchiveSummary)
+class ArchiveSummaryAdmin(admin.ModelAdmin):
+    list_display = ['table', 'day', 'key', 'rows', 'amount']
+    list_filter = ['table']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['locked_by', 'locked_until', 'last_error', 'created_at', 'finished_at']
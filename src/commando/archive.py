@@ -0,0 +1,205 @@
+"""
+Move old rows from the append-only event tables into monthly segments.
+
+Each (table, month) gets one gzipped NDJSON file under ARCHIVE_DIR and an
+ArchiveSegment row recording how many bytes of it belong to committed
+chunks. A chunk is appended to the file as its own gzip member and fsynced
+first, then the rows are deleted and the segment advanced in one short
+transaction. If a run dies in between, the next one truncates the file back
+to the recorded size and re-archives the same rows, so nothing is lost or
+written twice and no lock is held longer than one chunk's delete. A run
+holds a lease on the segment row while it appends, so a second run
+archiving the same table waits for its turn instead of writing to the
+same file.
+
+The delete also adds the chunk's per-day counts to ArchiveSummary, so
+totals for archived days can still be read without the files. It is one
+DELETE by pk range without per-row signals; a table whose delete receivers
+clear a read cache names the cache kind, and each owner in the chunk is
+invalidated once instead.
+"""
+import datetime
+import gzip
+import json
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict, namedtuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core import cache as read_cache
+from .models import ArchiveSegment, ArchiveSummary
+
+# `timestamp` decides a row's month and day, the summaries count rows per
+# `key` column and add up the `amount` column where there is one. `cache` is
+# the core.cache kind the table's delete signal would invalidate per `key`
+Archivable = namedtuple('Archivable', ['timestamp', 'key', 'amount', 'cache'], defaults=[None, None])
+
+TABLES = {
+    'core.ChoreCompletion': Archivable('completed_at', 'user_id', cache='chores'),
+    'core.BehaviorLog': Archivable('timestamp', 'user_id', 'points_change'),
+    'visits.PageVisit': Archivable('timestamp', 'path'),
+}
+
+# Far longer than a chunk takes, so it only expires if its run died
+LEASE_SECONDS = 10 * 60
+# How long to wait for another run's lease before giving up
+LOCK_WAIT_SECONDS = 60
+
+
+class SegmentLocked(Exception):
+    """Another run is still archiving into the segment."""
+
+
+def archive_dir():
+    if not settings.ARCHIVE_DIR:
+        raise ImproperlyConfigured(
+            "Set ARCHIVE_DIR to durable storage before archiving, archived rows are deleted from the database"
+        )
+    return settings.ARCHIVE_DIR
+
+
+def _month_bounds(moment):
+    start = timezone.localtime(moment).date().replace(day=1)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    tz = timezone.get_current_timezone()
+    as_datetime = lambda day: datetime.datetime.combine(day, datetime.time.min, tzinfo=tz)
+    return start, as_datetime(start), as_datetime(end)
+
+
+def _segment_path(table, month):
+    app_label, model_name = table.split('.')
+    return os.path.join(app_label, model_name.lower(), f'{month:%Y-%m}.ndjson.gz')
+
+
+def _append(path, size, rows):
+    """Drop anything past `size` left by an interrupted run, append `rows`, return the new size."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as fh:
+        fh.truncate(size)
+        fh.seek(size)
+        with gzip.GzipFile(fileobj=fh, mode='wb') as gz:
+            for row in rows:
+                gz.write(json.dumps(row, cls=DjangoJSONEncoder).encode() + b'\n')
+        fh.flush()
+        os.fsync(fh.fileno())
+        return fh.tell()
+
+
+def _lock(segment, owner):
+    """Take the lease on `segment` for `owner` and return the segment as it is now."""
+    deadline = time.monotonic() + LOCK_WAIT_SECONDS
+    while True:
+        now = timezone.now()
+        taken = (
+            ArchiveSegment.objects
+            .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now) | Q(locked_by=owner), pk=segment.pk)
+            .update(locked_by=owner, locked_until=now + datetime.timedelta(seconds=LEASE_SECONDS))
+        )
+        if taken:
+            # Re-read, the previous holder may have moved `size` on
+            return ArchiveSegment.objects.get(pk=segment.pk)
+        if time.monotonic() > deadline:
+            raise SegmentLocked(f"{segment} is being archived by another run")
+        time.sleep(1)
+
+
+def _summarize(table, rows):
+    """Add the per-day counts of `rows` to ArchiveSummary. Runs under the segment's lease."""
+    columns = TABLES[table]
+    totals = defaultdict(lambda: [0, 0])
+    for row in rows:
+        total = totals[timezone.localdate(row[columns.timestamp]), str(row[columns.key] or '')]
+        total[0] += 1
+        if columns.amount:
+            total[1] += row[columns.amount]
+    days = [day for day, _ in totals]
+    existing = {
+        (summary.day, summary.key): summary
+        for summary in ArchiveSummary.objects.filter(table=table, day__gte=min(days), day__lte=max(days))
+    }
+    created = []
+    for (day, key), (count, amount) in totals.items():
+        summary = existing.get((day, key))
+        if summary is None:
+            created.append(ArchiveSummary(table=table, day=day, key=key, rows=count, amount=amount))
+        else:
+            summary.rows += count
+            summary.amount += amount
+    ArchiveSummary.objects.bulk_update([existing[key] for key in totals if key in existing], ['rows', 'amount'])
+    ArchiveSummary.objects.bulk_create(created)
+
+
+def _invalidate(table, rows):
+    """What the skipped post_delete receivers would have done, once per owner."""
+    columns = TABLES[table]
+    if columns.cache:
+        for owner_id in {row[columns.key] for row in rows}:
+            read_cache.invalidate(columns.cache, owner_id)
+
+
+def archive_table(table, cutoff, chunk_size=5000, pause=0):
+    """
+    Archive `table` rows older than `cutoff`, oldest first, `chunk_size`
+    rows per transaction. Sleeps `pause` seconds between chunks to leave
+    room for the app. Returns the number of rows archived. Raises
+    SegmentLocked if another run keeps a segment busy for too long.
+    """
+    root = archive_dir()
+    field = TABLES[table].timestamp
+    model = apps.get_model(table)
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    archived = 0
+    while True:
+        oldest = (
+            model.objects.filter(**{f'{field}__lt': cutoff})
+            .order_by(field).values_list(field, flat=True).first()
+        )
+        if oldest is None:
+            return archived
+        month, month_start, month_end = _month_bounds(oldest)
+        window = {f'{field}__gte': month_start, f'{field}__lt': min(month_end, cutoff)}
+        segment, _ = ArchiveSegment.objects.get_or_create(
+            table=table, month=month, defaults={'path': _segment_path(table, month)},
+        )
+        segment = _lock(segment, owner)
+        try:
+            # Read after locking, so a run that held the lease can't have archived them meanwhile
+            rows = list(model.objects.filter(**window).order_by('pk').values()[:chunk_size])
+            if rows:
+                size = _append(os.path.join(root, segment.path), segment.size, rows)
+                with transaction.atomic():
+                    # The chunk is the first rows of the window by pk, so this range is exactly them
+                    chunk = model.objects.filter(pk__gte=rows[0]['id'], pk__lte=rows[-1]['id'], **window)
+                    # No cascades from these tables, and delete() would fetch every row to signal it
+                    chunk._raw_delete(chunk.db)
+                    _invalidate(table, rows)
+                    _summarize(table, rows)
+                    advanced = ArchiveSegment.objects.filter(pk=segment.pk, locked_by=owner).update(
+                        size=size, rows=F('rows') + len(rows),
+                    )
+                    if not advanced:
+                        # Our lease ran out and the rows may be another run's now
+                        raise SegmentLocked(f"{segment} lease expired mid-chunk")
+        finally:
+            ArchiveSegment.objects.filter(pk=segment.pk, locked_by=owner).update(locked_by='', locked_until=None)
+        archived += len(rows)
+        if pause:
+            time.sleep(pause)
+
+
+def read_segment(segment):
+    """Yield the archived rows of `segment` as dicts, e.g. for an export or a restore."""
+    with open(os.path.join(archive_dir(), segment.path), 'rb') as fh:
+        # Only the committed bytes, an interrupted run may have left more
+        data = fh.read(segment.size)
+    for line in gzip.decompress(data).splitlines():
+        yield json.loads(line)
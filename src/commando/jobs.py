@@ -0,0 +1,307 @@
+"""
+A small database-backed job queue.
+
+    from commando import jobs
+    jobs.enqueue(send_receipt, args=[user.id], priority=10)
+
+and `manage.py run_worker` runs them, along with the recurring jobs in
+settings.PERIODIC_JOBS. A job is a dotted path to a function plus JSON
+args, so pass ids rather than model instances. Enqueueing inside a
+transaction only makes the job visible once that transaction commits.
+
+Jobs run at least once, so job functions must be safe to repeat. While a
+job runs its worker keeps extending the lock, however long the job takes.
+A worker that dies mid-job stops doing that, and once the visibility
+timeout passes another worker runs the job again.
+
+Finished jobs are kept for a while to look into, then the periodic
+jobs.purge deletes them (settings.JOB_RETENTION_DAYS, FAILED_JOB_RETENTION_DAYS).
+
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED where the
+database has it. SQLite doesn't, but it serializes writes, so there a job
+is claimed by a conditional UPDATE that only one worker can win.
+"""
+import datetime
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+import django
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, close_old_connections, connection, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY = 100
+VISIBILITY_TIMEOUT = 5 * 60
+# Seconds before the first retry, doubled on each further attempt
+RETRY_BACKOFF = 30
+PURGE_CHUNK_SIZE = 1000
+
+
+def _path(func):
+    if isinstance(func, str):
+        return func
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def enqueue(func, args=(), kwargs=None, priority=DEFAULT_PRIORITY, run_at=None, max_attempts=3, key=""):
+    """
+    Queue func(*args, **kwargs). `func` is a module level function or its
+    dotted path. Lower `priority` runs first, `run_at` delays the job.
+
+    With a `key` at most one copy is queued at a time: enqueueing again only
+    brings the queued copy's run_at forward. Returns the new Job, or None
+    when a copy was already queued.
+    """
+    job = Job(
+        name=_path(func),
+        args=list(args),
+        kwargs=kwargs or {},
+        priority=priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts,
+        key=key,
+    )
+    if not key:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        Job.objects.filter(key=key, status=Job.Status.QUEUED, run_at__gt=job.run_at).update(run_at=job.run_at)
+        return None
+    return job
+
+
+def run_soon(name):
+    """Run the recurring job `name` now instead of at its next interval, e.g. after queueing work for it."""
+    enqueue(name, key=name)
+
+
+def schedule_periodic():
+    """Queue every job in settings.PERIODIC_JOBS that isn't queued yet, to run now."""
+    for name in settings.PERIODIC_JOBS:
+        run_soon(name)
+
+
+def _schedule_next(job):
+    interval = settings.PERIODIC_JOBS.get(job.key)
+    if interval is not None and job.key == job.name:
+        enqueue(job.name, key=job.key, run_at=timezone.now() + datetime.timedelta(seconds=interval))
+
+
+def purge(done_days=None, failed_days=None, chunk_size=PURGE_CHUNK_SIZE):
+    """
+    Periodic job: delete done jobs older than `done_days` and failed ones
+    older than `failed_days` (default from settings), a chunk per
+    statement so the table isn't locked for long. Returns how many went.
+    """
+    now = timezone.now()
+    retention = {
+        Job.Status.DONE: settings.JOB_RETENTION_DAYS if done_days is None else done_days,
+        Job.Status.FAILED: settings.FAILED_JOB_RETENTION_DAYS if failed_days is None else failed_days,
+    }
+    deleted = 0
+    for status, days in retention.items():
+        old = Job.objects.filter(status=status, finished_at__lt=now - datetime.timedelta(days=days))
+        while ids := list(old.order_by("finished_at").values_list("id", flat=True)[:chunk_size]):
+            deleted += Job.objects.filter(pk__in=ids).delete()[0]
+    return deleted
+
+
+def _claimable(now):
+    return Job.objects.filter(
+        Q(status=Job.Status.QUEUED, run_at__lte=now)
+        # Its worker went away without finishing it
+        | Q(status=Job.Status.RUNNING, locked_until__lt=now)
+    )
+
+
+def claim(worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+    """Lock the next job for `worker_id` and return it, or None."""
+    now = timezone.now()
+    lock = {
+        "status": Job.Status.RUNNING,
+        "locked_by": worker_id,
+        "locked_until": now + datetime.timedelta(seconds=visibility_timeout),
+    }
+    order = ("priority", "run_at", "id")
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = _claimable(now).select_for_update(skip_locked=True).order_by(*order).first()
+            if job is None:
+                return None
+            job.attempts += 1
+            for k, v in lock.items():
+                setattr(job, k, v)
+            job.save(update_fields=["attempts", *lock])
+            return job
+    for job_id in _claimable(now).order_by(*order).values_list("id", flat=True)[:10]:
+        # Still claimable means no other worker got it first
+        if _claimable(now).filter(pk=job_id).update(attempts=F("attempts") + 1, **lock):
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def _release(job, **fields):
+    # Matches nothing if the lock expired and another worker has the job now
+    qs = Job.objects.filter(pk=job.pk, status=Job.Status.RUNNING, locked_by=job.locked_by)
+    for attempt in range(5):
+        try:
+            return qs.update(locked_by="", locked_until=None, **fields)
+        except OperationalError:
+            # SQLite "database is locked" from a busy neighbour, worth a few quick retries
+            if attempt == 4:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+class Heartbeat(threading.Thread):
+    """Keeps pushing a running job's locked_until forward until stopped."""
+
+    def __init__(self, job, visibility_timeout):
+        super().__init__(daemon=True)
+        self.job = job
+        self.visibility_timeout = visibility_timeout
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.visibility_timeout / 3):
+                Job.objects.filter(pk=self.job.pk, status=Job.Status.RUNNING, locked_by=self.job.locked_by).update(
+                    locked_until=timezone.now() + datetime.timedelta(seconds=self.visibility_timeout),
+                )
+        except Exception:
+            logger.exception("Heartbeat for job %s failed", self.job.pk)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run(job, visibility_timeout=VISIBILITY_TIMEOUT):
+    """Run a claimed job and record the outcome. Returns True when it succeeded."""
+    if job.attempts > job.max_attempts:
+        # Claimed again after its worker died on the last attempt
+        _release(job, status=Job.Status.FAILED, finished_at=timezone.now(),
+                 last_error=job.last_error or "Worker stopped during every attempt")
+        _schedule_next(job)
+        return False
+    heartbeat = Heartbeat(job, visibility_timeout)
+    heartbeat.start()
+    try:
+        func = import_string(job.name)
+        func(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception("Job %s (%s) failed, attempt %s of %s", job.pk, job.name, job.attempts, job.max_attempts)
+        error = traceback.format_exc()
+        heartbeat.stop()
+        if job.attempts < job.max_attempts:
+            delay = RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            try:
+                _release(job, status=Job.Status.QUEUED, last_error=error,
+                         run_at=timezone.now() + datetime.timedelta(seconds=delay))
+                return False
+            except IntegrityError:
+                # Another copy with the same key was queued meanwhile and will run instead
+                pass
+        _release(job, status=Job.Status.FAILED, last_error=error, finished_at=timezone.now())
+        _schedule_next(job)
+        return False
+    heartbeat.stop()
+    _release(job, status=Job.Status.DONE, last_error="", finished_at=timezone.now())
+    _schedule_next(job)
+    return True
+
+
+def work(worker_id, stop, done, poll_interval=1.0, visibility_timeout=VISIBILITY_TIMEOUT, burst=False):
+    """
+    Claim and run jobs until `stop` is set, or with `burst` until nothing is
+    due. Adds each finished job to the shared `done` counter.
+    """
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                job = claim(worker_id, visibility_timeout)
+            except OperationalError:
+                # Usually SQLite's "database is locked" with several workers
+                logger.warning("Worker %s could not claim a job, retrying", worker_id, exc_info=True)
+                stop.wait(poll_interval)
+                continue
+            if job is None:
+                if burst:
+                    return
+                stop.wait(poll_interval)
+                continue
+            try:
+                run(job, visibility_timeout)
+            except Exception:
+                # The job stays locked and runs again after the visibility timeout
+                logger.exception("Worker %s could not record the result of job %s", worker_id, job.pk)
+            with done.get_lock():
+                done.value += 1
+    finally:
+        connection.close()
+
+
+def _work_in_process(*args, **kwargs):
+    # The parent handles Ctrl-C and tells us to stop through the event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+    work(*args, **kwargs)
+
+
+def run_workers(concurrency=1, mode="thread", poll_interval=1.0, visibility_timeout=VISIBILITY_TIMEOUT, burst=False):
+    """
+    Run `concurrency` workers as threads or processes until SIGTERM/SIGINT,
+    or with `burst` until the queue has nothing due. A stopping worker
+    finishes its current job first. Returns how many jobs were run.
+    """
+    schedule_periodic()
+    context = multiprocessing.get_context()
+    stop = context.Event() if mode == "process" else threading.Event()
+    done = context.Value("i", 0)
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    options = {"poll_interval": poll_interval, "visibility_timeout": visibility_timeout, "burst": burst}
+    if mode == "process":
+        # Children must not share the parent's database connections
+        connections.close_all()
+        workers = [
+            context.Process(target=_work_in_process, args=(f"{prefix}:{n}", stop, done), kwargs=options)
+            for n in range(concurrency)
+        ]
+    else:
+        workers = [
+            threading.Thread(target=work, args=(f"{prefix}:{n}", stop, done), kwargs=options)
+            for n in range(concurrency)
+        ]
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            # A timeout keeps the main thread responsive to Ctrl-C
+            while worker.is_alive():
+                worker.join(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    return done.value
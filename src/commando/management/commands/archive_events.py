@@ -0,0 +1,40 @@
+import datetime
+from typing import Any
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from commando import archive
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", default=settings.ARCHIVE_AFTER_DAYS, type=int)
+        parser.add_argument("--chunk-size", default=5000, type=int)
+        parser.add_argument("--table", action="append", choices=list(archive.TABLES), help="Repeat for several, defaults to all")
+        parser.add_argument("--pause", default=0.0, type=float, help="Seconds to sleep between chunks")
+
+    def handle(self, *args: Any, **options: Any):
+        # python manage.py archive_events
+        # python manage.py archive_events --older-than-days 90 --table visits.PageVisit --pause 0.5
+        # Safe to interrupt and re-run, each chunk commits on its own
+        try:
+            archive.archive_dir()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        cutoff = timezone.now() - datetime.timedelta(days=options.get("older_than_days"))
+        for table in options.get("table") or archive.TABLES:
+            try:
+                archived = archive.archive_table(
+                    table,
+                    cutoff,
+                    chunk_size=options.get("chunk_size"),
+                    pause=options.get("pause"),
+                )
+            except archive.SegmentLocked as e:
+                self.stdout.write(self.style.WARNING(f"Skipped {table}: {e}"))
+                continue
+            self.stdout.write(
+                self.style.SUCCESS(f"Archived {archived} {table} rows older than {cutoff:%Y-%m-%d}")
+            )
@@ -0,0 +1,27 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+
+from commando import jobs
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", default=1, type=int)
+        parser.add_argument("--mode", default="thread", choices=["thread", "process"], help="Use processes for CPU heavy jobs")
+        parser.add_argument("--poll-interval", default=1.0, type=float, help="Seconds to wait when no job is due")
+        parser.add_argument("--visibility-timeout", default=jobs.VISIBILITY_TIMEOUT, type=int, help="Seconds before an unfinished job is handed to another worker")
+        parser.add_argument("--burst", action="store_true", default=False, help="Exit once no job is due")
+
+    def handle(self, *args: Any, **options: Any):
+        # python manage.py run_worker
+        # python manage.py run_worker --concurrency 4 --mode process
+        # python manage.py run_worker --burst
+        # Stops on SIGTERM or Ctrl-C after the running jobs finish
+        count = jobs.run_workers(
+            concurrency=options.get("concurrency"),
+            mode=options.get("mode"),
+            poll_interval=options.get("poll_interval"),
+            visibility_timeout=options.get("visibility_timeout"),
+            burst=options.get("burst"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Worker stopped, ran {count} jobs"))
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commando', '0003_job_key_job_unique_queued_job_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=100)),
+                ('day', models.DateField()),
+                ('key', models.TextField(blank=True)),
+                ('rows', models.PositiveBigIntegerField(default=0)),
+                ('amount', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'archive summaries',
+            },
+        ),
+        migrations.AddField(
+            model_name='archivesegment',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='archivesegment',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='archivesummary',
+            constraint=models.UniqueConstraint(fields=('table', 'day', 'key'), name='unique_archive_summary'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commando', '0004_archivesegment_lease_archivesummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'finished_at'], name='commando_jo_status_5d16a4_idx'),
+        ),
+    ]
@@ -1,3 +1,99 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+class ArchiveSegment(models.Model):
+    """
+    One compressed NDJSON file holding a month of archived rows from one table.
+    `size` is the byte length covered by committed chunks, so an interrupted
+    run truncates back to it and carries on without duplicating rows.
+    A run holds the `locked_by` lease while it appends, so two runs never
+    write to the same file.
+    """
+    table = models.CharField(max_length=100) # app_label.Model
+    month = models.DateField() # First day of the month
+    path = models.CharField(max_length=255)
+    rows = models.PositiveBigIntegerField(default=0)
+    size = models.PositiveBigIntegerField(default=0)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['table', 'month'], name='unique_archive_segment'),
+        ]
+
+    def __str__(self):
+        return f"{self.table} {self.month:%Y-%m} ({self.rows} rows)"
+
+
+class ArchiveSummary(models.Model):
+    """
+    What was archived from one table on one day, per `key` (a user id or a
+    path, see commando.archive.TABLES). Written in the same transaction that
+    deletes the rows, so the totals outlive them.
+    """
+    table = models.CharField(max_length=100) # app_label.Model
+    day = models.DateField()
+    key = models.TextField(blank=True)
+    rows = models.PositiveBigIntegerField(default=0)
+    amount = models.BigIntegerField(default=0) # Sum of the table's amount column, if it has one
+
+    class Meta:
+        verbose_name_plural = 'archive summaries'
+        constraints = [
+            models.UniqueConstraint(fields=['table', 'day', 'key'], name='unique_archive_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.table} {self.day} {self.key}: {self.rows} rows"
+
+
+class Job(models.Model):
+    """
+    A call to run in the background, see commando.jobs.enqueue() and
+    `manage.py run_worker`.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    name = models.CharField(max_length=255, help_text='Dotted path of the function to call')
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=100, help_text='Lower runs first')
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    # Kept in the future by the worker's heartbeat, a running job whose
+    # worker died becomes claimable again after this
+    locked_until = models.DateTimeField(blank=True, null=True)
+    # At most one queued job per key, see jobs.enqueue()
+    key = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Claim scan: queued jobs by priority, then age
+            models.Index(fields=['status', 'priority', 'run_at']),
+            models.Index(fields=['status', 'locked_until']),
+            # Retention scan, see jobs.purge()
+            models.Index(fields=['status', 'finished_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=models.Q(status='queued') & ~models.Q(key=''),
+                name='unique_queued_job_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -5,4 +5,170 @@ from django.conf import settings
 class NeonDBTestCase(TestCase):
     def test_db_url(self):
         DATABASE_URL = settings.DATABASE_URL
-        self.assertIn("neon.tech", DATABASE_URL)
\ No newline at end of file
+        self.assertIn("neon.tech", DATABASE_URL)
+
+import datetime
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import post_delete
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core.models import BehaviorLog, Chore, ChoreCompletion
+from . import archive, jobs
+from .models import ArchiveSegment, ArchiveSummary, Job
+
+CALLS = []
+
+
+def record(*args, **kwargs):
+    CALLS.append((args, kwargs))
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+def slow(seconds):
+    time.sleep(seconds)
+    # The heartbeat kept the lock, so nobody else can take this job
+    CALLS.append(jobs.claim('intruder') is None)
+
+
+# Worker threads use their own connections, so jobs must really be committed
+@override_settings(PERIODIC_JOBS={})
+class JobQueueTests(TransactionTestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_runs_by_priority_with_own_kwargs(self):
+        jobs.enqueue(record, args=[1], kwargs={'priority': 'low'}, priority=200)
+        jobs.enqueue('commando.tests.record', args=[2], kwargs={'priority': 'high'}, priority=1)
+        jobs.enqueue(record, args=[3], run_at=timezone.now() + datetime.timedelta(hours=1))
+        self.assertEqual(jobs.run_workers(burst=True), 2)
+        self.assertEqual(CALLS, [((2,), {'priority': 'high'}), ((1,), {'priority': 'low'})])
+
+    def test_retries_then_fails(self):
+        job = jobs.enqueue(fail, max_attempts=2)
+        jobs.run_workers(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.run_workers(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 2))
+        self.assertIn('boom', job.last_error)
+
+    def test_key_keeps_one_queued_copy(self):
+        later = timezone.now() + datetime.timedelta(minutes=5)
+        first = jobs.enqueue(record, key='once', run_at=later)
+        self.assertIsNone(jobs.enqueue(record, key='once'))
+        first.refresh_from_db()
+        self.assertLessEqual(first.run_at, timezone.now())
+        self.assertEqual(Job.objects.filter(key='once').count(), 1)
+
+    def test_each_job_claimed_once(self):
+        for n in range(20):
+            jobs.enqueue(record, args=[n])
+        self.assertEqual(jobs.run_workers(concurrency=4, burst=True), 20)
+        self.assertCountEqual([args[0] for args, _ in CALLS], range(20))
+
+    def test_expired_lock_is_reclaimed(self):
+        job = jobs.enqueue(record)
+        dead = jobs.claim('dead', visibility_timeout=60)
+        self.assertEqual(dead.pk, job.pk)
+        self.assertIsNone(jobs.claim('other'))
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        alive = jobs.claim('alive')
+        self.assertEqual((alive.pk, alive.attempts), (job.pk, 2))
+        # The first worker's late result doesn't overwrite the new claim
+        self.assertEqual(jobs._release(dead, status=Job.Status.DONE), 0)
+        self.assertTrue(jobs.run(alive))
+
+    def test_heartbeat_keeps_long_job_locked(self):
+        jobs.enqueue(slow, args=[0.6])
+        job = jobs.claim('worker', visibility_timeout=0.3)
+        self.assertTrue(jobs.run(job, visibility_timeout=0.3))
+        self.assertEqual(CALLS, [True])
+
+    @override_settings(JOB_RETENTION_DAYS=7, FAILED_JOB_RETENTION_DAYS=30)
+    def test_purge_keeps_recent_and_failed_jobs_longer(self):
+        def finished(status, days_ago):
+            return Job.objects.create(name='x', status=status, finished_at=timezone.now() - datetime.timedelta(days=days_ago))
+
+        kept = [
+            finished(Job.Status.DONE, 1),
+            finished(Job.Status.FAILED, 10),
+            jobs.enqueue(record, run_at=timezone.now() - datetime.timedelta(days=60)),
+        ]
+        for _ in range(3):
+            finished(Job.Status.DONE, 10)
+        finished(Job.Status.FAILED, 40)
+        self.assertEqual(jobs.purge(chunk_size=2), 4)
+        self.assertCountEqual(Job.objects.values_list('pk', flat=True), [job.pk for job in kept])
+
+    @override_settings(PERIODIC_JOBS={'commando.tests.record': 60})
+    def test_periodic_job_is_rescheduled(self):
+        jobs.run_workers(burst=True)
+        self.assertEqual(len(CALLS), 1)
+        next_run = Job.objects.get(key='commando.tests.record', status=Job.Status.QUEUED)
+        self.assertGreater(next_run.run_at, timezone.now() + datetime.timedelta(seconds=50))
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('kid')
+        self.old = timezone.now() - datetime.timedelta(days=400)
+        for points in (5, 3, -2):
+            BehaviorLog.objects.create(user=self.user, action_type='GOOD' if points > 0 else 'BAD', points_change=points)
+        BehaviorLog.objects.update(timestamp=self.old)
+        self.cutoff = timezone.now() - datetime.timedelta(days=180)
+
+    @override_settings(ARCHIVE_DIR=None)
+    def test_requires_archive_dir(self):
+        with self.assertRaises(ImproperlyConfigured):
+            archive.archive_table('core.BehaviorLog', self.cutoff)
+        self.assertEqual(BehaviorLog.objects.count(), 3)
+
+    def test_rows_leave_daily_summary_behind(self):
+        with override_settings(ARCHIVE_DIR=tempfile.mkdtemp()):
+            self.assertEqual(archive.archive_table('core.BehaviorLog', self.cutoff, chunk_size=2), 3)
+            segment = ArchiveSegment.objects.get()
+            self.assertEqual(len(list(archive.read_segment(segment))), 3)
+        self.assertFalse(BehaviorLog.objects.exists())
+        summary = ArchiveSummary.objects.get()
+        self.assertEqual((summary.key, summary.day), (str(self.user.pk), timezone.localdate(self.old)))
+        self.assertEqual((summary.rows, summary.amount), (3, 6))
+        self.assertEqual(segment.locked_by, '')
+
+    def test_locked_segment_is_left_alone(self):
+        month = timezone.localdate(self.old).replace(day=1)
+        ArchiveSegment.objects.create(
+            table='core.BehaviorLog', month=month, path=archive._segment_path('core.BehaviorLog', month),
+            locked_by='other-run', locked_until=timezone.now() + datetime.timedelta(minutes=5),
+        )
+        with override_settings(ARCHIVE_DIR=tempfile.mkdtemp()), mock.patch.object(archive, 'LOCK_WAIT_SECONDS', 0):
+            with self.assertRaises(archive.SegmentLocked):
+                archive.archive_table('core.BehaviorLog', self.cutoff)
+        self.assertEqual(BehaviorLog.objects.count(), 3)
+        self.assertFalse(ArchiveSummary.objects.exists())
+
+    def test_completions_are_deleted_without_per_row_signals(self):
+        other = get_user_model().objects.create_user('other-kid')
+        for user in (self.user, self.user, other):
+            ChoreCompletion.objects.create(user=user, chore=Chore.objects.create(title='Dishes', assigned_to=user))
+        ChoreCompletion.objects.update(completed_at=self.old)
+        receiver = mock.Mock()
+        post_delete.connect(receiver, sender=ChoreCompletion, weak=False)
+        self.addCleanup(post_delete.disconnect, receiver, sender=ChoreCompletion)
+        with override_settings(ARCHIVE_DIR=tempfile.mkdtemp()), \
+                mock.patch.object(archive.read_cache, 'invalidate') as invalidate:
+            self.assertEqual(archive.archive_table('core.ChoreCompletion', self.cutoff), 3)
+        self.assertFalse(ChoreCompletion.objects.exists())
+        receiver.assert_not_called()
+        self.assertCountEqual(invalidate.call_args_list, [mock.call('chores', self.user.pk), mock.call('chores', other.pk)])
@@ -0,0 +1,146 @@
+"""
+Streaks and badges. core.points calls in here inside the transaction that
+credits a chore or logs behavior, and each call touches one KidStreak row
+plus, at most, two indexed existence checks on ChoreOccurrence.
+
+A streak also breaks when a scheduled day goes by without anything being
+logged. expire_streaks() catches those as a periodic job, so reading a
+streak is always a plain column read.
+"""
+import datetime
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.utils import timezone
+
+from .models import ChoreOccurrence, KidDailyStats, KidStreak
+
+Badge = namedtuple('Badge', ['code', 'title', 'icon', 'rule'])
+
+BADGES = [
+    Badge('first_chore', 'First Chore', '🌱', lambda streak: streak.chores_completed >= 1),
+    Badge('chores_50', 'Helping Hand', '🤝', lambda streak: streak.chores_completed >= 50),
+    Badge('streak_3', 'On a Roll', '🔥', lambda streak: streak.longest_streak >= 3),
+    Badge('streak_7', 'Week Warrior', '🏅', lambda streak: streak.longest_streak >= 7),
+    Badge('streak_30', 'Unstoppable', '🏆', lambda streak: streak.longest_streak >= 30),
+    Badge('good_10', 'Star Behavior', '⭐', lambda streak: streak.good_behavior_count >= 10),
+]
+
+BADGES_BY_CODE = {badge.code: badge for badge in BADGES}
+
+
+def _locked_state(user_id):
+    streak, _ = KidStreak.objects.select_for_update().get_or_create(user_id=user_id)
+    return streak
+
+
+def _unlock(streak, day):
+    # Badges are never taken away, even if a count goes down later
+    for badge in BADGES:
+        if badge.code not in streak.badges and badge.rule(streak):
+            streak.badges[badge.code] = day.isoformat()
+
+
+def _advance(streak, day, perfect, continued):
+    if not perfect:
+        return
+    streak.current_streak = streak.current_streak + 1 if continued else 1
+    streak.longest_streak = max(streak.longest_streak, streak.current_streak)
+    streak.last_perfect_day = day
+
+
+def record_chores(user_id, count, day=None, scheduled=True):
+    """
+    Credit `count` completed chores to the kid. With `scheduled`, also check
+    whether `day` just became perfect (no open occurrences left) and extend
+    or restart the streak.
+    """
+    if not count:
+        return
+    if day is None:
+        day = timezone.localdate()
+    with transaction.atomic():
+        streak = _locked_state(user_id)
+        streak.chores_completed += count
+        last = streak.last_perfect_day
+        if scheduled and (last is None or last < day):
+            occurrences = ChoreOccurrence.objects.filter(user_id=user_id)
+            perfect = not occurrences.filter(day=day, completed_at__isnull=True).exists()
+            # Any occurrence between the last perfect day and today was left unfinished
+            continued = last is not None and not occurrences.filter(day__gt=last, day__lt=day).exists()
+            _advance(streak, day, perfect, continued)
+        _unlock(streak, day)
+        streak.save()
+
+
+def record_good_behavior(user_id, count=1, day=None):
+    if not count:
+        return
+    if day is None:
+        day = timezone.localdate()
+    with transaction.atomic():
+        streak = _locked_state(user_id)
+        streak.good_behavior_count += count
+        _unlock(streak, day)
+        streak.save()
+
+
+def expire_streaks(today=None):
+    """
+    Periodic job (settings.PERIODIC_JOBS): zero every streak with a scheduled
+    day left unfinished since its last perfect day, in one UPDATE. Days with
+    nothing scheduled don't break a streak. Returns how many were zeroed.
+    """
+    if today is None:
+        today = timezone.localdate()
+    missed = ChoreOccurrence.objects.filter(
+        user_id=OuterRef('user_id'),
+        day__gt=OuterRef('last_perfect_day'),
+        day__lt=today,
+    )
+    return (
+        KidStreak.objects
+        .filter(current_streak__gt=0, last_perfect_day__lt=today - datetime.timedelta(days=1))
+        .filter(Exists(missed))
+        .update(current_streak=0)
+    )
+
+
+def rebuild(user_ids, today=None):
+    """
+    Recompute KidStreak from scratch for `user_ids` by replaying their
+    occurrences day by day. Counters come from the KidDailyStats rollup.
+    """
+    if today is None:
+        today = timezone.localdate()
+    states = {user_id: KidStreak(user_id=user_id) for user_id in user_ids}
+    for row in (
+        KidDailyStats.objects.filter(user_id__in=user_ids)
+        .values('user_id')
+        .annotate(chores=Sum('completions'), good=Sum('good_count'))
+    ):
+        states[row['user_id']].chores_completed = row['chores'] or 0
+        states[row['user_id']].good_behavior_count = row['good'] or 0
+
+    days = (
+        ChoreOccurrence.objects.filter(user_id__in=user_ids, day__lte=today)
+        .values('user_id', 'day')
+        .annotate(open=Count('id', filter=Q(completed_at__isnull=True)))
+        .order_by('user_id', 'day')
+    )
+    previous_day = {}
+    for row in days.iterator():
+        streak = states[row['user_id']]
+        # Continued when the previous scheduled day was itself perfect
+        continued = streak.last_perfect_day is not None and streak.last_perfect_day == previous_day.get(row['user_id'])
+        _advance(streak, row['day'], row['open'] == 0, continued)
+        previous_day[row['user_id']] = row['day']
+
+    for streak in states.values():
+        _unlock(streak, today)
+    with transaction.atomic():
+        KidStreak.objects.filter(user_id__in=user_ids).delete()
+        KidStreak.objects.bulk_create(states.values())
+        expire_streaks(today)
+    return len(states)
@@ -1,7 +1,20 @@
 from django.contrib import admin
-from .models import Chore, Reward, Redemption, BehaviorLog
+from .models import Chore, Reward, Redemption, BehaviorLog, PointTransaction
 
 admin.site.register(Chore)
 admin.site.register(Reward)
 admin.site.register(Redemption)
 admin.site.register(BehaviorLog)
+
+
+class PointTransactionAdmin(admin.ModelAdmin):
+    list_display = ['user', 'amount', 'balance_after', 'reason', 'created_at']
+    list_filter = ['reason']
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+admin.site.register(PointTransaction, PointTransactionAdmin)
@@ -5,6 +5,7 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 from .api_views import ChoreViewSet, RewardViewSet, RedemptionViewSet, ProfileViewSet
+from .stream import event_stream, stream_ticket
 
 router = DefaultRouter()
 router.register(r'profiles', ProfileViewSet, basename='profile')
@@ -15,5 +16,7 @@ router.register(r'redemptions', RedemptionViewSet, basename='redemption')
 urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('events/', event_stream, name='event_stream'),
+    path('events/ticket/', stream_ticket, name='stream_ticket'),
     path('', include(router.urls)),
 ]
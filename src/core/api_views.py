@@ -5,22 +5,72 @@ from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from .models import Chore, Reward, Redemption, ChoreCompletion
 from profiles.models import Profile
-from .serializers import ChoreSerializer, RewardSerializer, RedemptionSerializer, ProfileSerializer
-
-class ProfileViewSet(viewsets.ModelViewSet):
+from helpers.db import ReplicaListMixin
+from .serializers import (
+    ChoreSerializer,
+    RewardSerializer,
+    RedemptionSerializer,
+    ProfileSerializer,
+    CompleteChoreBatchSerializer,
+    LogBehaviorBatchSerializer,
+    ProcessRedemptionBatchSerializer,
+    KidDailyStatsSerializer,
+    StatsRangeSerializer,
+    model_columns,
+)
+from .conditional import ConditionalListMixin, conditional, make_etag, version_stamp
+from .pagination import ClaimedAtCursorPagination, CreatedAtCursorPagination
+from . import points, stats
+
+def _related_paths(related, prefix=''):
+    # {'user': {'streak': {}}} -> user, user__streak
+    for name, children in related.items():
+        yield prefix + name
+        yield from _related_paths(children, f'{prefix}{name}__')
+
+class SparseFieldsetViewMixin:
+    """
+    With ?fields= on a list request, only load the columns the serializer,
+    trimmed by SparseFieldsetSerializerMixin, and the paginator's ordering
+    actually need.
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.request.query_params.get('fields'):
+            columns = model_columns(self.get_serializer())
+            ordering = getattr(self.paginator, 'ordering', ())
+            # Joins for relations that were trimmed away can't be deferred, drop them
+            related = queryset.query.select_related
+            if isinstance(related, dict):
+                queryset = queryset.select_related(None).select_related(*(path for path in _related_paths(related) if path in columns))
+            queryset = queryset.only(*columns, *(field.lstrip('-') for field in ordering))
+        return queryset
+
+class ProfileViewSet(ConditionalListMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     serializer_class = ProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
         if user.profile.role == Profile.Role.PARENT:
-            return Profile.objects.filter(parent=user.profile) | Profile.objects.filter(user=user)
-        return Profile.objects.filter(user=user)
+            return Profile.objects.for_user(user).select_related('user', 'user__streak')
+        return Profile.objects.filter(user=user).select_related('user', 'user__streak')
 
     @action(detail=False, methods=['get'])
     def me(self, request):
-        serializer = self.get_serializer(request.user.profile)
-        return Response(serializer.data)
+        # Only this profile's own version matters here, household writes don't show up
+        _, profile_version, _ = version_stamp(request.user)
+        etag = make_etag(request, profile_version)
+        return conditional(request, etag, lambda: Response(self.get_serializer(request.user.profile).data))
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        # ?start=2025-01-01&end=2025-12-31, defaults to the last year; reads one rollup row per active day
+        profile = self.get_object()
+        serializer = StatsRangeSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        rows = stats.kid_history(profile.user_id, **serializer.validated_data)
+        return Response(KidDailyStatsSerializer(rows, many=True).data)
 
     @action(detail=True, methods=['post'])
     def log_behavior(self, request, pk=None):
@@ -29,46 +79,41 @@ class ProfileViewSet(viewsets.ModelViewSet):
             
         kid_profile = self.get_object()
         action_type = request.data.get('action_type') # 'GOOD' or 'BAD'
-        
-        points_change = 0
-        if action_type == 'GOOD':
-            points_change = 100
-        elif action_type == 'BAD':
-            points_change = -10
-            
-        kid_profile.points += points_change
-        if kid_profile.points < 0: 
-            kid_profile.points = 0 # Prevent negative balances
-            
-        kid_profile.save()
-        return Response({'status': 'success', 'new_points': kid_profile.points})
 
-class ChoreViewSet(viewsets.ModelViewSet):
+        # Bad behavior stops at zero instead of going negative
+        entry = points.log_behavior(kid_profile.user, action_type)
+        if entry is None:
+            return Response({'error': 'Invalid action_type'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': 'success', 'new_points': entry.balance_after})
+
+    @action(detail=False, methods=['post'])
+    def log_behavior_batch(self, request):
+        # {"operations": [{"profile": 3, "action_type": "GOOD"}, ...]}
+        if request.user.profile.role != Profile.Role.PARENT:
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        serializer = LogBehaviorBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = [(op['profile'], op['action_type']) for op in serializer.validated_data['operations']]
+        kids = self.get_queryset().filter(id__in=[profile_id for profile_id, _ in operations]).select_related('user')
+        results = points.log_behaviors({kid.id: kid.user for kid in kids}, operations)
+        return Response({'results': results})
+
+class ChoreViewSet(ConditionalListMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     serializer_class = ChoreSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
         if user.profile.role == Profile.Role.PARENT:
-            return Chore.objects.all() # Parents see all or filter by kids
+            return Chore.objects.for_user(user)
         
         # Kid only sees their uncompleted daily chores or one-time chores
-        today = timezone.now().date()
-        completed_today_ids = ChoreCompletion.objects.filter(
-            user=user, 
-            completed_at__date=today
-        ).values_list('chore_id', flat=True)
-
-        all_assigned = Chore.objects.filter(assigned_to=user)
-        active_chores = []
-        for chore in all_assigned:
-            if chore.chore_type == Chore.Type.DAILY:
-                if chore.id not in completed_today_ids:
-                    active_chores.append(chore.id)
-            else:
-                active_chores.append(chore.id)
-                
-        return Chore.objects.filter(id__in=active_chores)
+        return Chore.objects.active_for(user)
+
+    def perform_create(self, serializer):
+        serializer.save(household_id=self.request.user.profile.household_id)
 
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
@@ -77,50 +122,59 @@ class ChoreViewSet(viewsets.ModelViewSet):
         if chore.assigned_to != user:
             return Response({'error': 'Not assigned to you'}, status=status.HTTP_403_FORBIDDEN)
             
-        today = timezone.now().date()
-        if chore.chore_type == Chore.Type.DAILY:
-            if ChoreCompletion.objects.filter(user=user, chore=chore, completed_at__date=today).exists():
-                return Response({'error': 'Already completed today'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Add points
-        profile = user.profile
-        profile.points += chore.points_value
-        profile.save()
-        
-        # Log completion
-        ChoreCompletion.objects.create(user=user, chore=chore)
-
-        if chore.chore_type == Chore.Type.ONE_TIME:
-            chore.delete()
-
-        return Response({'status': 'completed', 'new_points': profile.points})
-
-class RewardViewSet(viewsets.ModelViewSet):
+        entry = points.complete_chore(user, chore)
+        if entry is None:
+            return Response({'error': 'Already completed today'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'status': 'completed', 'new_points': entry.balance_after})
+
+    @action(detail=False, methods=['post'])
+    def complete_batch(self, request):
+        # {"operations": [{"chore": 12}, ...]}, e.g. a kiosk flushing queued taps
+        serializer = CompleteChoreBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        chore_ids = [op['chore'] for op in serializer.validated_data['operations']]
+        results = points.complete_chores(request.user, chore_ids)
+        new_points = Profile.objects.values_list('points', flat=True).get(user=request.user)
+        return Response({'results': results, 'new_points': new_points})
+
+class RewardViewSet(ReplicaListMixin, ConditionalListMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     serializer_class = RewardSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Reward.objects.all().order_by('-created_at')
+
+    def get_queryset(self):
+        return Reward.objects.for_user(self.request.user).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        serializer.save(household_id=self.request.user.profile.household_id)
 
     @action(detail=True, methods=['post'])
     def redeem(self, request, pk=None):
         reward = self.get_object()
-        profile = request.user.profile
-        
-        if profile.points >= reward.cost:
-            profile.points -= reward.cost
-            profile.save()
-            redemption = Redemption.objects.create(user=request.user, reward=reward, status=Redemption.Status.PENDING)
-            return Response({'status': 'success', 'new_points': profile.points, 'redemption_id': redemption.id})
-        return Response({'error': 'Not enough points'}, status=status.HTTP_400_BAD_REQUEST)
-
-class RedemptionViewSet(viewsets.ModelViewSet):
+        try:
+            redemption, entry = points.redeem_reward(request.user, reward)
+        except points.InsufficientPoints:
+            return Response({'error': 'Not enough points'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': 'success', 'new_points': entry.balance_after, 'redemption_id': redemption.id})
+
+class RedemptionViewSet(ReplicaListMixin, ConditionalListMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     serializer_class = RedemptionSerializer
+    pagination_class = ClaimedAtCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
         if user.profile.role == Profile.Role.PARENT:
-            return Redemption.objects.all().order_by('-claimed_at')
-        return Redemption.objects.filter(user=user).order_by('-claimed_at')
+            queryset = Redemption.objects.for_user(user)
+        else:
+            queryset = Redemption.objects.filter(user=user)
+        # ?status=PENDING lets the dashboard page through the open ones only. List only,
+        # so process and process_batch see every redemption of the household
+        status_filter = self.request.query_params.get('status')
+        if status_filter and self.action == 'list':
+            queryset = queryset.filter(status=status_filter)
+        return queryset.select_related('user', 'reward').order_by('-claimed_at', '-id')
 
     @action(detail=True, methods=['post'])
     def process(self, request, pk=None):
@@ -130,17 +184,22 @@ class RedemptionViewSet(viewsets.ModelViewSet):
         redemption = self.get_object()
         action_type = request.data.get('action') # 'approve' or 'reject'
         
-        if redemption.status != Redemption.Status.PENDING:
-            return Response({'error': 'Already processed'}, status=status.HTTP_400_BAD_REQUEST)
+        if action_type not in points.REDEMPTION_ACTIONS:
+            return Response({'error': 'Invalid action'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if action_type == 'approve':
-            redemption.status = Redemption.Status.APPROVED
-        elif action_type == 'reject':
-            redemption.status = Redemption.Status.REJECTED
-            kid_profile = redemption.user.profile
-            kid_profile.points += redemption.reward.cost
-            kid_profile.save()
-            
-        redemption.processed_at = timezone.now()
-        redemption.save()
+        # Rejecting refunds the points to the kid
+        if not points.process_redemption(redemption, action_type):
+            return Response({'error': 'Already processed'}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'status': 'processed', 'new_status': redemption.status})
+
+    @action(detail=False, methods=['post'])
+    def process_batch(self, request):
+        # {"operations": [{"redemption": 7, "action": "approve"}, ...]}
+        if request.user.profile.role != Profile.Role.PARENT:
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        serializer = ProcessRedemptionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = [(op['redemption'], op['action']) for op in serializer.validated_data['operations']]
+        results = points.process_redemptions(self.get_queryset(), operations)
+        return Response({'results': results})
@@ -0,0 +1,110 @@
+"""
+Read-through cache for data read on nearly every request but
+that rarely changes: a household's reward catalog, each kid's chore list
+and the subscription plan to group map.
+
+Entries are keyed by owner and a generation token kept in the shared
+Django cache. Invalidating just replaces the token, so every process stops
+using its old entries at once. Built values also sit in a small
+per-process LRU, which saves the fetch and unpickle of the payload: a warm
+read is one small get against the shared cache.
+
+All of that needs the Django cache to be shared by every process, so
+without settings.READ_CACHE (off unless CACHE_URL is set) values are built
+on every call instead.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from helpers.db import primary_reads
+
+# Payloads expire from the shared cache on their own after this long
+TIMEOUT = 60 * 60
+
+# Entries kept per process
+LOCAL_MAX_ENTRIES = 512
+
+
+class LocalLRU:
+    """A thread-safe, size-bounded dict that drops the least recently used key."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local = LocalLRU(LOCAL_MAX_ENTRIES)
+
+_MISSING = object()
+
+
+def _generation_key(kind, owner_id):
+    return f'core:{kind}:{owner_id}:generation'
+
+
+def generation(kind, owner_id):
+    """
+    Current token for (kind, owner). A token lost to eviction is replaced by a
+    new, never-seen value, so stale local entries can't come back to life.
+    """
+    key = _generation_key(kind, owner_id)
+    token = cache.get(key)
+    if token is None:
+        cache.add(key, time.time_ns(), None)
+        token = cache.get(key)
+    return token
+
+
+def cached(kind, owner_id, build, *parts):
+    """
+    Return the value for (kind, owner, *parts), calling `build()` on a miss.
+    Values are shared between requests, treat them as read-only.
+    """
+    if not settings.READ_CACHE:
+        return build()
+    key = ':'.join(str(part) for part in ('core', kind, owner_id, generation(kind, owner_id), *parts))
+    value = local.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        # A lagging replica could store old rows under the new generation
+        with primary_reads():
+            value = build()
+        cache.set(key, value, TIMEOUT)
+    local.set(key, value)
+    return value
+
+
+def invalidate(kind, owner_id):
+    """
+    Drop every cached value for (kind, owner). Deferred until the current
+    transaction commits so a concurrent rebuild can't cache the old rows.
+    """
+    if owner_id is None:
+        return
+    transaction.on_commit(lambda: cache.set(_generation_key(kind, owner_id), time.time_ns(), None))
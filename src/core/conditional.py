@@ -0,0 +1,66 @@
+"""
+Conditional GET for the dashboards and the v1 API.
+
+Every write a page depends on bumps a version counter on the household
+and/or profile (see profiles.models.bump_versions), so a repeat poll is
+answered from one indexed lookup and a 304, before any heavy query runs.
+"""
+import hashlib
+
+from django.contrib import messages
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from profiles.models import Profile
+
+
+def version_stamp(user):
+    """(role, profile version, household version) for `user`, in one query."""
+    return Profile.objects.filter(user_id=user.pk).values_list('role', 'version', 'household__version').get()
+
+
+def make_etag(request, *parts):
+    # Active chores roll over at midnight, so the local date is part of every tag
+    raw = ':'.join(str(part) for part in (request.user.pk, timezone.localdate(), request.get_full_path(), *parts))
+    return quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+def dashboard_etag(role):
+    """
+    etag_func for django.views.decorators.http.condition on a server-rendered
+    dashboard. Returns None (no conditional handling) for the wrong role or
+    when flash messages are waiting to be shown.
+    """
+    def etag_func(request, *args, **kwargs):
+        user_role, profile_version, household_version = version_stamp(request.user)
+        if user_role != role or len(messages.get_messages(request)):
+            return None
+        # Pages embed a CSRF token, a rotated secret must not be served from a stale copy
+        return make_etag(request, profile_version, household_version, request.META.get('CSRF_COOKIE', ''))
+    return etag_func
+
+
+def conditional(request, etag, render):
+    """
+    Return a 304 if the client already has `etag`, otherwise call `render()`
+    and tag its response. Used by the API viewsets.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = render()
+    response['ETag'] = etag
+    # Clients may keep a copy but must revalidate before reusing it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalListMixin:
+    """
+    ETag list responses on the household's version. Lists only change when
+    something in the household is written, whatever the filters or cursor.
+    """
+    def list(self, request, *args, **kwargs):
+        _, _, household_version = version_stamp(request.user)
+        etag = make_etag(request, household_version)
+        return conditional(request, etag, lambda: super(ConditionalListMixin, self).list(request, *args, **kwargs))
@@ -0,0 +1,178 @@
+"""
+Live household events for the dashboards (balance, chore and redemption changes).
+
+core.points and the model signals publish once their transaction commits.
+The SSE endpoint (core.stream.event_stream) subscribes to a household
+through the process-wide `broker`. The backend only carries events
+between processes. With no EVENTS_URL everything stays in this process.
+With EVENTS_URL=redis://... every node gets every household's events
+over Redis pub/sub, through one connection per process.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Events a slow client may fall behind by before new ones are dropped for it
+QUEUE_SIZE = 100
+
+CHANNEL_PREFIX = 'household-events:'
+
+
+class Subscription:
+    """One connection's view of a household's events. Use as an async context manager."""
+
+    def __init__(self, broker, household_id):
+        self.broker = broker
+        self.household_id = household_id
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.loop = None
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.broker._add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.broker._remove(self)
+
+    async def get(self, timeout):
+        """Next event as a dict, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+
+class Broker:
+    """Fans events out to the subscriptions held by this process."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, household_id):
+        get_backend().start()
+        return Subscription(self, household_id)
+
+    def deliver(self, household_id, event):
+        # Publishers run in sync threads, subscriptions live on event loops
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(household_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._offer, event)
+            except RuntimeError:
+                # Loop already closed, the connection is on its way out
+                pass
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscriptions.setdefault(subscription.household_id, set()).add(subscription)
+
+    def _remove(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.household_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.household_id, None)
+
+
+class LocalBackend:
+    """Single-process deployments: publishing is delivering."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def start(self):
+        pass
+
+    def publish(self, household_id, event):
+        self.broker.deliver(household_id, event)
+
+
+class RedisBackend:
+    """
+    Multi-node deployments. Publishes to a per-household channel and runs one
+    listener thread per process that hands everything it hears to the broker.
+    """
+
+    def __init__(self, broker, url):
+        import redis
+
+        self.broker = broker
+        self.client = redis.Redis.from_url(url)
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._listen, name='household-events', daemon=True).start()
+
+    def publish(self, household_id, event):
+        self.client.publish(f'{CHANNEL_PREFIX}{household_id}', json.dumps(event))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                for message in pubsub.listen():
+                    household_id = int(message['channel'].decode().removeprefix(CHANNEL_PREFIX))
+                    self.broker.deliver(household_id, json.loads(message['data']))
+            except Exception:
+                logger.exception("Household event listener lost its connection, retrying")
+                time.sleep(1)
+
+
+broker = Broker()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            url = settings.EVENTS_URL
+            if not url and not settings.DEBUG:
+                logger.warning(
+                    "EVENTS_URL is not set: events published by other web workers or the job worker "
+                    "never reach this process's streams. Set EVENTS_URL (or CACHE_URL) to a Redis URL."
+                )
+            _backend = RedisBackend(broker, url) if url else LocalBackend(broker)
+        return _backend
+
+
+def publish(household_id, event, **data):
+    """
+    Push `event` to the household's live connections once the current
+    transaction commits. Delivery is best effort and never fails the caller.
+    """
+    if household_id is None:
+        return
+    payload = {'event': event, 'data': data}
+
+    def send():
+        try:
+            get_backend().publish(household_id, payload)
+        except Exception:
+            logger.exception("Could not publish %s event for household %s", event, household_id)
+
+    transaction.on_commit(send)
@@ -0,0 +1,28 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+
+from core import achievements
+from profiles.models import Profile
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", default=500, type=int)
+
+    def handle(self, *args: Any, **options: Any):
+        # python manage.py backfill_streaks --batch-size 500
+        # Replays every kid's chore history into KidStreak, a chunk of kids at a time
+        batch_size = options.get("batch_size")
+        user_ids = Profile.objects.filter(role=Profile.Role.KID).order_by('user_id').values_list('user_id', flat=True)
+        rebuilt = 0
+        chunk = []
+        for user_id in user_ids.iterator(chunk_size=batch_size):
+            chunk.append(user_id)
+            if len(chunk) >= batch_size:
+                rebuilt += achievements.rebuild(chunk)
+                chunk = []
+        if chunk:
+            rebuilt += achievements.rebuild(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt streaks for {rebuilt} kids")
+        )
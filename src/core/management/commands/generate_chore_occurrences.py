@@ -0,0 +1,21 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+
+from core.models import ChoreOccurrence, OCCURRENCE_WINDOW_DAYS
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", default=OCCURRENCE_WINDOW_DAYS, type=int)
+        parser.add_argument("--batch-size", default=1000, type=int)
+
+    def handle(self, *args: Any, **options: Any):
+        # python manage.py generate_chore_occurrences --days 14
+        # The worker already does this daily (core.models.generate_occurrences),
+        # run it by hand for a longer window or right after a bulk import
+        days = options.get("days")
+        batch_size = options.get("batch_size")
+        sent = ChoreOccurrence.objects.generate(days=days, batch_size=batch_size)
+        self.stdout.write(
+            self.style.SUCCESS(f"Generated occurrences for the next {days} days ({sent} rows checked)")
+        )
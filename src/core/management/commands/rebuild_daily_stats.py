@@ -0,0 +1,28 @@
+import datetime
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import stats
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=datetime.date.fromisoformat, help="First day (YYYY-MM-DD), defaults to the oldest activity")
+        parser.add_argument("--end", type=datetime.date.fromisoformat, help="Last day (YYYY-MM-DD), defaults to today")
+        parser.add_argument("--batch-size", default=1000, type=int)
+
+    def handle(self, *args: Any, **options: Any):
+        # python manage.py rebuild_daily_stats --start 2025-01-01 --end 2025-12-31
+        # Recomputes KidDailyStats from the ledger (and the event tables before it), e.g. after a manual fix
+        end = options.get("end") or timezone.localdate()
+        start = options.get("start")
+        if start is None:
+            first = stats.first_activity()
+            start = timezone.localdate(first) if first else end
+        if start > end:
+            raise CommandError("--start must not be after --end")
+        written = stats.rebuild(start, end, batch_size=options.get("batch_size"))
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt daily stats for {start} to {end} ({written} rows)")
+        )
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    # Start the ledger from the balances that already exist
+    Profile = apps.get_model('profiles', 'Profile')
+    PointTransaction = apps.get_model('core', 'PointTransaction')
+    PointTransaction.objects.bulk_create([
+        PointTransaction(
+            user_id=profile.user_id,
+            amount=profile.points,
+            balance_after=profile.points,
+            reason='ADJUSTMENT',
+            note='Opening balance',
+        )
+        for profile in Profile.objects.filter(points__gt=0)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_remove_chore_is_repeatable_chore_chore_type_and_more'),
+        ('profiles', '0002_profile_profile_points_non_negative'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('balance_after', models.IntegerField()),
+                ('reason', models.CharField(choices=[('CHORE', 'Chore Completed'), ('BEHAVIOR', 'Behavior'), ('REDEMPTION', 'Reward Redeemed'), ('REFUND', 'Redemption Refunded'), ('ADJUSTMENT', 'Adjustment')], max_length=20)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='point_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='core_pointt_user_id_c9b391_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
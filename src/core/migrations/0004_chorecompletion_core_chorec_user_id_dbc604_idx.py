@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_pointtransaction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chorecompletion',
+            index=models.Index(fields=['user', 'chore', 'completed_at'], name='core_chorec_user_id_dbc604_idx'),
+        ),
+    ]
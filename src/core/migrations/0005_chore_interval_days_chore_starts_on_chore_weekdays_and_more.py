@@ -0,0 +1,81 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_daily_occurrences(apps, schema_editor):
+    # Existing recurring chores are all DAILY. Seed the first window so the kid
+    # view keeps working before generate_chore_occurrences has run, and carry
+    # over today's completions so nothing can be claimed twice.
+    import datetime
+    Chore = apps.get_model('core', 'Chore')
+    ChoreCompletion = apps.get_model('core', 'ChoreCompletion')
+    ChoreOccurrence = apps.get_model('core', 'ChoreOccurrence')
+    today = django.utils.timezone.localdate()
+    start = django.utils.timezone.make_aware(datetime.datetime.combine(today, datetime.time.min))
+    done_today = dict(
+        ChoreCompletion.objects.filter(completed_at__gte=start).values_list('chore_id', 'completed_at')
+    )
+    occurrences = []
+    for chore in Chore.objects.filter(chore_type='DAILY'):
+        for offset in range(14):
+            day = today + datetime.timedelta(days=offset)
+            occurrences.append(ChoreOccurrence(
+                chore_id=chore.pk,
+                user_id=chore.assigned_to_id,
+                day=day,
+                completed_at=done_today.get(chore.pk) if offset == 0 else None,
+            ))
+    ChoreOccurrence.objects.bulk_create(occurrences, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_chorecompletion_core_chorec_user_id_dbc604_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chore',
+            name='interval_days',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Repeat every N days for INTERVAL chores'),
+        ),
+        migrations.AddField(
+            model_name='chore',
+            name='starts_on',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.AddField(
+            model_name='chore',
+            name='weekdays',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Bitmask of weekdays for WEEKDAYS chores, Monday = 1'),
+        ),
+        migrations.AlterField(
+            model_name='chore',
+            name='chore_type',
+            field=models.CharField(choices=[('ONE_TIME', 'One Time'), ('DAILY', 'Daily'), ('WEEKLY', 'Weekly'), ('WEEKDAYS', 'Selected Weekdays'), ('INTERVAL', 'Every N Days')], default='ONE_TIME', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ChoreOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('chore', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='core.chore')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chore_occurrences', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day'], name='core_choreo_user_id_efb7df_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='choreoccurrence',
+            constraint=models.UniqueConstraint(fields=('chore', 'day'), name='unique_chore_occurrence_per_day'),
+        ),
+        migrations.RunPython(seed_daily_occurrences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_chore_interval_days_chore_starts_on_chore_weekdays_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='redemption',
+            index=models.Index(fields=['user', 'status'], name='core_redemp_user_id_f44192_idx'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_households(apps, schema_editor):
+    Profile = apps.get_model('profiles', 'Profile')
+    Chore = apps.get_model('core', 'Chore')
+    Reward = apps.get_model('core', 'Reward')
+    Redemption = apps.get_model('core', 'Redemption')
+    household_of = dict(Profile.objects.values_list('user_id', 'household_id'))
+
+    chores = list(Chore.objects.all())
+    for chore in chores:
+        chore.household_id = household_of.get(chore.assigned_to_id)
+    Chore.objects.bulk_update(chores, ['household'], batch_size=1000)
+
+    redemptions = list(Redemption.objects.all())
+    for redemption in redemptions:
+        redemption.household_id = household_of.get(redemption.user_id)
+    Redemption.objects.bulk_update(redemptions, ['household'], batch_size=1000)
+
+    # Rewards used to be global. The first household with kids keeps the
+    # originals (existing redemptions point at them), every other household
+    # with kids gets its own copy of the catalog.
+    kid_households = list(
+        Profile.objects.filter(role='KID', household__isnull=False)
+        .order_by('household_id').values_list('household_id', flat=True).distinct()
+    )
+    if not kid_households:
+        kid_households = list(
+            Profile.objects.filter(household__isnull=False)
+            .order_by('household_id').values_list('household_id', flat=True).distinct()[:1]
+        )
+    if not kid_households:
+        return
+    rewards = list(Reward.objects.all())
+    Reward.objects.update(household_id=kid_households[0])
+    Reward.objects.bulk_create([
+        Reward(
+            household_id=household_id,
+            title=reward.title,
+            description=reward.description,
+            cost=reward.cost,
+            icon=reward.icon,
+        )
+        for household_id in kid_households[1:]
+        for reward in rewards
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_redemption_core_redemp_user_id_f44192_idx'),
+        ('profiles', '0003_household_profile_household_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chore',
+            name='household',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chores', to='profiles.household'),
+        ),
+        migrations.AddField(
+            model_name='redemption',
+            name='household',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='profiles.household'),
+        ),
+        migrations.AddField(
+            model_name='reward',
+            name='household',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rewards', to='profiles.household'),
+        ),
+        migrations.AddIndex(
+            model_name='chore',
+            index=models.Index(fields=['household', 'assigned_to'], name='core_chore_househo_76ca83_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chore',
+            index=models.Index(fields=['household', 'created_at'], name='core_chore_househo_9f1b5a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='redemption',
+            index=models.Index(fields=['household', 'status', 'claimed_at'], name='core_redemp_househo_6215d9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reward',
+            index=models.Index(fields=['household', 'created_at'], name='core_reward_househo_511439_idx'),
+        ),
+        migrations.RunPython(assign_households, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    # Roll the existing ledger up into one row per kid per day (same rules as core.stats)
+    PointTransaction = apps.get_model('core', 'PointTransaction')
+    KidDailyStats = apps.get_model('core', 'KidDailyStats')
+    earned = Q(reason='CHORE') | Q(reason='BEHAVIOR', amount__gt=0)
+    rows = (
+        PointTransaction.objects.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('user_id', 'day')
+        .annotate(
+            points_earned=Coalesce(Sum('amount', filter=earned), 0),
+            points_spent=-Coalesce(Sum('amount', filter=Q(reason__in=['REDEMPTION', 'REFUND'])), 0),
+            completions=Count('id', filter=Q(reason='CHORE')),
+            good_count=Count('id', filter=Q(reason='BEHAVIOR', amount__gt=0)),
+            bad_count=Count('id', filter=Q(reason='BEHAVIOR', amount__lte=0)),
+        )
+    )
+    KidDailyStats.objects.bulk_create((KidDailyStats(**row) for row in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_chore_household_redemption_household_and_more'),
+        ('profiles', '0004_household_version_profile_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KidDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('points_earned', models.PositiveIntegerField(default=0)),
+                ('points_spent', models.IntegerField(default=0)),
+                ('completions', models.PositiveIntegerField(default=0)),
+                ('good_count', models.PositiveIntegerField(default=0)),
+                ('bad_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='behaviorlog',
+            index=models.Index(fields=['user', 'timestamp'], name='core_behavi_user_id_51ac3c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chorecompletion',
+            index=models.Index(fields=['user', 'completed_at'], name='core_chorec_user_id_b5a03d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pointtransaction',
+            index=models.Index(fields=['created_at'], name='core_pointt_created_31a157_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='redemption',
+            index=models.Index(fields=['user', 'claimed_at'], name='core_redemp_user_id_6dddbb_idx'),
+        ),
+        migrations.AddField(
+            model_name='kiddailystats',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='kiddailystats',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='unique_kid_daily_stats'),
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
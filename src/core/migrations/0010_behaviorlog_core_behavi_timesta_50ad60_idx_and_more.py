@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_kidstreak'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='behaviorlog',
+            index=models.Index(fields=['timestamp'], name='core_behavi_timesta_50ad60_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chorecompletion',
+            index=models.Index(fields=['completed_at'], name='core_chorec_complet_bd7747_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import migrations
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+
+def backfill_pre_ledger_stats(apps, schema_editor):
+    # 0008 rolled up the ledger only. Activity on days before the ledger began is
+    # only in the event tables, add it with the same rules as core.stats.event_totals
+    PointTransaction = apps.get_model('core', 'PointTransaction')
+    ChoreCompletion = apps.get_model('core', 'ChoreCompletion')
+    BehaviorLog = apps.get_model('core', 'BehaviorLog')
+    Redemption = apps.get_model('core', 'Redemption')
+    KidDailyStats = apps.get_model('core', 'KidDailyStats')
+    first = PointTransaction.objects.aggregate(first=Min('created_at'))['first']
+    start = None if first is None else timezone.make_aware(
+        datetime.datetime.combine(timezone.localdate(first), datetime.time.min)
+    )
+
+    def before_ledger(qs, field):
+        return qs if start is None else qs.filter(**{f'{field}__lt': start})
+
+    queries = [
+        before_ledger(ChoreCompletion.objects, 'completed_at')
+        .annotate(day=TruncDate('completed_at')).values('user_id', 'day')
+        .annotate(points_earned=Coalesce(Sum('chore__points_value'), 0), completions=Count('id')),
+        before_ledger(BehaviorLog.objects, 'timestamp')
+        .annotate(day=TruncDate('timestamp')).values('user_id', 'day')
+        .annotate(
+            points_earned=Coalesce(Sum('points_change', filter=Q(action_type='GOOD')), 0),
+            good_count=Count('id', filter=Q(action_type='GOOD')),
+            bad_count=Count('id', filter=Q(action_type='BAD')),
+        ),
+        before_ledger(Redemption.objects, 'claimed_at')
+        .exclude(status='REJECTED')
+        .annotate(day=TruncDate('claimed_at')).values('user_id', 'day')
+        .annotate(points_spent=Coalesce(Sum('reward__cost'), 0)),
+    ]
+    totals = defaultdict(Counter)
+    for rows in queries:
+        for row in rows.order_by():
+            totals[row.pop('user_id'), row.pop('day')].update(row)
+    # Days before any ledger row, so there is nothing to merge with
+    KidDailyStats.objects.bulk_create(
+        (KidDailyStats(user_id=user_id, day=day, **deltas) for (user_id, day), deltas in totals.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_behaviorlog_core_behavi_timesta_50ad60_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_pre_ledger_stats, migrations.RunPython.noop),
+    ]
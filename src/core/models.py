@@ -1,32 +1,204 @@
+import datetime
+
 from django.conf import settings
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from profiles.models import Household, HouseholdQuerySet, Profile, bump_versions
+from . import cache, events
+
+
+# Occurrences are materialized this many days ahead, daily by the generate_occurrences job
+OCCURRENCE_WINDOW_DAYS = 14
+
+
+class ChoreQuerySet(HouseholdQuerySet):
+    def active_for(self, user, day=None):
+        """
+        Chores the user still has to do on `day` (default today), in one query.
+        Recurring chores show while their occurrence for the day is open,
+        one-time chores are deleted on completion so they always show.
+        """
+        if day is None:
+            day = timezone.localdate()
+        open_chore_ids = ChoreOccurrence.objects.filter(
+            user=user,
+            day=day,
+            completed_at__isnull=True,
+        ).values('chore_id')
+        return self.filter(assigned_to=user).filter(
+            Q(chore_type=Chore.Type.ONE_TIME) | Q(pk__in=open_chore_ids)
+        )
+
+    def active_list_for(self, user):
+        """
+        active_for(user) as a list, served from core.cache until the kid's
+        chores or completions change. Call it on the manager.
+        """
+        day = timezone.localdate()
+        return cache.cached('chores', user.pk, lambda: list(self.active_for(user, day)), day)
+
+    def recurring(self):
+        return self.exclude(chore_type=Chore.Type.ONE_TIME)
+
 
 class Chore(models.Model):
     class Type(models.TextChoices):
         ONE_TIME = 'ONE_TIME', 'One Time'
         DAILY = 'DAILY', 'Daily'
+        WEEKLY = 'WEEKLY', 'Weekly'
+        WEEKDAYS = 'WEEKDAYS', 'Selected Weekdays'
+        INTERVAL = 'INTERVAL', 'Every N Days'
 
+    household = models.ForeignKey(Household, on_delete=models.CASCADE, null=True, blank=True, related_name='chores')
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     points_value = models.IntegerField(default=10)
     assigned_to = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='assigned_chores')
     chore_type = models.CharField(max_length=20, choices=Type.choices, default=Type.ONE_TIME)
     icon = models.CharField(max_length=50, default="🧹", help_text="Emoji or Icon name")
+    weekdays = models.PositiveSmallIntegerField(default=0, help_text="Bitmask of weekdays for WEEKDAYS chores, Monday = 1")
+    interval_days = models.PositiveSmallIntegerField(default=1, help_text="Repeat every N days for INTERVAL chores")
+    starts_on = models.DateField(default=timezone.localdate)
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ChoreQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['household', 'assigned_to']),
+            models.Index(fields=['household', 'created_at']),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.points_value} pts)"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # A reassigned chore has to leave the previous kid's cached list too
+        instance._loaded_assigned_to_id = instance.__dict__.get('assigned_to_id')
+        return instance
+
+    def clean(self):
+        if self.chore_type == Chore.Type.WEEKDAYS and not self.weekdays:
+            # It would never be due
+            raise ValidationError({'weekdays': "Pick at least one weekday"})
+
+    def save(self, *args, **kwargs):
+        if self.household_id is None and self.assigned_to_id is not None:
+            self.household_id = Profile.objects.filter(
+                user_id=self.assigned_to_id
+            ).values_list('household_id', flat=True).first()
+        super().save(*args, **kwargs)
+
+    def is_due(self, day):
+        if self.chore_type == Chore.Type.ONE_TIME or day < self.starts_on:
+            return False
+        if self.chore_type == Chore.Type.WEEKLY:
+            return day.weekday() == self.starts_on.weekday()
+        if self.chore_type == Chore.Type.WEEKDAYS:
+            return bool(self.weekdays & (1 << day.weekday()))
+        if self.chore_type == Chore.Type.INTERVAL:
+            return (day - self.starts_on).days % max(self.interval_days, 1) == 0
+        return True
+
+    def due_days(self, start, days):
+        for offset in range(days):
+            day = start + datetime.timedelta(days=offset)
+            if self.is_due(day):
+                yield day
+
 class ChoreCompletion(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chore_completions')
     chore = models.ForeignKey(Chore, on_delete=models.CASCADE)
     completed_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Per-kid completion history, newest first
+            models.Index(fields=['user', 'chore', 'completed_at']),
+            models.Index(fields=['user', 'completed_at']),
+            # Range scans for archive_events
+            models.Index(fields=['completed_at']),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.chore.title} - {self.completed_at}"
 
+class ChoreOccurrenceQuerySet(models.QuerySet):
+    def generate(self, chores=None, start=None, days=OCCURRENCE_WINDOW_DAYS, batch_size=1000):
+        """
+        Materialize occurrences for recurring chores over [start, start + days).
+        Existing rows are left alone, so this is safe to re-run. Returns the
+        number of rows sent to the database.
+        """
+        if chores is None:
+            chores = Chore.objects.recurring()
+        if start is None:
+            start = timezone.localdate()
+        pending = []
+        sent = 0
+        for chore in chores.iterator(chunk_size=batch_size):
+            pending.extend(
+                ChoreOccurrence(chore_id=chore.pk, user_id=chore.assigned_to_id, day=day)
+                for day in chore.due_days(start, days)
+            )
+            if len(pending) >= batch_size:
+                self.bulk_create(pending, batch_size=batch_size, ignore_conflicts=True)
+                sent += len(pending)
+                pending = []
+        if pending:
+            self.bulk_create(pending, batch_size=batch_size, ignore_conflicts=True)
+            sent += len(pending)
+        return sent
+
+
+class ChoreOccurrence(models.Model):
+    """
+    One scheduled instance of a recurring chore on a given day.
+    Completing the chore flips completed_at on exactly one of these rows.
+    """
+    chore = models.ForeignKey(Chore, on_delete=models.CASCADE, related_name='occurrences')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chore_occurrences')
+    day = models.DateField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ChoreOccurrenceQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chore', 'day'], name='unique_chore_occurrence_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.chore.title} on {self.day}"
+
+
+def generate_occurrences():
+    """
+    Daily job (settings.PERIODIC_JOBS) that moves the window of materialized
+    occurrences forward, so recurring chores keep showing up.
+    """
+    return ChoreOccurrence.objects.generate()
+
+class RewardQuerySet(HouseholdQuerySet):
+    def catalog(self, household_id):
+        """
+        The household's rewards, newest first, served from core.cache until
+        one of them changes. Call it on the manager.
+        """
+        return cache.cached('rewards', household_id, lambda: list(self.for_household(household_id).order_by('-created_at')))
+
 class Reward(models.Model):
+    household = models.ForeignKey(Household, on_delete=models.CASCADE, null=True, blank=True, related_name='rewards')
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     cost = models.IntegerField(default=50)
@@ -34,6 +206,13 @@ class Reward(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RewardQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['household', 'created_at']),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.cost} pts)"
 
@@ -43,12 +222,23 @@ class Redemption(models.Model):
         APPROVED = 'APPROVED', 'Approved'
         REJECTED = 'REJECTED', 'Rejected'
 
+    household = models.ForeignKey(Household, on_delete=models.CASCADE, null=True, blank=True, related_name='redemptions')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='redemptions')
     reward = models.ForeignKey(Reward, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     claimed_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
 
+    objects = HouseholdQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['household', 'status', 'claimed_at']),
+            # Pending-count subquery on the parent dashboard
+            models.Index(fields=['user', 'status']),
+            models.Index(fields=['user', 'claimed_at']),
+        ]
+
     def __str__(self):
         return f"{self.user.username} redeemed {self.reward.title} - {self.status}"
 
@@ -63,5 +253,154 @@ class BehaviorLog(models.Model):
     note = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp']),
+            # Range scans for archive_events
+            models.Index(fields=['timestamp']),
+        ]
+
     def __str__(self):
         return f"{self.user.username}: {self.action_type} ({self.points_change})"
+
+
+class PointTransaction(models.Model):
+    """
+    Append-only ledger of every change to Profile.points.
+    Written by core.points in the same transaction as the balance update.
+    """
+    class Reason(models.TextChoices):
+        CHORE = 'CHORE', 'Chore Completed'
+        BEHAVIOR = 'BEHAVIOR', 'Behavior'
+        REDEMPTION = 'REDEMPTION', 'Reward Redeemed'
+        REFUND = 'REFUND', 'Redemption Refunded'
+        ADJUSTMENT = 'ADJUSTMENT', 'Adjustment'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='point_transactions')
+    amount = models.IntegerField() # Positive for credits, negative for debits
+    balance_after = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=Reason.choices)
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            # Date-range scans across all kids (rebuild_daily_stats)
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.amount:+} ({self.reason}) -> {self.balance_after}"
+
+
+class KidDailyStatsQuerySet(models.QuerySet):
+    def add(self, user_id, day, **deltas):
+        """
+        Add `deltas` to the (user, day) row, creating it on first use.
+        The increment is a single UPDATE, so concurrent writers add up.
+        """
+        changes = {field: F(field) + value for field, value in deltas.items() if value}
+        if not changes:
+            return
+        rows = self.filter(user_id=user_id, day=day)
+        if rows.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                self.create(user_id=user_id, day=day, **deltas)
+        except IntegrityError:
+            # Someone else created the row in between
+            rows.update(**changes)
+
+
+class KidDailyStats(models.Model):
+    """
+    Per-kid, per-day totals, kept in step with the ledger by core.stats.record()
+    in the same transaction as each entry. History and chart views read these
+    instead of the raw events. `manage.py rebuild_daily_stats` recomputes them.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    points_earned = models.PositiveIntegerField(default=0) # Chores and good behavior
+    points_spent = models.IntegerField(default=0) # Redemptions, net of refunds made that day
+    completions = models.PositiveIntegerField(default=0)
+    good_count = models.PositiveIntegerField(default=0)
+    bad_count = models.PositiveIntegerField(default=0)
+
+    objects = KidDailyStatsQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Also the index for per-kid date ranges
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_kid_daily_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} on {self.day}"
+
+
+class KidStreak(models.Model):
+    """
+    Running streak and badge state for one kid. core.achievements updates it
+    in O(1) as chores and behavior are logged, and its expire_streaks job
+    zeroes streaks broken by a missed day, so dashboards can show it without
+    looking at history. `manage.py backfill_streaks` replays history.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='streak')
+    current_streak = models.PositiveIntegerField(default=0)
+    longest_streak = models.PositiveIntegerField(default=0)
+    # Last day on which every scheduled chore was done
+    last_perfect_day = models.DateField(null=True, blank=True)
+    chores_completed = models.PositiveIntegerField(default=0)
+    good_behavior_count = models.PositiveIntegerField(default=0)
+    badges = models.JSONField(default=dict, blank=True) # Badge code -> ISO date unlocked
+
+    def __str__(self):
+        return f"{self.user.username}: {self.current_streak} day streak"
+
+
+def chore_post_save(sender, instance, *args, **kwargs):
+    """
+    Keep the open occurrences of a chore in line with its schedule and assignee.
+    Completed occurrences are history and are never touched.
+    """
+    today = timezone.localdate()
+    ChoreOccurrence.objects.filter(
+        chore=instance,
+        day__gte=today,
+        completed_at__isnull=True,
+    ).delete()
+    if instance.chore_type != Chore.Type.ONE_TIME:
+        ChoreOccurrence.objects.generate(chores=Chore.objects.filter(pk=instance.pk), start=today)
+
+post_save.connect(chore_post_save, sender=Chore)
+
+
+def household_content_changed(sender, instance, *args, **kwargs):
+    """
+    Chores, rewards and redemptions all show up on the dashboards, so any
+    direct save or delete invalidates the household's conditional GETs.
+    """
+    bump_versions([instance.household_id])
+
+for model in (Chore, Reward, Redemption):
+    post_save.connect(household_content_changed, sender=model)
+    post_delete.connect(household_content_changed, sender=model)
+
+
+def reward_changed(sender, instance, *args, **kwargs):
+    cache.invalidate('rewards', instance.household_id)
+
+def chore_changed(sender, instance, *args, **kwargs):
+    status = 'deleted' if kwargs.get('signal') is post_delete else 'saved'
+    for user_id in {instance.assigned_to_id, getattr(instance, '_loaded_assigned_to_id', None)} - {None}:
+        cache.invalidate('chores', user_id)
+        events.publish(instance.household_id, 'chore', user_id=user_id, chore_id=instance.pk, status=status)
+
+def chore_completion_changed(sender, instance, *args, **kwargs):
+    cache.invalidate('chores', instance.user_id)
+
+for model, receiver in ((Reward, reward_changed), (Chore, chore_changed), (ChoreCompletion, chore_completion_changed)):
+    post_save.connect(receiver, sender=model)
+    post_delete.connect(receiver, sender=model)
@@ -0,0 +1,319 @@
+from collections import Counter, namedtuple
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from profiles.models import Profile, bump_versions
+from . import achievements, cache, events, stats
+from .models import Chore, ChoreCompletion, ChoreOccurrence, Redemption, BehaviorLog, PointTransaction
+
+BEHAVIOR_POINTS = {
+    BehaviorLog.ActionType.GOOD: 100,
+    BehaviorLog.ActionType.BAD: -10,
+}
+
+REDEMPTION_ACTIONS = {
+    'approve': Redemption.Status.APPROVED,
+    'reject': Redemption.Status.REJECTED,
+}
+
+
+# Largest number of operations accepted by one batch call
+MAX_BATCH_SIZE = 200
+
+# One balance change for apply_many()
+PointChange = namedtuple('PointChange', ['user_id', 'amount', 'reason', 'note', 'allow_partial'], defaults=['', False])
+
+
+class InsufficientPoints(Exception):
+    pass
+
+
+def apply(user, amount, reason, note="", allow_partial=False):
+    """
+    Change the user's balance by `amount` and write the ledger entry.
+
+    The balance is moved with a single conditional UPDATE so concurrent
+    requests never overwrite each other. A debit larger than the balance
+    raises InsufficientPoints, unless `allow_partial` is set, in which case
+    the balance stops at zero and the ledger records what was actually taken.
+    """
+    with transaction.atomic():
+        profiles = Profile.objects.filter(user_id=user.pk)
+        # The profile's version moves in the same UPDATE as its balance
+        version = F('version') + 1
+        if amount >= 0:
+            profiles.update(points=F('points') + amount, version=version)
+        elif not profiles.filter(points__gte=-amount).update(points=F('points') + amount, version=version):
+            if not allow_partial:
+                raise InsufficientPoints
+            # Locked now, so the balance can't move before our UPDATE. It may
+            # have grown since the check above, so never take more than asked
+            balance = profiles.select_for_update().values_list('points', flat=True).get()
+            amount = max(amount, -balance)
+            profiles.update(points=F('points') + amount, version=version)
+        balance_after, household_id = profiles.values_list('points', 'household_id').get()
+        bump_versions([household_id])
+        events.publish(household_id, 'balance', user_id=user.pk, points=balance_after)
+        entry = PointTransaction.objects.create(
+            user_id=user.pk,
+            amount=amount,
+            balance_after=balance_after,
+            reason=reason,
+            note=note[:255],
+        )
+        stats.record([entry])
+        return entry
+
+
+def complete_chore(user, chore):
+    """
+    Credit a chore to the kid it is assigned to.
+    Returns the ledger entry, or None if the chore can't be completed again.
+    """
+    with transaction.atomic():
+        if chore.chore_type == Chore.Type.ONE_TIME:
+            # Deleting is the completion for one-time chores, so only one request can win
+            deleted, _ = Chore.objects.filter(pk=chore.pk).delete()
+            if not deleted:
+                return None
+        else:
+            # Flipping today's occurrence is the guard: a second tap (or a chore
+            # that isn't scheduled today) finds no open row and gets no points
+            now = timezone.now()
+            claimed = ChoreOccurrence.objects.filter(
+                chore=chore,
+                day=timezone.localdate(now),
+                completed_at__isnull=True,
+            ).update(completed_at=now)
+            if not claimed:
+                return None
+            ChoreCompletion.objects.create(user=user, chore=chore)
+        events.publish(chore.household_id, 'chore', user_id=user.pk, chore_id=chore.pk, status='completed')
+        achievements.record_chores(user.pk, 1, scheduled=chore.chore_type != Chore.Type.ONE_TIME)
+        return apply(user, chore.points_value, PointTransaction.Reason.CHORE, note=chore.title)
+
+
+def redeem_reward(user, reward):
+    """
+    Spend points on a reward and open a pending redemption.
+    Raises InsufficientPoints when the balance doesn't cover the cost.
+    """
+    with transaction.atomic():
+        entry = apply(user, -reward.cost, PointTransaction.Reason.REDEMPTION, note=reward.title)
+        redemption = Redemption.objects.create(
+            household_id=user.profile.household_id,
+            user=user,
+            reward=reward,
+            status=Redemption.Status.PENDING,
+        )
+        events.publish(redemption.household_id, 'redemption', id=redemption.pk, user_id=user.pk, status=redemption.status)
+    return redemption, entry
+
+
+def log_behavior(kid_user, action_type, note=""):
+    """
+    Log good/bad behavior for a kid. Bad behavior never takes the balance below zero.
+    Returns the ledger entry, or None for an unknown action type.
+    """
+    points_change = BEHAVIOR_POINTS.get(action_type)
+    if points_change is None:
+        return None
+    with transaction.atomic():
+        BehaviorLog.objects.create(user=kid_user, action_type=action_type, points_change=points_change, note=note)
+        if action_type == BehaviorLog.ActionType.GOOD:
+            achievements.record_good_behavior(kid_user.pk)
+        return apply(kid_user, points_change, PointTransaction.Reason.BEHAVIOR, note=action_type, allow_partial=True)
+
+
+def process_redemption(redemption, action):
+    """
+    Approve or reject a pending redemption, refunding the kid on reject.
+    Returns False if the action is unknown or the redemption was already processed.
+    """
+    status = REDEMPTION_ACTIONS.get(action)
+    if status is None:
+        return False
+    now = timezone.now()
+    with transaction.atomic():
+        updated = Redemption.objects.filter(
+            pk=redemption.pk,
+            status=Redemption.Status.PENDING
+        ).update(status=status, processed_at=now)
+        if not updated:
+            return False
+        bump_versions([redemption.household_id])
+        events.publish(redemption.household_id, 'redemption', id=redemption.pk, user_id=redemption.user_id, status=status)
+        if status == Redemption.Status.REJECTED:
+            apply(redemption.user, redemption.reward.cost, PointTransaction.Reason.REFUND, note=redemption.reward.title)
+    redemption.status = status
+    redemption.processed_at = now
+    return True
+
+
+def apply_many(changes):
+    """
+    Apply a list of PointChange in order, as one set-based write.
+
+    The affected profiles are locked once (in id order, so concurrent batches
+    can't deadlock), balances are worked out in memory, then written back with
+    a single UPDATE and a bulk insert into the ledger. Returns a list aligned
+    with `changes`: the ledger entry, or None where a debit was refused.
+    """
+    with transaction.atomic():
+        user_ids = sorted({change.user_id for change in changes})
+        rows = (
+            Profile.objects.select_for_update()
+            .filter(user_id__in=user_ids)
+            .order_by('id')
+            .values_list('user_id', 'points', 'household_id')
+        )
+        balances, households = {}, {}
+        for user_id, points, household_id in rows:
+            balances[user_id] = points
+            households[user_id] = household_id
+        entries = []
+        for change in changes:
+            balance = balances[change.user_id]
+            amount = change.amount
+            if balance + amount < 0:
+                if not change.allow_partial:
+                    entries.append(None)
+                    continue
+                amount = -balance
+            balances[change.user_id] = balance + amount
+            entries.append(PointTransaction(
+                user_id=change.user_id,
+                amount=amount,
+                balance_after=balance + amount,
+                reason=change.reason,
+                note=change.note[:255],
+            ))
+        Profile.objects.filter(user_id__in=user_ids).update(points=Case(
+            *[When(user_id=user_id, then=Value(points)) for user_id, points in balances.items()],
+            default=F('points'),
+        ), version=F('version') + 1)
+        bump_versions(households.values())
+        for user_id, points in balances.items():
+            events.publish(households[user_id], 'balance', user_id=user_id, points=points)
+        written = PointTransaction.objects.bulk_create([entry for entry in entries if entry is not None])
+        stats.record(written)
+    return entries
+
+
+def complete_chores(user, chore_ids):
+    """
+    Batch version of complete_chore for one kid.
+    Returns one result dict per requested chore id, in order.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        chores = Chore.objects.select_for_update().in_bulk(chore_ids)
+        open_occurrences = dict(
+            ChoreOccurrence.objects.select_for_update()
+            .filter(chore_id__in=chore_ids, day=timezone.localdate(now), completed_at__isnull=True)
+            .values_list('chore_id', 'id')
+        )
+        results, changes, claimed, recurring, one_time = [], [], [], [], []
+        for chore_id in chore_ids:
+            chore = chores.get(chore_id)
+            if chore is None or chore.assigned_to_id != user.pk:
+                results.append({'chore': chore_id, 'status': 'error', 'error': 'Not assigned to you'})
+                continue
+            if chore.chore_type == Chore.Type.ONE_TIME:
+                if chore_id in one_time:
+                    results.append({'chore': chore_id, 'status': 'error', 'error': 'Already completed'})
+                    continue
+                one_time.append(chore_id)
+            else:
+                occurrence_id = open_occurrences.pop(chore_id, None)
+                if occurrence_id is None:
+                    results.append({'chore': chore_id, 'status': 'error', 'error': 'Already completed today'})
+                    continue
+                claimed.append(occurrence_id)
+                recurring.append(chore_id)
+            results.append({'chore': chore_id, 'status': 'completed', 'points': chore.points_value})
+            events.publish(chore.household_id, 'chore', user_id=user.pk, chore_id=chore_id, status='completed')
+            changes.append(PointChange(user.pk, chore.points_value, PointTransaction.Reason.CHORE, chore.title))
+
+        ChoreOccurrence.objects.filter(pk__in=claimed).update(completed_at=now)
+        ChoreCompletion.objects.bulk_create([
+            ChoreCompletion(user_id=user.pk, chore_id=chore_id) for chore_id in recurring
+        ])
+        # bulk_create skips the post_save that normally drops the cached chore list
+        cache.invalidate('chores', user.pk)
+        Chore.objects.filter(pk__in=one_time).delete()
+        achievements.record_chores(user.pk, len(changes), scheduled=bool(recurring))
+        if changes:
+            apply_many(changes)
+    return results
+
+
+def log_behaviors(kid_users, operations):
+    """
+    Batch version of log_behavior.
+    `kid_users` maps profile id -> user for the kids the caller may log for,
+    `operations` is a list of (profile_id, action_type).
+    """
+    results, logs, changes = [], [], []
+    for profile_id, action_type in operations:
+        kid_user = kid_users.get(profile_id)
+        points_change = BEHAVIOR_POINTS.get(action_type)
+        if kid_user is None:
+            results.append({'profile': profile_id, 'status': 'error', 'error': 'Profile not found'})
+            continue
+        if points_change is None:
+            results.append({'profile': profile_id, 'status': 'error', 'error': 'Invalid action_type'})
+            continue
+        logs.append(BehaviorLog(user=kid_user, action_type=action_type, points_change=points_change))
+        changes.append(PointChange(kid_user.pk, points_change, PointTransaction.Reason.BEHAVIOR, action_type, allow_partial=True))
+        results.append({'profile': profile_id, 'status': 'success'})
+    with transaction.atomic():
+        BehaviorLog.objects.bulk_create(logs)
+        good = Counter(log.user_id for log in logs if log.action_type == BehaviorLog.ActionType.GOOD)
+        for user_id, count in sorted(good.items()):
+            achievements.record_good_behavior(user_id, count)
+        entries = apply_many(changes) if changes else []
+    successes = iter(entries)
+    for result in results:
+        if result['status'] == 'success':
+            result['new_points'] = next(successes).balance_after
+    return results
+
+
+def process_redemptions(redemption_qs, operations):
+    """
+    Batch version of process_redemption.
+    `redemption_qs` limits which redemptions the caller may process,
+    `operations` is a list of (redemption_id, action).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        pending = redemption_qs.select_for_update(of=('self',)).select_related('reward').in_bulk(
+            [redemption_id for redemption_id, _ in operations]
+        )
+        results, to_status, refunds = [], {}, []
+        for redemption_id, action in operations:
+            status = REDEMPTION_ACTIONS.get(action)
+            redemption = pending.get(redemption_id)
+            if status is None:
+                results.append({'redemption': redemption_id, 'status': 'error', 'error': 'Invalid action'})
+                continue
+            if redemption is None or redemption.status != Redemption.Status.PENDING or redemption_id in to_status:
+                results.append({'redemption': redemption_id, 'status': 'error', 'error': 'Already processed'})
+                continue
+            to_status[redemption_id] = status
+            events.publish(redemption.household_id, 'redemption', id=redemption_id, user_id=redemption.user_id, status=status)
+            if status == Redemption.Status.REJECTED:
+                refunds.append(PointChange(redemption.user_id, redemption.reward.cost, PointTransaction.Reason.REFUND, redemption.reward.title))
+            results.append({'redemption': redemption_id, 'status': 'processed', 'new_status': status})
+
+        for status in REDEMPTION_ACTIONS.values():
+            ids = [redemption_id for redemption_id, new_status in to_status.items() if new_status == status]
+            if ids:
+                Redemption.objects.filter(pk__in=ids).update(status=status, processed_at=now)
+        bump_versions({pending[redemption_id].household_id for redemption_id in to_status})
+        if refunds:
+            apply_many(refunds)
+    return results
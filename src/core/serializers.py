@@ -1,33 +1,115 @@
+import datetime
+
 from rest_framework import serializers
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Chore, Reward, Redemption, ChoreCompletion
+from .models import Chore, Reward, Redemption, ChoreCompletion, BehaviorLog, KidDailyStats, KidStreak
+from .points import MAX_BATCH_SIZE, REDEMPTION_ACTIONS
 from profiles.models import Profile
 
+# Longest range served by /profiles/{id}/stats/, a year view with leap years
+MAX_STATS_DAYS = 366
+
+def model_columns(serializer):
+    """
+    Column paths needed to render `serializer`'s current fields, for QuerySet.only().
+    Nested model serializers are followed through their relation.
+    """
+    model = serializer.Meta.model
+    concrete = {field.name for field in model._meta.concrete_fields}
+    columns = {model._meta.pk.name}
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.ModelSerializer):
+            # user.streak -> user, user__streak and user__streak__<column>
+            path = field.source.split('.')
+            columns.update('__'.join(path[:depth]) for depth in range(1, len(path) + 1))
+            columns.update(f"{'__'.join(path)}__{column}" for column in model_columns(field))
+            continue
+        source = field.source.split('.')[0]
+        if source.startswith('get_') and source.endswith('_display'):
+            source = source[len('get_'):-len('_display')]
+        if source in concrete:
+            columns.add(source)
+    return columns
+
+class SparseFieldsetSerializerMixin:
+    """
+    Trim GET output to a comma separated ?fields= list, e.g. ?fields=id,title
+    Unknown names are ignored and `id` is always kept.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = request.query_params.get('fields')
+        if requested:
+            keep = {'id', *(name.strip() for name in requested.split(','))}
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'email']
 
-class ProfileSerializer(serializers.ModelSerializer):
+class KidStreakSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = KidStreak
+        # current_streak is kept up to date by achievements.expire_streaks, no per-row query
+        fields = ['current_streak', 'longest_streak', 'last_perfect_day', 'badges']
+
+class ProfileSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    # Null until the kid completes their first chore
+    streak = KidStreakSerializer(source='user.streak', read_only=True)
 
     class Meta:
         model = Profile
-        fields = ['id', 'user', 'role', 'points', 'parent']
+        fields = ['id', 'user', 'role', 'points', 'parent', 'streak']
+        # Only core.points moves balances, and a kid can't promote themselves
+        read_only_fields = ['points', 'role']
 
-class ChoreSerializer(serializers.ModelSerializer):
+    def validate_parent(self, parent):
+        # The parent decides the household, so it has to be one of ours
+        request = self.context['request']
+        if parent is not None and not Profile.objects.for_user(request.user).filter(
+                pk=parent.pk, role=Profile.Role.PARENT).exists():
+            raise serializers.ValidationError("Parent must be a parent in your household")
+        return parent
+
+class ChoreSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     chore_type_display = serializers.CharField(source='get_chore_type_display', read_only=True)
     
     class Meta:
         model = Chore
-        fields = ['id', 'title', 'description', 'points_value', 'assigned_to', 'chore_type', 'chore_type_display', 'icon', 'created_at']
+        fields = ['id', 'title', 'description', 'points_value', 'assigned_to', 'chore_type', 'chore_type_display', 'icon', 'weekdays', 'interval_days', 'starts_on', 'created_at']
+
+    def validate_assigned_to(self, user):
+        request = self.context['request']
+        if not Profile.objects.for_user(request.user).filter(user=user).exists():
+            raise serializers.ValidationError("Can only assign chores within your household")
+        return user
+
+    def validate(self, data):
+        # Checked against the stored values too, a PATCH may change only one of them
+        chore = Chore(
+            chore_type=data.get('chore_type', getattr(self.instance, 'chore_type', Chore.Type.ONE_TIME)),
+            weekdays=data.get('weekdays', getattr(self.instance, 'weekdays', 0)),
+        )
+        try:
+            chore.clean()
+        except ValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
+        return data
 
-class RewardSerializer(serializers.ModelSerializer):
+class RewardSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Reward
         fields = ['id', 'title', 'description', 'cost', 'icon', 'created_at']
 
-class RedemptionSerializer(serializers.ModelSerializer):
+class RedemptionSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     reward = RewardSerializer(read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
@@ -35,3 +117,44 @@ class RedemptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Redemption
         fields = ['id', 'user', 'reward', 'status', 'status_display', 'claimed_at', 'processed_at']
+
+class KidDailyStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = KidDailyStats
+        fields = ['day', 'points_earned', 'points_spent', 'completions', 'good_count', 'bad_count']
+
+class StatsRangeSerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        end = data.get('end') or timezone.localdate()
+        start = data.get('start') or end - datetime.timedelta(days=MAX_STATS_DAYS - 1)
+        if start > end:
+            raise serializers.ValidationError("start must not be after end")
+        if (end - start).days >= MAX_STATS_DAYS:
+            raise serializers.ValidationError(f"At most {MAX_STATS_DAYS} days per request")
+        return {'start': start, 'end': end}
+
+
+# --- Batch operations ---
+
+class CompleteChoreOperationSerializer(serializers.Serializer):
+    chore = serializers.IntegerField()
+
+class LogBehaviorOperationSerializer(serializers.Serializer):
+    profile = serializers.IntegerField()
+    action_type = serializers.ChoiceField(choices=BehaviorLog.ActionType.choices)
+
+class ProcessRedemptionOperationSerializer(serializers.Serializer):
+    redemption = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=list(REDEMPTION_ACTIONS))
+
+class CompleteChoreBatchSerializer(serializers.Serializer):
+    operations = CompleteChoreOperationSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_SIZE)
+
+class LogBehaviorBatchSerializer(serializers.Serializer):
+    operations = LogBehaviorOperationSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_SIZE)
+
+class ProcessRedemptionBatchSerializer(serializers.Serializer):
+    operations = ProcessRedemptionOperationSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_SIZE)
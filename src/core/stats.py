@@ -0,0 +1,174 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, IntegerField, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from helpers.date_utils import day_bounds
+from .models import BehaviorLog, ChoreCompletion, KidDailyStats, PointTransaction, Redemption
+
+
+def _subquery_total(qs, aggregate):
+    # Collapse a correlated queryset to one aggregate value per outer row
+    return Coalesce(
+        Subquery(qs.order_by().values('user').annotate(total=aggregate).values('total')[:1], output_field=IntegerField()),
+        Value(0),
+    )
+
+
+def kid_overview(kids, day=None):
+    """
+    Annotate a Profile queryset with the numbers shown on each kid card:
+    points_earned_today, tasks_completed_today and pending_redemptions.
+    Everything is a correlated subquery, so the page costs one query no
+    matter how many kids there are.
+    """
+    if day is None:
+        day = timezone.localdate()
+    todays_stats = KidDailyStats.objects.filter(user=OuterRef('user'), day=day)
+    pending = Redemption.objects.filter(user=OuterRef('user'), status=Redemption.Status.PENDING)
+    return kids.select_related('user').annotate(
+        points_earned_today=_subquery_total(todays_stats, Sum('points_earned')),
+        tasks_completed_today=_subquery_total(todays_stats, Sum('completions')),
+        pending_redemptions=_subquery_total(pending, Count('id')),
+    )
+
+
+def kid_history(user, start, end):
+    """KidDailyStats rows for `user` over [start, end], oldest first. Days without activity are absent."""
+    return KidDailyStats.objects.filter(user=user, day__range=(start, end)).order_by('day')
+
+
+def ledger_deltas(reason, amount):
+    """
+    How one ledger entry moves its KidDailyStats row.
+    Keep in step with daily_totals(), which does the same in SQL.
+    """
+    if reason == PointTransaction.Reason.CHORE:
+        # One-time chores are deleted on completion, the ledger still has them
+        return {'points_earned': amount, 'completions': 1}
+    if reason == PointTransaction.Reason.BEHAVIOR:
+        # Bad behavior is a debit, or zero once the balance is empty
+        return {'points_earned': amount, 'good_count': 1} if amount > 0 else {'bad_count': 1}
+    if reason in (PointTransaction.Reason.REDEMPTION, PointTransaction.Reason.REFUND):
+        return {'points_spent': -amount}
+    return {}
+
+
+def record(entries):
+    """
+    Fold new ledger entries into KidDailyStats. Called by core.points inside
+    the transaction that writes them, so the rollup never drifts from the ledger.
+    """
+    totals = defaultdict(Counter)
+    for entry in entries:
+        totals[entry.user_id, timezone.localdate(entry.created_at)].update(ledger_deltas(entry.reason, entry.amount))
+    for (user_id, day), deltas in totals.items():
+        KidDailyStats.objects.add(user_id, day, **deltas)
+
+
+def daily_totals(transactions):
+    """
+    Group ledger rows into KidDailyStats values per (user_id, day), in SQL.
+    Mirrors ledger_deltas().
+    """
+    Reason = PointTransaction.Reason
+    earned = Q(reason=Reason.CHORE) | Q(reason=Reason.BEHAVIOR, amount__gt=0)
+    spent = Q(reason__in=[Reason.REDEMPTION, Reason.REFUND])
+    return (
+        transactions.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('user_id', 'day')
+        .annotate(
+            points_earned=Coalesce(Sum('amount', filter=earned), 0),
+            points_spent=-Coalesce(Sum('amount', filter=spent), 0),
+            completions=Count('id', filter=Q(reason=Reason.CHORE)),
+            good_count=Count('id', filter=Q(reason=Reason.BEHAVIOR, amount__gt=0)),
+            bad_count=Count('id', filter=Q(reason=Reason.BEHAVIOR, amount__lte=0)),
+        )
+    )
+
+
+def ledger_start():
+    """
+    Start of the day the points ledger began, with the opening balances
+    written by the migration that added it. Activity on earlier days is only
+    in the event tables. None while the ledger is empty.
+    """
+    first = PointTransaction.objects.aggregate(first=Min('created_at'))['first']
+    # Whole days: an event and its ledger entry aren't written at the same instant
+    return None if first is None else day_bounds(timezone.localdate(first))[0]
+
+
+def first_activity():
+    """The earliest ledger entry or event of any kind, or None."""
+    firsts = [
+        qs.aggregate(first=Min(field))['first'] for qs, field in (
+            (PointTransaction.objects, 'created_at'),
+            (ChoreCompletion.objects, 'completed_at'),
+            (BehaviorLog.objects, 'timestamp'),
+            (Redemption.objects, 'claimed_at'),
+        )
+    ]
+    return min((first for first in firsts if first is not None), default=None)
+
+
+def event_totals(start, end):
+    """
+    KidDailyStats values per (user_id, day) for activity in [start, end)
+    on days before the ledger began, from the event tables. Follows ledger_deltas(),
+    except that a completion earns its chore's current points_value and a
+    rejected redemption spends nothing (the ledger nets its refund out).
+    Completions of one-time chores went with the chore and can't be counted.
+    """
+    end = min(end, ledger_start() or end)
+    Action = BehaviorLog.ActionType
+    queries = [
+        ChoreCompletion.objects.filter(completed_at__gte=start, completed_at__lt=end)
+        .annotate(day=TruncDate('completed_at')).values('user_id', 'day')
+        .annotate(points_earned=Coalesce(Sum('chore__points_value'), 0), completions=Count('id')),
+        BehaviorLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .annotate(day=TruncDate('timestamp')).values('user_id', 'day')
+        .annotate(
+            points_earned=Coalesce(Sum('points_change', filter=Q(action_type=Action.GOOD)), 0),
+            good_count=Count('id', filter=Q(action_type=Action.GOOD)),
+            bad_count=Count('id', filter=Q(action_type=Action.BAD)),
+        ),
+        Redemption.objects.filter(claimed_at__gte=start, claimed_at__lt=end)
+        .exclude(status=Redemption.Status.REJECTED)
+        .annotate(day=TruncDate('claimed_at')).values('user_id', 'day')
+        .annotate(points_spent=Coalesce(Sum('reward__cost'), 0)),
+    ]
+    totals = defaultdict(Counter)
+    for rows in queries:
+        for row in rows.order_by():
+            totals[row.pop('user_id'), row.pop('day')].update(row)
+    return totals
+
+
+def rebuild(start, end, batch_size=1000):
+    """
+    Recompute KidDailyStats for every kid over [start, end] from the ledger,
+    and from the event tables for days before the ledger began. Events that
+    commando.archive has moved out are no longer counted, so rebuild those
+    early days before archiving them. Returns the number of rows written.
+    """
+    range_start, _ = day_bounds(start)
+    _, range_end = day_bounds(end)
+    rows = daily_totals(PointTransaction.objects.filter(created_at__gte=range_start, created_at__lt=range_end))
+    early = event_totals(range_start, range_end)
+    with transaction.atomic():
+        KidDailyStats.objects.filter(day__range=(start, end)).delete()
+        pending, written = [], 0
+        for row in rows.iterator(chunk_size=batch_size):
+            pending.append(KidDailyStats(**row))
+            if len(pending) >= batch_size:
+                KidDailyStats.objects.bulk_create(pending)
+                written += len(pending)
+                pending = []
+        # Earlier days than any ledger row, so no (user, day) overlaps
+        pending.extend(KidDailyStats(user_id=user_id, day=day, **deltas) for (user_id, day), deltas in early.items())
+        KidDailyStats.objects.bulk_create(pending, batch_size=batch_size)
+        written += len(pending)
+    return written
@@ -0,0 +1,78 @@
+"""
+Server-Sent Events endpoint for the dashboards.
+
+Needs an ASGI server (backend.asgi, see the Dockerfile): under WSGI every
+open stream would hold a worker thread for as long as the page is open.
+
+EventSource can't send an Authorization header, so API clients POST to
+events/ticket/ with their JWT and open events/?ticket=<ticket> within
+TICKET_MAX_AGE seconds, fetching a new ticket to reconnect. The JWT itself
+never goes in a URL, where access logs and proxies would keep it.
+"""
+import json
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from profiles.models import Profile
+from .events import broker
+
+# Comment lines sent while idle so proxies don't drop the connection
+KEEPALIVE_SECONDS = 15
+
+# A ticket only opens the stream and only briefly, so one found in a log is no use
+TICKET_MAX_AGE = 30
+TICKET_SALT = 'core.stream.ticket'
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def stream_ticket(request):
+    """A short-lived ticket for opening the event stream as the current user."""
+    ticket = signing.dumps(request.user.pk, salt=TICKET_SALT)
+    return Response({'ticket': ticket, 'expires_in': TICKET_MAX_AGE})
+
+
+async def _authenticate(request):
+    ticket = request.GET.get('ticket')
+    if ticket:
+        try:
+            user_id = signing.loads(ticket, salt=TICKET_SALT, max_age=TICKET_MAX_AGE)
+        except signing.BadSignature:
+            return None
+        return await get_user_model().objects.filter(pk=user_id, is_active=True).afirst()
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def event_stream(request):
+    """
+    Stream the household's events to a parent, or a kid's own events to that kid.
+    Each message is `event: <balance|chore|redemption>` with a JSON `data` line.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return HttpResponse(status=401)
+    role, household_id = await Profile.objects.filter(user_id=user.pk).values_list('role', 'household_id').aget()
+
+    async def stream():
+        async with broker.subscribe(household_id) as subscription:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = await subscription.get(KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                if role == Profile.Role.KID and event['data'].get('user_id') != user.pk:
+                    continue
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
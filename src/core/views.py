@@ -1,10 +1,15 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.http import HttpResponseForbidden, JsonResponse
 from django.db.models import Sum
-from django.utils import timezone
+from helpers.db import replica_view
 from profiles.models import Profile
-from .models import Chore, Reward, Redemption, BehaviorLog, ChoreCompletion
+from .models import Chore, Reward, Redemption, ChoreCompletion, KidStreak
+from . import achievements, points, stats
+from .conditional import dashboard_etag
 
 @login_required
 def dashboard_view(request):
@@ -23,59 +28,47 @@ def dashboard_view(request):
         return redirect('parent_dashboard') # Default to parent for now
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=dashboard_etag(Profile.Role.PARENT))
 def parent_dashboard(request):
     if request.user.profile.role != Profile.Role.PARENT:
         return redirect('dashboard')
     
-    kids = request.user.profile.kids.all()
-    # If no specific kids linked yet, maybe show all kids? For now, assume linkage is manual or we show all kids in system for simple MVP
-    # Actually, let's just show all profiles with role KID for this MVP to make it easy to test
-    if not kids.exists():
-        kids = Profile.objects.filter(role=Profile.Role.KID)
+    # Everything on this page is scoped to the parent's household
+    kids = Profile.objects.for_user(request.user).filter(role=Profile.Role.KID)
 
-    pending_redemptions = Redemption.objects.filter(status=Redemption.Status.PENDING)
+    pending_redemptions = Redemption.objects.for_user(request.user).filter(
+        status=Redemption.Status.PENDING
+    ).select_related('user', 'reward').order_by('-claimed_at')
     
     context = {
-        'kids': kids,
+        'kids': stats.kid_overview(kids),
         'pending_redemptions': pending_redemptions,
     }
     return render(request, 'dashboard/parent.html', context)
 
 @login_required
+@replica_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=dashboard_etag(Profile.Role.KID))
 def kid_dashboard(request):
     if request.user.profile.role != Profile.Role.KID:
         return redirect('dashboard')
     
     profile = request.user.profile
-    # Chores assigned to this kid
-    all_assigned_chores = Chore.objects.filter(assigned_to=request.user)
-    
-    # Filter out daily chores completed today
-    from django.utils import timezone
-    today = timezone.now().date()
-    
-    completed_today_ids = ChoreCompletion.objects.filter(
-        user=request.user, 
-        completed_at__date=today
-    ).values_list('chore_id', flat=True)
-    
-    # Show chore if it's ONE_TIME (and exists) OR if it's DAILY and NOT in completed_today_ids
-    # Note: ONE_TIME chores are deleted on completion, so we just need to filter DAILY ones.
-    
-    active_chores = []
-    for chore in all_assigned_chores:
-        if chore.chore_type == Chore.Type.DAILY:
-            if chore.id not in completed_today_ids:
-                active_chores.append(chore)
-        else:
-            active_chores.append(chore)
+    # Daily chores already done today are filtered out in the query
+    active_chores = Chore.objects.active_list_for(request.user)
+
+    available_rewards = Reward.objects.catalog(profile.household_id)
 
-    available_rewards = Reward.objects.all()
+    streak = KidStreak.objects.filter(user=request.user).first()
     
     context = {
         'profile': profile,
         'chores': active_chores,
         'rewards': available_rewards,
+        'streak_days': streak.current_streak if streak else 0,
+        'badges': [achievements.BADGES_BY_CODE[code] for code in streak.badges if code in achievements.BADGES_BY_CODE] if streak else [],
     }
     return render(request, 'dashboard/kid.html', context)
 
@@ -90,20 +83,9 @@ def log_behavior(request, kid_id):
     if request.user.profile.role != Profile.Role.PARENT:
         return HttpResponseForbidden()
 
-    kid_profile = get_object_or_404(Profile, id=kid_id)
+    kid_profile = get_object_or_404(Profile.objects.for_user(request.user), id=kid_id)
     action_type = request.POST.get('action_type') # GOOD or BAD
-    
-    points_change = 0
-    if action_type == 'GOOD':
-        points_change = 100
-        BehaviorLog.objects.create(user=kid_profile.user, action_type=BehaviorLog.ActionType.GOOD, points_change=points_change)
-    elif action_type == 'BAD':
-        points_change = -10
-        BehaviorLog.objects.create(user=kid_profile.user, action_type=BehaviorLog.ActionType.BAD, points_change=points_change)
-    
-    kid_profile.points += points_change
-    if kid_profile.points < 0: kid_profile.points = 0 # No negative balance
-    kid_profile.save()
+    points.log_behavior(kid_profile.user, action_type)
 
     return redirect('parent_dashboard')
 
@@ -113,38 +95,19 @@ def complete_chore(request, chore_id):
     if chore.assigned_to != request.user:
          return HttpResponseForbidden()
     
-    # Check if already completed today if daily
-    from django.utils import timezone
-    today = timezone.now().date()
-    if chore.chore_type == Chore.Type.DAILY:
-        if ChoreCompletion.objects.filter(user=request.user, chore=chore, completed_at__date=today).exists():
-            # Already done today, don't give points (prevent spam/refresh hacks)
-            return redirect('kid_dashboard')
-
-    # Add points
-    profile = request.user.profile
-    profile.points += chore.points_value
-    profile.save()
-    
-    # Log completion
-    ChoreCompletion.objects.create(user=request.user, chore=chore)
-
-    # If ONE_TIME, delete it
-    if chore.chore_type == Chore.Type.ONE_TIME:
-        chore.delete()
+    # Daily chores only pay out once a day, one-time chores are removed on completion
+    points.complete_chore(request.user, chore)
 
     return redirect('kid_dashboard')
 
 @login_required
 def redeem_reward(request, reward_id):
-    reward = get_object_or_404(Reward, id=reward_id)
-    profile = request.user.profile
-    
-    if profile.points >= reward.cost:
-        profile.points -= reward.cost
-        profile.save()
-        Redemption.objects.create(user=request.user, reward=reward, status=Redemption.Status.PENDING)
-    
+    reward = get_object_or_404(Reward.objects.for_user(request.user), id=reward_id)
+    try:
+        points.redeem_reward(request.user, reward)
+    except points.InsufficientPoints:
+        pass
+
     return redirect('kid_dashboard')
 
 # --- Frontend Task Management (Parent) ---
@@ -154,41 +117,46 @@ def parent_task_list(request):
     if request.user.profile.role != Profile.Role.PARENT:
         return redirect('dashboard')
         
-    kids = request.user.profile.kids.all()
-    if not kids.exists():
-        kids = Profile.objects.filter(role=Profile.Role.KID)
+    household_id = request.user.profile.household_id
+    kids = Profile.objects.for_household(household_id).filter(role=Profile.Role.KID).select_related('user')
 
     if request.method == 'POST':
         # Simple task creation
         title = request.POST.get('title')
-        points = int(request.POST.get('points', 10))
+        points_value = int(request.POST.get('points', 10))
         assigned_to_id = request.POST.get('assigned_to')
         chore_type = request.POST.get('chore_type', Chore.Type.DAILY)
         icon = request.POST.get('icon', '📝')
+        # Checkbox values are weekday numbers, Monday = 0
+        weekdays = sum(1 << int(day) for day in set(request.POST.getlist('weekdays')) if day.isdigit() and int(day) < 7)
+        interval_days = max(int(request.POST.get('interval_days') or 1), 1)
         
         assigned_user = None
         if assigned_to_id:
-            kid_profile = get_object_or_404(Profile, id=assigned_to_id)
+            kid_profile = get_object_or_404(kids, id=assigned_to_id)
             assigned_user = kid_profile.user
             
-        if title and assigned_user:
+        if chore_type == Chore.Type.WEEKDAYS and not weekdays:
+            messages.error(request, "Pick at least one weekday for a Selected Weekdays task")
+        elif title and assigned_user:
             Chore.objects.create(
+                household_id=household_id,
                 title=title,
-                points_value=points,
+                points_value=points_value,
                 assigned_to=assigned_user,
                 chore_type=chore_type,
-                icon=icon
+                icon=icon,
+                weekdays=weekdays,
+                interval_days=interval_days,
             )
             return redirect('parent_tasks')
 
-    # Assign chores
-    # To simplify, show all chores assigned to any kid linked.
-    kid_users = [k.user for k in kids]
-    chores = Chore.objects.filter(assigned_to__in=kid_users).order_by('-created_at')
+    chores = Chore.objects.for_household(household_id).select_related('assigned_to').order_by('-created_at')
     
     context = {
         'chores': chores,
         'kids': kids,
+        'weekday_choices': enumerate(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']),
     }
     return render(request, 'dashboard/tasks.html', context)
 
@@ -197,7 +165,7 @@ def delete_task(request, task_id):
     if request.user.profile.role != Profile.Role.PARENT:
         return HttpResponseForbidden()
     
-    task = get_object_or_404(Chore, id=task_id)
+    task = get_object_or_404(Chore.objects.for_user(request.user), id=task_id)
     task.delete()
     return redirect('parent_tasks')
 
@@ -215,13 +183,14 @@ def parent_reward_list(request):
         
         if title:
             Reward.objects.create(
+                household_id=request.user.profile.household_id,
                 title=title,
                 cost=cost,
                 icon=icon
             )
             return redirect('parent_rewards')
 
-    rewards = Reward.objects.all().order_by('-created_at')
+    rewards = Reward.objects.catalog(request.user.profile.household_id)
     
     context = {
         'rewards': rewards,
@@ -233,7 +202,7 @@ def delete_reward(request, reward_id):
     if request.user.profile.role != Profile.Role.PARENT:
         return HttpResponseForbidden()
     
-    reward = get_object_or_404(Reward, id=reward_id)
+    reward = get_object_or_404(Reward.objects.for_user(request.user), id=reward_id)
     reward.delete()
     return redirect('parent_rewards')
 
@@ -242,18 +211,9 @@ def manage_redemption(request, redemption_id, action):
     if request.user.profile.role != Profile.Role.PARENT:
         return redirect('dashboard')
         
-    redemption = get_object_or_404(Redemption, id=redemption_id)
-    if request.method == 'POST' and redemption.status == Redemption.Status.PENDING:
-        if action == 'approve':
-            redemption.status = Redemption.Status.APPROVED
-        elif action == 'reject':
-            redemption.status = Redemption.Status.REJECTED
-            # Refund points to the kid
-            kid_profile = redemption.user.profile
-            kid_profile.points += redemption.reward.cost
-            kid_profile.save()
-            
-        redemption.processed_at = timezone.now()
-        redemption.save()
-        
+    redemption = get_object_or_404(Redemption.objects.for_user(request.user), id=redemption_id)
+    if request.method == 'POST':
+        # Rejecting refunds the points to the kid
+        points.process_redemption(redemption, action)
+
     return redirect('parent_dashboard')
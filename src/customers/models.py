@@ -1,7 +1,8 @@
-from django.db import models
-import helpers.billing
+from django.db import models, transaction
 from django.conf import settings
 
+from subscriptions.models import BillingOutbox
+
 from allauth.account.signals import (
     user_signed_up as allauth_user_signed_up,
     email_confirmed as allauth_email_confirmed
@@ -20,15 +21,11 @@ class Customer(models.Model):
         return f"{self.user.username}"
     
     def save(self, *args, **kwargs):
-        if not self.stripe_id:
-            if self.init_email_confirmed and self.init_email:
-                email = self.init_email
-                if email != "" or email is not None:
-                    self.stripe_id = helpers.billing.create_customer(email=self.user.email, metadata={
-                        'user_id': self.user.id,
-                        'username': self.user.username,
-                        })
-        super().save(*args, **kwargs)        
+        # The Stripe customer is created by the billing outbox job (subscriptions.outbox)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if not self.stripe_id and self.init_email_confirmed and self.init_email:
+                BillingOutbox.objects.enqueue(BillingOutbox.Action.CREATE_CUSTOMER, self.id)
     
 def allauth_user_signed_up_handler(request, user,*args, **kwargs):
     email = user.email
@@ -1,3 +1,13 @@
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
 import stripe
 from decouple import config
 
@@ -8,12 +18,181 @@ from . import date_utils
 DJANGO_DEBUG=config("DJANGO_DEBUG", default=False, cast=bool)
 STRIPE_SECRET_KEY=config("STRIPE_SECRET_KEY", default="", cast=str)
 STRIPE_TEST_OVERRIDE = config("STRIPE_TEST_OVERRIDE", default=False, cast=bool)
+STRIPE_WEBHOOK_SECRET = config("STRIPE_WEBHOOK_SECRET", default="", cast=str)
 
 if "sk_test" in STRIPE_SECRET_KEY and not DJANGO_DEBUG and not STRIPE_TEST_OVERRIDE:
     raise ValueError("Invalid stripe key for prod")
 
 stripe.api_key = STRIPE_SECRET_KEY
 
+logger = logging.getLogger(__name__)
+
+# Well under Stripe's live rate limits, leaves headroom for web traffic
+STRIPE_READS_PER_SECOND = config("STRIPE_READS_PER_SECOND", default=25, cast=int)
+
+# (connect, read) seconds for one HTTP request, and the most a call may spend
+# including retries, so a slow Stripe can't hold a web worker much longer
+STRIPE_TIMEOUT = (3.05, config("STRIPE_READ_TIMEOUT", default=10, cast=float))
+STRIPE_DEADLINE = config("STRIPE_DEADLINE", default=20, cast=float)
+STRIPE_MAX_RETRIES = config("STRIPE_MAX_RETRIES", default=2, cast=int)
+# Don't retry with less than this left before the deadline
+MIN_ATTEMPT_SECONDS = 1.0
+
+
+class RateLimiter:
+    """Spaces calls out to at most `rate` per second, shared across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class CircuitOpenError(stripe.error.APIConnectionError):
+    """Raised without calling Stripe while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` upstream failures in a row and fails calls fast
+    for `reset_timeout` seconds. Then one trial call goes through, and its
+    result closes the breaker again or keeps it open.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # Half open: this caller is the trial, everyone else keeps failing fast
+            self._opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+# monotonic() time by which the BillingClient call in progress must finish
+_call_deadline = contextvars.ContextVar("stripe_call_deadline", default=None)
+
+
+class DeadlineRequestsClient(stripe.RequestsClient):
+    """
+    RequestsClient whose (connect, read) timeout is cut down to what is left
+    of the current call's deadline, so a last attempt can't overrun it.
+    """
+
+    @property
+    def _timeout(self):
+        deadline = _call_deadline.get()
+        if deadline is None:
+            return self._full_timeout
+        remaining = max(deadline - time.monotonic(), 0.1)
+        connect, read = self._full_timeout if isinstance(self._full_timeout, tuple) else (self._full_timeout,) * 2
+        return (min(connect, remaining), min(read, remaining))
+
+    @_timeout.setter
+    def _timeout(self, value):
+        # Set by RequestsClient.__init__
+        self._full_timeout = value
+
+
+def _is_upstream_failure(error):
+    # Network trouble, throttling and 5xx are worth retrying, a 4xx won't change
+    if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+        return True
+    return (error.http_status or 0) >= 500
+
+
+class BillingClient:
+    """
+    Stripe access for the app, over one pooled HTTP session. Every call has
+    a per-request timeout and an overall deadline, upstream failures are
+    retried with jittered exponential backoff, and writes carry an
+    idempotency key that stays the same across those retries. A shared
+    CircuitBreaker fails calls fast while Stripe is degraded.
+    """
+
+    def __init__(self, api_key, timeout=STRIPE_TIMEOUT, deadline=STRIPE_DEADLINE,
+                 max_retries=STRIPE_MAX_RETRIES, pool_size=16, breaker=None):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        self.http_client = DeadlineRequestsClient(timeout=timeout, session=session)
+        self.stripe = stripe.StripeClient(
+            api_key,
+            http_client=self.http_client,
+            # Retries happen here, where they count against the deadline and the breaker
+            max_network_retries=0,
+        )
+        self.v1 = self.stripe.v1
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+
+    def read(self, method, *args, params=None):
+        return self._call(method, args, params, {})
+
+    def write(self, method, *args, params=None, idempotency_key=None):
+        return self._call(method, args, params, {"idempotency_key": idempotency_key or str(uuid.uuid4())})
+
+    def _call(self, method, args, params, options):
+        started = time.monotonic()
+        token = _call_deadline.set(started + self.deadline)
+        try:
+            return self._attempt(method, args, params, options, started)
+        finally:
+            _call_deadline.reset(token)
+
+    def _attempt(self, method, args, params, options, started):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError("Stripe is failing, not calling it for now")
+            try:
+                response = method(*args, params=params, options=options)
+            except stripe.error.StripeError as e:
+                if not _is_upstream_failure(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                attempt += 1
+                backoff = random.uniform(0, min(2.0, 0.25 * 2 ** attempt))
+                # A retry needs time left for a request too, not only for the backoff
+                if attempt > self.max_retries or time.monotonic() - started + backoff + MIN_ATTEMPT_SECONDS > self.deadline:
+                    raise
+                logger.warning("Stripe call failed (%s), retry %s in %.2fs", e.__class__.__name__, attempt, backoff)
+                time.sleep(backoff)
+                continue
+            self.breaker.record_success()
+            return response
+
+
+client = BillingClient(STRIPE_SECRET_KEY)
+
 def serialize_subscription_data(subscription_response):
     status = subscription_response.status
     cancel_at_period_end = subscription_response.cancel_at_period_end
@@ -26,20 +205,20 @@ def serialize_subscription_data(subscription_response):
         "current_period_end": current_period_end,
     }
 
-def create_customer(name="", email="", metadata={}):
-    response = stripe.Customer.create(
-    name=name,
-    email=email,
-    metadata=metadata
-    )
+def create_customer(name="", email="", metadata={}, idempotency_key=None):
+    response = client.write(client.v1.customers.create, params={
+        "name": name,
+        "email": email,
+        "metadata": metadata,
+    }, idempotency_key=idempotency_key)
     stripe_id = response.id
     return stripe_id
 
-def create_product(name="", metadata={}):
-    response = stripe.Product.create(
-    name=name,    
-    metadata=metadata
-    )
+def create_product(name="", metadata={}, idempotency_key=None):
+    response = client.write(client.v1.products.create, params={
+        "name": name,
+        "metadata": metadata,
+    }, idempotency_key=idempotency_key)
     stripe_id = response.id
     return stripe_id
 
@@ -48,76 +227,133 @@ def create_price(currency="usd",
             unit_amount="9999",
             interval="month",
             product=None,
-            metadata={}):
+            metadata={},
+            idempotency_key=None):
     if product is None:
         return None
-    response = stripe.Price.create(
-            currency=currency,
-            unit_amount=unit_amount,
-            recurring={"interval": interval},
-            product=product,
-            metadata=metadata
-            )
+    response = client.write(client.v1.prices.create, params={
+            "currency": currency,
+            "unit_amount": unit_amount,
+            "recurring": {"interval": interval},
+            "product": product,
+            "metadata": metadata,
+            }, idempotency_key=idempotency_key)
     stripe_id = response.id
     return stripe_id
 
 def start_checkout_session(customer_id, success_url="", cancel_url="", price_stripe_id="", mode="subscription", raw=True):
     if not success_url.endswith("?session_id={CHECKOUT_SESSION_ID}"):
         success_url = f"{success_url}" + "?session_id={CHECKOUT_SESSION_ID}"
-    response = stripe.checkout.Session.create(
-        customer=customer_id,
-        success_url=success_url,
-        cancel_url=cancel_url,
-        line_items=[{"price": price_stripe_id, "quantity": 1}],
-        mode=mode,
-    )
+    response = client.write(client.v1.checkout.sessions.create, params={
+        "customer": customer_id,
+        "success_url": success_url,
+        "cancel_url": cancel_url,
+        "line_items": [{"price": price_stripe_id, "quantity": 1}],
+        "mode": mode,
+    })
     if raw:
         return response
     return response.url
     
 def get_checkout_session(stripe_id, raw=True):
-    response = stripe.checkout.Session.retrieve(stripe_id)
+    response = client.read(client.v1.checkout.sessions.retrieve, stripe_id)
     if raw:
         return response
     return response.url
     
 def get_subscription_session(stripe_id, raw=True):
-    response = stripe.Subscription.retrieve(stripe_id)
+    response = client.read(client.v1.subscriptions.retrieve, stripe_id)
     if raw:
         return response
     return serialize_subscription_data(response)
 
+def get_subscriptions(stripe_ids, workers=8, rate_limit=STRIPE_READS_PER_SECOND):
+    """
+    Retrieve many subscriptions concurrently, at most `rate_limit` requests a
+    second. Returns {stripe_id: response}; ids that failed are left out.
+    """
+    limiter = RateLimiter(rate_limit)
+
+    def fetch(stripe_id):
+        limiter.wait()
+        try:
+            return stripe_id, client.read(client.v1.subscriptions.retrieve, stripe_id)
+        except stripe.error.StripeError:
+            logger.exception("Could not retrieve subscription %s", stripe_id)
+            return stripe_id, None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(fetch, set(stripe_ids))
+        return {stripe_id: response for stripe_id, response in results if response is not None}
+
+def verify_webhook_event(payload, signature):
+    """
+    Check the Stripe-Signature header against STRIPE_WEBHOOK_SECRET and
+    return the event as a plain dict. Raises ValueError when it doesn't match.
+    """
+    try:
+        stripe.WebhookSignature.verify_header(payload.decode("utf-8"), signature, STRIPE_WEBHOOK_SECRET)
+    except stripe.error.SignatureVerificationError as e:
+        raise ValueError(str(e)) from e
+    return json.loads(payload)
+
 def get_customer_active_subscriptions(customer_stripe_id):
-    response = stripe.Subscription.list(customer=customer_stripe_id, status="active")
+    response = client.read(client.v1.subscriptions.list, params={"customer": customer_stripe_id, "status": "active"})
     return response
 
+def iter_active_subscriptions(page_size=100):
+    """Every active subscription on the account, one retried call per page."""
+    params = {"status": "active", "limit": page_size}
+    while True:
+        page = client.read(client.v1.subscriptions.list, params=params)
+        yield from page.data
+        if not page.has_more or not page.data:
+            return
+        params = {**params, "starting_after": page.data[-1].id}
+
+def cancel_subscriptions(stripe_ids, reason="", feedback="other", workers=8, rate_limit=STRIPE_READS_PER_SECOND):
+    """
+    Cancel many subscriptions immediately and concurrently, at most
+    `rate_limit` requests a second. Returns the ids that were cancelled.
+    """
+    limiter = RateLimiter(rate_limit)
+
+    def cancel(stripe_id):
+        limiter.wait()
+        try:
+            cancel_subscription(stripe_id, reason=reason, feedback=feedback, cancel_at_period_end=False)
+        except stripe.error.StripeError:
+            logger.exception("Could not cancel subscription %s", stripe_id)
+            return None
+        return stripe_id
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [stripe_id for stripe_id in pool.map(cancel, set(stripe_ids)) if stripe_id is not None]
+
 def cancel_subscription(stripe_id, reason="", feedback="other", cancel_at_period_end=False,  raw=True):
+    cancellation_details = {
+        "comment": reason,
+        "feedback": feedback,
+    }
     if cancel_at_period_end:
-        response = stripe.Subscription.modify(
-            stripe_id,
-            cancel_at_period_end=cancel_at_period_end,
-            cancellation_details={
-                "comment": reason,
-                "feedback": feedback,
-            }
-        ) 
+        response = client.write(client.v1.subscriptions.update, stripe_id, params={
+            "cancel_at_period_end": cancel_at_period_end,
+            "cancellation_details": cancellation_details,
+        })
     else:
-        response = stripe.Subscription.cancel(
-        stripe_id,
-        cancellation_details={
-            "comment": reason,
-            "feedback": feedback,
-        }
-        ) 
+        response = client.write(client.v1.subscriptions.cancel, stripe_id, params={
+            "cancellation_details": cancellation_details,
+        })
     if raw:
         return response
     return serialize_subscription_data(response)
 
 def get_checkout_customer_plan(session_id):
-    checkout_r = get_checkout_session(session_id, raw=True)
+    # One request: the subscription comes expanded inside the session
+    checkout_r = client.read(client.v1.checkout.sessions.retrieve, session_id, params={"expand": ["subscription"]})
     customer_id = checkout_r.customer
-    sub_stripe_id = checkout_r.subscription
-    sub_r = get_subscription_session(sub_stripe_id, raw=True)
+    sub_r = checkout_r.subscription
+    sub_stripe_id = sub_r.id
     subscription_plan = sub_r.plan   
 
     subscription_data = serialize_subscription_data(sub_r)
@@ -1,4 +1,14 @@
 import datetime
 
+from django.utils import timezone
+
 def timestamp_as_datetime(timestamp):
-    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.UTC)
\ No newline at end of file
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.UTC)
+
+def day_bounds(day):
+    """
+    [start, end) datetimes of a calendar day in the current timezone.
+    Range filters on these can use an index, unlike a __date lookup.
+    """
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return start, start + datetime.timedelta(days=1)
@@ -0,0 +1,124 @@
+"""
+Primary/replica routing.
+
+Everything goes to the "default" (primary) database unless a view opts in
+with @replica_view or ReplicaListMixin. Then its reads go to one of
+settings.DATABASE_REPLICAS, except:
+
+- inside a transaction on the primary, for select_for_update(), and
+  after the request has written anything
+- for a user who wrote something in the last REPLICA_PIN_SECONDS, so
+  they don't miss their own change while the replicas catch up
+
+ReplicaPinMiddleware notices writes made during a request and pins the
+user to the primary for that window. The pin lives in the cache, which
+settings requires to be shared (CACHE_URL) when replicas are configured.
+"""
+import contextlib
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Per request: {"replica": bool, "wrote": bool}. A dict, so changes made
+# inside sync_to_async threads are seen by the middleware.
+_state = contextvars.ContextVar("db_routing", default=None)
+
+
+def _pin_key(user_id):
+    return f"db-pin:{user_id}"
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(_pin_key(user.pk)) is not None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if not state or not state["replica"] or state["wrote"] or not settings.DATABASE_REPLICAS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state["wrote"] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+@contextlib.contextmanager
+def replica_reads(user):
+    """Send reads in this block to a replica, unless `user` is pinned to the primary."""
+    state = _state.get()
+    if state is None:
+        # Outside a request (commands, workers): don't track writes
+        state = {"replica": False, "wrote": False}
+    previous = state["replica"]
+    state["replica"] = bool(settings.DATABASE_REPLICAS) and not state["wrote"] and not is_pinned(user)
+    token = _state.set(state)
+    try:
+        yield
+    finally:
+        state["replica"] = previous
+        _state.reset(token)
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Read from the primary in this block, e.g. to build a value for a shared cache."""
+    state = _state.get()
+    if state is None or not state["replica"]:
+        yield
+        return
+    state["replica"] = False
+    try:
+        yield
+    finally:
+        state["replica"] = True
+
+
+def replica_view(view):
+    """Decorator for read-only function views."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads(request.user):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaListMixin:
+    """Serve a viewset's list() from a replica. Put it first in the bases."""
+    def list(self, request, *args, **kwargs):
+        with replica_reads(request.user):
+            return super().list(request, *args, **kwargs)
+
+
+class ReplicaPinMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {"replica": False, "wrote": False}
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        # request.user is set by now, by AuthenticationMiddleware or DRF's authentication
+        user = getattr(request, "user", None)
+        if state["wrote"] and settings.DATABASE_REPLICAS and user is not None and user.is_authenticated:
+            cache.set(_pin_key(user.pk), 1, settings.REPLICA_PIN_SECONDS)
+        return response
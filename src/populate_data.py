@@ -46,7 +46,7 @@ def populate():
     # Update profile
     ian_profile = ian.profile
     ian_profile.role = Profile.Role.KID
-    ian_profile.parent = parent_profile
+    ian_profile.set_parent(parent_profile)
     ian_profile.save()
     print(f"Ian: {ian.username} (ID: {ian.id})")
 
@@ -78,7 +78,7 @@ def populate():
     
     gael_profile = gael.profile
     gael_profile.role = Profile.Role.KID
-    gael_profile.parent = parent_profile
+    gael_profile.set_parent(parent_profile)
     gael_profile.save()
     print(f"Gael: {gael.username}")
 
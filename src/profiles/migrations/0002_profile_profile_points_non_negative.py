@@ -0,0 +1,25 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def clamp_negative_points(apps, schema_editor):
+    Profile = apps.get_model('profiles', 'Profile')
+    Profile.objects.filter(points__lt=0).update(points=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_negative_points, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='profile',
+            constraint=models.CheckConstraint(check=models.Q(('points__gte', 0)), name='profile_points_non_negative'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_households(apps, schema_editor):
+    # Every profile without a parent heads its own household, everyone
+    # else joins the household at the top of their parent chain
+    Household = apps.get_model('profiles', 'Household')
+    Profile = apps.get_model('profiles', 'Profile')
+    profiles = {profile.pk: profile for profile in Profile.objects.select_related('user')}
+
+    def head_of(profile):
+        seen = set()
+        while profile.parent_id in profiles and profile.pk not in seen:
+            seen.add(profile.pk)
+            profile = profiles[profile.parent_id]
+        return profile
+
+    households = {}
+    for profile in profiles.values():
+        head = head_of(profile)
+        if head.pk not in households:
+            households[head.pk] = Household.objects.create(name=f"{head.user.username}'s family")
+        profile.household = households[head.pk]
+    Profile.objects.bulk_update(profiles.values(), ['household'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0002_profile_profile_points_non_negative'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Household',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=120)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='household',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='members', to='profiles.household'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['household', 'role'], name='profiles_pr_househo_e817e0_idx'),
+        ),
+        migrations.RunPython(assign_households, migrations.RunPython.noop),
+    ]
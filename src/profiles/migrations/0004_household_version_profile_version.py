@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0003_household_profile_household_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='household',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,9 +1,40 @@
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 # Create your models here.
+class Household(models.Model):
+    """
+    A family. Owns its members' profiles, chores and rewards, so parents only
+    ever see (and query) their own family's data.
+    """
+    name = models.CharField(max_length=120)
+    # Bumped on every write to the household's chores, rewards, redemptions or points
+    version = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class HouseholdQuerySet(models.QuerySet):
+    """
+    Shared by every model with a `household` foreign key.
+    """
+    def for_household(self, household):
+        household_id = getattr(household, 'pk', household)
+        if household_id is None:
+            # Never fall through to an IS NULL match on unowned rows
+            return self.none()
+        return self.filter(household_id=household_id)
+
+    def for_user(self, user):
+        return self.for_household(user.profile.household_id)
+
+
 class Profile(models.Model):
     class Role(models.TextChoices):
         PARENT = 'PARENT', 'Parent'
@@ -14,12 +45,60 @@ class Profile(models.Model):
     points = models.IntegerField(default=0)
     # Allows linking a kid to a parent (simple hierarchy)
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='kids')
+    household = models.ForeignKey(Household, on_delete=models.CASCADE, null=True, blank=True, related_name='members')
+    # Bumped whenever this profile or its balance changes
+    version = models.PositiveIntegerField(default=0)
+
+    objects = HouseholdQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['household', 'role']),
+        ]
+        constraints = [
+            # Balances only change through core.points, this is the last line of defence
+            models.CheckConstraint(check=models.Q(points__gte=0), name='profile_points_non_negative'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} ({self.role})"
 
+    def clean(self):
+        if self.parent_id and self.household_id and self.parent.household_id != self.household_id:
+            raise ValidationError({'parent': "Parent must be in the same household"})
+
+    def set_parent(self, parent):
+        """Link a kid to `parent`, moving them into the parent's household."""
+        self.parent = parent
+        self.household_id = parent.household_id
+
+    def save(self, *args, **kwargs):
+        # New kids join their parent's household, everyone else starts their own.
+        # An existing profile only changes household through set_parent().
+        if self.household_id is None:
+            if self.parent_id:
+                self.household_id = self.parent.household_id
+            else:
+                self.household = Household.objects.create(name=f"{self.user.username}'s family")
+        super().save(*args, **kwargs)
+
+def bump_versions(household_ids=(), user_ids=()):
+    """
+    Invalidate conditional GETs (see core.conditional) for whole households
+    and/or individual profiles. Counters move with F() so concurrent bumps add up.
+    """
+    household_ids = {pk for pk in household_ids if pk is not None}
+    if household_ids:
+        Household.objects.filter(pk__in=household_ids).update(version=F('version') + 1)
+    if user_ids:
+        Profile.objects.filter(user_id__in=user_ids).update(version=F('version') + 1)
+
+@receiver(post_save, sender=Profile)
+def profile_post_save(sender, instance, **kwargs):
+    bump_versions([instance.household_id], [instance.user_id])
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
-    instance.profile.save()
+    # No full re-save here: it would write back a stale points balance on every login
@@ -1,3 +1,406 @@
-from django.test import TestCase
+import datetime
+import threading
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+from django.db.models import F, QuerySet, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import achievements, points, stats
+from core.models import (
+    BehaviorLog, Chore, ChoreCompletion, ChoreOccurrence, KidDailyStats, KidStreak, PointTransaction, Redemption,
+    Reward, generate_occurrences,
+)
+from helpers import db
+from .models import Profile
+
+User = get_user_model()
+
+
+def make_family(name):
+    parent = User.objects.create_user(f'{name}-parent', password='pw')
+    kid = User.objects.create_user(f'{name}-kid', password='pw')
+    kid.profile.role = Profile.Role.KID
+    kid.profile.set_parent(parent.profile)
+    kid.profile.save()
+    return parent, kid
+
+
+class HouseholdTenancyTests(TestCase):
+    def setUp(self):
+        self.parent, self.kid = make_family('us')
+        self.other_parent, self.other_kid = make_family('them')
+        self.api = APIClient()
+
+    def test_kid_joins_parent_household(self):
+        self.assertEqual(self.kid.profile.household_id, self.parent.profile.household_id)
+        self.assertNotEqual(self.parent.profile.household_id, self.other_parent.profile.household_id)
+
+    def test_cross_household_parent_is_rejected(self):
+        self.api.force_authenticate(self.parent)
+        profile = self.parent.profile
+        response = self.api.patch(f'/api/v1/profiles/{profile.pk}/', {'parent': self.other_parent.profile.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        profile.refresh_from_db()
+        self.assertIsNone(profile.parent_id)
+        self.assertNotEqual(profile.household_id, self.other_parent.profile.household_id)
+
+    def test_same_household_parent_is_accepted(self):
+        self.api.force_authenticate(self.parent)
+        response = self.api.patch(f'/api/v1/profiles/{self.kid.profile.pk}/', {'parent': self.parent.profile.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_kid_cannot_change_role(self):
+        self.api.force_authenticate(self.kid)
+        response = self.api.patch(f'/api/v1/profiles/{self.kid.profile.pk}/', {'role': Profile.Role.PARENT}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.kid.profile.refresh_from_db()
+        self.assertEqual(self.kid.profile.role, Profile.Role.KID)
+
+    def test_save_does_not_move_household(self):
+        profile = self.parent.profile
+        household_id = profile.household_id
+        profile.parent = self.other_parent.profile
+        profile.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.household_id, household_id)
+        with self.assertRaises(ValidationError):
+            profile.full_clean()
+
+    def test_other_household_is_hidden(self):
+        chore = Chore.objects.create(household_id=self.other_parent.profile.household_id, title='x', assigned_to=self.other_kid)
+        self.api.force_authenticate(self.parent)
+        self.assertEqual(self.api.get(f'/api/v1/profiles/{self.other_kid.profile.pk}/').status_code, 404)
+        self.assertEqual(self.api.get(f'/api/v1/chores/{chore.pk}/').status_code, 404)
+        ids = [row['id'] for row in self.api.get('/api/v1/profiles/').data]
+        self.assertCountEqual(ids, [self.parent.profile.pk, self.kid.profile.pk])
+
+
+class RedemptionBatchTests(TestCase):
+    def setUp(self):
+        self.parent, self.kid = make_family('us')
+        household_id = self.parent.profile.household_id
+        self.reward = Reward.objects.create(household_id=household_id, title='Movie', cost=20)
+        self.pending = Redemption.objects.create(household_id=household_id, user=self.kid, reward=self.reward)
+        self.done = Redemption.objects.create(
+            household_id=household_id, user=self.kid, reward=self.reward, status=Redemption.Status.APPROVED,
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.parent)
+
+    def process_batch(self, operations, query=''):
+        return self.api.post(f'/api/v1/redemptions/process_batch/{query}', {'operations': operations}, format='json')
+
+    def test_partial_failure_processes_the_rest(self):
+        # The dashboard's list filter in the URL must not hide redemptions from the batch
+        response = self.process_batch([
+            {'redemption': self.pending.pk, 'action': 'reject'},
+            {'redemption': self.done.pk, 'action': 'approve'},
+        ], query='?status=APPROVED')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['status'] for row in response.data['results']], ['processed', 'error'])
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, Redemption.Status.REJECTED)
+        self.assertEqual(Profile.objects.get(user=self.kid).points, self.reward.cost)
+
+    def test_batch_size_is_limited(self):
+        operations = [{'redemption': self.pending.pk, 'action': 'approve'}] * (points.MAX_BATCH_SIZE + 1)
+        self.assertEqual(self.process_batch(operations).status_code, 400)
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, Redemption.Status.PENDING)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.parent, self.kid = make_family('us')
+        self.api = APIClient()
+        self.api.force_authenticate(self.parent)
+
+    def assertRevalidates(self, url, change):
+        first = self.api.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        change()
+        again = self.api.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 200)
+        self.assertNotEqual(again['ETag'], first['ETag'])
+
+    def test_ledger_write_changes_the_household_lists(self):
+        self.assertRevalidates('/api/v1/profiles/', lambda: points.apply_many([
+            points.PointChange(self.kid.pk, 5, PointTransaction.Reason.CHORE),
+            points.PointChange(self.kid.pk, 3, PointTransaction.Reason.BEHAVIOR),
+        ]))
+
+    def test_own_balance_changes_me(self):
+        self.api.force_authenticate(self.kid)
+        self.assertRevalidates('/api/v1/profiles/me/', lambda: points.apply(self.kid, 5, PointTransaction.Reason.ADJUSTMENT))
+
+    def test_saved_reward_changes_the_reward_list(self):
+        household_id = self.parent.profile.household_id
+        self.assertRevalidates('/api/v1/rewards/', lambda: Reward.objects.create(household_id=household_id, title='Movie', cost=20))
+
+
+class ChoreScheduleTests(TestCase):
+    def setUp(self):
+        self.parent, self.kid = make_family('us')
+        self.api = APIClient()
+        self.api.force_authenticate(self.parent)
+
+    def test_weekdays_chore_needs_a_weekday(self):
+        data = {'title': 'Bins', 'assigned_to': self.kid.pk, 'chore_type': Chore.Type.WEEKDAYS, 'weekdays': 0}
+        response = self.api.post('/api/v1/chores/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('weekdays', response.data)
+        data['weekdays'] = 1 << timezone.localdate().weekday()
+        response = self.api.post('/api/v1/chores/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        # Changing only the type is checked against the stored weekdays
+        chore = Chore.objects.create(title='Dishes', assigned_to=self.kid, chore_type=Chore.Type.DAILY)
+        response = self.api.patch(f'/api/v1/chores/{chore.pk}/', {'chore_type': Chore.Type.WEEKDAYS}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_daily_job_moves_the_window(self):
+        self.assertIn('core.models.generate_occurrences', settings.PERIODIC_JOBS)
+        chore = Chore.objects.create(title='Dishes', assigned_to=self.kid, chore_type=Chore.Type.DAILY)
+        # As if the chore was saved days ago and the window has run out since
+        ChoreOccurrence.objects.filter(chore=chore).delete()
+        generate_occurrences()
+        self.assertTrue(ChoreOccurrence.objects.filter(chore=chore, day=timezone.localdate()).exists())
+        self.assertIn(chore, Chore.objects.active_for(self.kid))
+
+
+class StreakExpiryTests(TestCase):
+    def setUp(self):
+        self.parent, self.kid = make_family('us')
+        self.today = timezone.localdate()
+        self.chore = Chore.objects.create(title='Dishes', assigned_to=self.kid, chore_type=Chore.Type.DAILY)
+
+    def add_streak(self, user, last_perfect_days_ago):
+        return KidStreak.objects.create(
+            user=user, current_streak=4, longest_streak=4,
+            last_perfect_day=self.today - datetime.timedelta(days=last_perfect_days_ago),
+        )
+
+    def test_missed_day_zeroes_the_streak(self):
+        self.assertIn('core.achievements.expire_streaks', settings.PERIODIC_JOBS)
+        streak = self.add_streak(self.kid, 3)
+        ChoreOccurrence.objects.create(chore=self.chore, user=self.kid, day=self.today - datetime.timedelta(days=2))
+        self.assertEqual(achievements.expire_streaks(self.today), 1)
+        streak.refresh_from_db()
+        self.assertEqual((streak.current_streak, streak.longest_streak), (0, 4))
+
+    def test_rest_days_keep_the_streak(self):
+        # Nothing scheduled between the last perfect day and today, and today is still open
+        streak = self.add_streak(self.kid, 3)
+        self.assertTrue(ChoreOccurrence.objects.filter(user=self.kid, day=self.today).exists())
+        self.assertEqual(achievements.expire_streaks(self.today), 0)
+        streak.refresh_from_db()
+        self.assertEqual(streak.current_streak, 4)
+
+    def test_profile_list_does_not_query_per_kid(self):
+        self.add_streak(self.kid, 3)
+        api = APIClient()
+        api.force_authenticate(self.parent)
+        with CaptureQueriesContext(connection) as one_kid:
+            api.get('/api/v1/profiles/')
+        for n in range(3):
+            kid = User.objects.create_user(f'us-kid-{n}', password='pw')
+            kid.profile.role = Profile.Role.KID
+            kid.profile.set_parent(self.parent.profile)
+            kid.profile.save()
+            self.add_streak(kid, 3)
+        with CaptureQueriesContext(connection) as four_kids:
+            response = api.get('/api/v1/profiles/')
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(len(four_kids), len(one_kid))
+
+
+class StreamTicketTests(TestCase):
+    def setUp(self):
+        self.parent, self.kid = make_family('us')
+        self.api = APIClient()
+
+    def ticket(self):
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.parent)}')
+        response = self.api.post('/api/v1/events/ticket/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['ticket']
+
+    def test_ticket_needs_authentication(self):
+        self.assertEqual(self.api.post('/api/v1/events/ticket/').status_code, 401)
+
+    async def test_ticket_opens_the_stream(self):
+        ticket = await sync_to_async(self.ticket)()
+        response = await self.async_client.get(f'/api/v1/events/?ticket={ticket}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        await stream.aclose()
+
+    def test_jwt_in_url_is_refused(self):
+        response = self.client.get(f'/api/v1/events/?ticket={AccessToken.for_user(self.parent)}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_expired_ticket_is_refused(self):
+        ticket = self.ticket()
+        with mock.patch('core.stream.TICKET_MAX_AGE', -1):
+            self.assertEqual(self.client.get(f'/api/v1/events/?ticket={ticket}').status_code, 401)
+
+
+class DailyStatsRebuildTests(TestCase):
+    def setUp(self):
+        self.parent, self.kid = make_family('us')
+        self.today = timezone.localdate()
+        self.before_ledger = timezone.now() - datetime.timedelta(days=10)
+        household_id = self.kid.profile.household_id
+        chore = Chore.objects.create(title='Dishes', points_value=7, assigned_to=self.kid, chore_type=Chore.Type.DAILY)
+        reward = Reward.objects.create(household_id=household_id, title='Movie', cost=20)
+        # History from before the ledger existed, so only in the event tables
+        ChoreCompletion.objects.create(user=self.kid, chore=chore)
+        BehaviorLog.objects.create(user=self.kid, action_type=BehaviorLog.ActionType.GOOD, points_change=5)
+        BehaviorLog.objects.create(user=self.kid, action_type=BehaviorLog.ActionType.BAD, points_change=-3)
+        Redemption.objects.create(household_id=household_id, user=self.kid, reward=reward, status=Redemption.Status.APPROVED)
+        Redemption.objects.create(household_id=household_id, user=self.kid, reward=reward, status=Redemption.Status.REJECTED)
+        ChoreCompletion.objects.update(completed_at=self.before_ledger)
+        BehaviorLog.objects.update(timestamp=self.before_ledger)
+        Redemption.objects.update(claimed_at=self.before_ledger)
+        points.log_behavior(self.kid, BehaviorLog.ActionType.GOOD)
+
+    def test_rebuild_counts_activity_before_the_ledger(self):
+        stats.rebuild(self.today - datetime.timedelta(days=30), self.today)
+        early = KidDailyStats.objects.get(user=self.kid, day=timezone.localdate(self.before_ledger))
+        self.assertEqual(
+            (early.points_earned, early.points_spent, early.completions, early.good_count, early.bad_count),
+            (12, 20, 1, 1, 1),
+        )
+        # Ledger days still come from the ledger only
+        today = KidDailyStats.objects.get(user=self.kid, day=self.today)
+        self.assertEqual((today.good_count, today.bad_count, today.completions), (1, 0, 0))
+
+
+class PointLedgerTests(TestCase):
+    def setUp(self):
+        self.parent, self.kid = make_family('us')
+
+    def balance(self):
+        return Profile.objects.values_list('points', flat=True).get(user=self.kid)
+
+    def ledger_total(self):
+        return PointTransaction.objects.filter(user=self.kid).aggregate(total=Sum('amount'))['total'] or 0
+
+    def test_balance_always_equals_ledger(self):
+        Reason = PointTransaction.Reason
+        points.apply(self.kid, 30, Reason.ADJUSTMENT)
+        points.apply(self.kid, -10, Reason.BEHAVIOR)
+        with self.assertRaises(points.InsufficientPoints):
+            points.apply(self.kid, -50, Reason.REDEMPTION)
+        points.apply(self.kid, -50, Reason.BEHAVIOR, allow_partial=True)
+        points.apply_many([
+            points.PointChange(self.kid.pk, 15, Reason.CHORE),
+            points.PointChange(self.kid.pk, -40, Reason.REDEMPTION),
+            points.PointChange(self.kid.pk, -40, Reason.BEHAVIOR, allow_partial=True),
+        ])
+        self.assertEqual(self.balance(), 0)
+        self.assertEqual(self.balance(), self.ledger_total())
+        last = PointTransaction.objects.filter(user=self.kid).latest('id')
+        self.assertEqual(last.balance_after, self.balance())
+
+    def test_partial_debit_stops_at_zero(self):
+        points.apply(self.kid, 5, PointTransaction.Reason.ADJUSTMENT)
+        entry = points.apply(self.kid, -10, PointTransaction.Reason.BEHAVIOR, allow_partial=True)
+        self.assertEqual((entry.amount, entry.balance_after, self.balance()), (-5, 0, 0))
+
+    def test_partial_debit_never_takes_more_than_asked(self):
+        points.apply(self.kid, 5, PointTransaction.Reason.ADJUSTMENT)
+        select_for_update = QuerySet.select_for_update
+
+        def credit_first(qs, *args, **kwargs):
+            # A credit commits between the failed conditional UPDATE and the lock
+            Profile.objects.filter(user=self.kid).update(points=F('points') + 100)
+            PointTransaction.objects.create(user=self.kid, amount=100, balance_after=105, reason=PointTransaction.Reason.CHORE)
+            return select_for_update(qs, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=credit_first):
+            entry = points.apply(self.kid, -10, PointTransaction.Reason.BEHAVIOR, allow_partial=True)
+        self.assertEqual((entry.amount, self.balance()), (-10, 95))
+        self.assertEqual(self.balance(), self.ledger_total())
+
+
+class ConcurrentDebitTests(TransactionTestCase):
+    def test_concurrent_debits_never_overdraw(self):
+        parent, kid = make_family('us')
+        points.apply(kid, 100, PointTransaction.Reason.ADJUSTMENT)
+        results = []
+
+        def debit():
+            try:
+                results.append(points.apply(kid, -30, PointTransaction.Reason.REDEMPTION))
+            except points.InsufficientPoints:
+                results.append(None)
+            except OperationalError:
+                # SQLite's test database locks whole tables, that debit just didn't happen
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=debit) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        taken = len([entry for entry in results if entry])
+        self.assertLessEqual(taken, 3)
+        balance = Profile.objects.values_list('points', flat=True).get(user=kid)
+        self.assertEqual(balance, 100 - 30 * taken)
+        self.assertEqual(balance, PointTransaction.objects.filter(user=kid).aggregate(total=Sum('amount'))['total'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = db.PrimaryReplicaRouter()
+        self.user = mock.Mock(pk=1, is_authenticated=True)
+
+    def serve(self, view):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return db.ReplicaPinMiddleware(lambda request: view())(request)
+
+    def test_reads_use_the_primary_unless_the_view_opts_in(self):
+        def view():
+            outside = self.router.db_for_read(Profile)
+            with db.replica_reads(self.user):
+                return outside, self.router.db_for_read(Profile)
+
+        self.assertEqual(self.serve(view), (None, 'replica1'))
+
+    def test_writes_keep_the_request_on_the_primary(self):
+        def view():
+            with db.replica_reads(self.user):
+                self.assertEqual(self.router.db_for_write(Profile), 'default')
+                return self.router.db_for_read(Profile)
+
+        self.assertIsNone(self.serve(view))
+
+    def test_write_pins_the_user_to_the_primary(self):
+        self.serve(lambda: self.router.db_for_read(Profile))
+        self.assertFalse(db.is_pinned(self.user))
+        self.serve(lambda: self.router.db_for_write(Profile))
+        self.assertTrue(db.is_pinned(self.user))
+
+        def view():
+            with db.replica_reads(self.user):
+                return self.router.db_for_read(Profile)
+
+        self.assertIsNone(self.serve(view))
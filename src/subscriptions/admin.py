@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Subscription, UserSubscription, SubscriptionPrice
+from .models import Subscription, UserSubscription, SubscriptionPrice, StripeEvent, BillingOutbox
 
 class SubscriptionPrice(admin.TabularInline):
     model = SubscriptionPrice
@@ -18,3 +18,13 @@ admin.site.register(Subscription, SubscriptionAdmin)
 
 admin.site.register(UserSubscription)
 
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'type', 'object_id', 'created', 'processed_at', 'attempts']
+    list_filter = ['type']
+    search_fields = ['event_id', 'object_id']
+
+@admin.register(BillingOutbox)
+class BillingOutboxAdmin(admin.ModelAdmin):
+    list_display = ['action', 'object_id', 'attempts', 'available_at', 'processed_at']
+    list_filter = ['action']
@@ -0,0 +1,26 @@
+from django.contrib.auth.backends import BaseBackend
+from django.core.exceptions import PermissionDenied
+
+from . import entitlements
+
+
+class EntitlementBackend(BaseBackend):
+    """
+    Answers subscription feature gates (`user.has_perm("subscriptions.pro")`)
+    from the user's materialized entitlements. Listed before ModelBackend and
+    authoritative for those perms: a missing one raises PermissionDenied so
+    the check stops here instead of falling through to the join-heavy lookup.
+    Every other permission is left to the next backend.
+    """
+
+    def get_entitlements(self, user_obj):
+        if not hasattr(user_obj, '_entitlement_cache'):
+            user_obj._entitlement_cache = entitlements.for_user(user_obj.pk)
+        return user_obj._entitlement_cache
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if perm not in entitlements.ENTITLEMENT_PERMS or obj is not None:
+            return False
+        if user_obj.is_active and not user_obj.is_anonymous and perm in self.get_entitlements(user_obj):
+            return True
+        raise PermissionDenied
@@ -0,0 +1,76 @@
+"""
+Per-user subscription entitlements: the SUBSCRIPTION_PERMISSIONS a user
+holds through their plan, their groups or a direct grant, kept as one
+UserEntitlement row and served from core.cache. EntitlementBackend answers
+`user.has_perm("subscriptions.pro")` from here, so a feature gate is a set
+lookup instead of ModelBackend's group and permission joins.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core import cache
+from .models import SUBSCRIPTION_PERMISSIONS, UserEntitlement, UserSubscription
+
+APP_LABEL = 'subscriptions'
+CODENAMES = [codename for codename, _ in SUBSCRIPTION_PERMISSIONS]
+# The perms EntitlementBackend is authoritative for
+ENTITLEMENT_PERMS = frozenset(f'{APP_LABEL}.{codename}' for codename in CODENAMES)
+
+
+def compute(user_ids):
+    """{user_id: set of "subscriptions.<codename>"} straight from the database."""
+    User = get_user_model()
+    perms = {user_id: set() for user_id in user_ids}
+    sources = [
+        (UserSubscription.objects, 'subscription__permissions__'),
+        (User.groups.through.objects, 'group__permissions__'),
+        (User.user_permissions.through.objects, 'permission__'),
+    ]
+    for manager, prefix in sources:
+        rows = manager.filter(**{
+            'user_id__in': user_ids,
+            f'{prefix}content_type__app_label': APP_LABEL,
+            f'{prefix}codename__in': CODENAMES,
+        }).values_list('user_id', f'{prefix}codename')
+        for user_id, codename in rows:
+            perms[user_id].add(f'{APP_LABEL}.{codename}')
+    return perms
+
+
+def rebuild(user_ids):
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    perms = compute(user_ids)
+    with transaction.atomic():
+        UserEntitlement.objects.filter(user_id__in=user_ids).delete()
+        UserEntitlement.objects.bulk_create(
+            [UserEntitlement(user_id=user_id, perms=sorted(user_perms)) for user_id, user_perms in perms.items()]
+        )
+    for user_id in user_ids:
+        cache.invalidate('entitlements', user_id)
+
+
+def rebuild_all(batch_size=1000):
+    user_ids = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+    total = 0
+    batch = []
+    for user_id in user_ids.iterator(chunk_size=batch_size):
+        batch.append(user_id)
+        if len(batch) == batch_size:
+            rebuild(batch)
+            total += len(batch)
+            batch = []
+    rebuild(batch)
+    return total + len(batch)
+
+
+def for_user(user_id):
+    """The user's entitlements as a frozenset, from the cache, the table, or computed on first use."""
+    def build():
+        perms = UserEntitlement.objects.filter(user_id=user_id).values_list('perms', flat=True).first()
+        if perms is None:
+            perms = sorted(compute([user_id])[user_id])
+            UserEntitlement.objects.get_or_create(user_id=user_id, defaults={'perms': perms})
+        return frozenset(perms)
+    return cache.cached('entitlements', user_id, build)
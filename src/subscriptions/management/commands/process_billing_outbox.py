@@ -0,0 +1,13 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+
+from subscriptions import outbox
+
+class Command(BaseCommand):
+
+    def handle(self, *args: Any, **options: Any):
+        # python manage.py process_billing_outbox
+        # Creates the Stripe customers, products and prices queued by save().
+        # run_worker does this on its own, this is for a one-off drain.
+        done = outbox.drain()
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} billing outbox entries"))
@@ -0,0 +1,16 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+
+from subscriptions import webhooks
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", default=100, type=int)
+
+    def handle(self, *args: Any, **options: Any):
+        # python manage.py process_stripe_events
+        # Applies the webhook events stored by stripe_webhook_view.
+        # run_worker does this on its own, this is for a one-off run.
+        applied = webhooks.process_pending(batch_size=options.get("batch_size"))
+        self.stdout.write(self.style.SUCCESS(f"Applied {applied} Stripe events"))
@@ -12,9 +12,14 @@ class Command(BaseCommand):
         parser.add_argument("--days-left", default=0, type=int)
         parser.add_argument("--days-ago", default=0, type=int)
         parser.add_argument("--clear-dangling", action="store_true", default=False)
+        parser.add_argument("--dry-run", action="store_true", default=False, help="With --clear-dangling, only list what would be cancelled")
+        parser.add_argument("--serial", action="store_true", default=False, help="One Stripe call and save per subscription")
+        parser.add_argument("--workers", default=8, type=int)
+        parser.add_argument("--chunk-size", default=500, type=int)
 
     def handle(self, *args: Any, **options: Any):
-        # python manage.py sync_user_subs --clear-dangling
+        # python manage.py sync_user_subs --clear-dangling [--dry-run]
+        # python manage.py sync_user_subs --workers 16 --chunk-size 1000
         # print(options)
         days_left = options.get("days_left")
         days_ago = options.get("days_ago")
@@ -23,7 +28,7 @@ class Command(BaseCommand):
         clear_dangling = options.get("clear_dangling")
         if clear_dangling:
             print("Clearing dangling not in use active subs in stripe")
-            subs_utils.clear_dangling_subs()
+            subs_utils.clear_dangling_subs(dry_run=options.get("dry_run"), workers=options.get("workers"))
         else:
             print("Sync active subs")
             done = subs_utils.refresh_active_users_subscriptions(
@@ -32,7 +37,10 @@ class Command(BaseCommand):
                 days_ago=days_ago,
                 day_start=day_start,
                 day_end=day_end,
-                verbose=True
+                verbose=True,
+                batched=not options.get("serial"),
+                workers=options.get("workers"),
+                chunk_size=options.get("chunk_size"),
                 )
             if done:
                 print("Done")
\ No newline at end of file
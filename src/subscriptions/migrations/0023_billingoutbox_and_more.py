@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0022_userentitlement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('create_customer', 'Create Customer'), ('create_product', 'Create Product'), ('create_price', 'Create Price')], max_length=30)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['processed_at', 'available_at'], name='subscriptio_process_ab4021_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='billingoutbox',
+            constraint=models.UniqueConstraint(condition=models.Q(('processed_at__isnull', True)), fields=('action', 'object_id'), name='unique_pending_billing_outbox'),
+        ),
+    ]
@@ -1,8 +1,10 @@
 from django.db.models import Q
-from django.db import models
+from django.db import models, transaction
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
-from django.db.models.signals import post_save
-import helpers.billing
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from commando import jobs
+from core import cache
 from django.urls import reverse
 
 from django.conf import settings
@@ -53,11 +55,11 @@ class Subscription(models.Model):
         return [x.strip() for x in self.features.split("\n")]
 
     def save(self, *args, **kwargs):
-        if not self.stripe_id:                            
-            self.stripe_id = helpers.billing.create_product(name=self.name, metadata={
-                'subscription_plan_id': self.id,                        
-                })
-        super().save(*args, **kwargs)               
+        # The Stripe product is created by the billing outbox job (subscriptions.outbox)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if not self.stripe_id:
+                BillingOutbox.objects.enqueue(BillingOutbox.Action.CREATE_PRODUCT, self.id)
 
 class SubscriptionPrice(models.Model):
     """
@@ -117,23 +119,19 @@ class SubscriptionPrice(models.Model):
         return self.subscription.stripe_id
     
     def save(self, *args, **kwargs):
-        if (self.stripe_id is None and self.product_stripe_id is not None):                                     
-            stripe_id = helpers.billing.create_price(
-            currency=self.stripe_curreny,
-            unit_amount=self.stripe_price,
-            interval=self.interval,
-            product=self.product_stripe_id,
-            metadata={
-                'subscription_plan_price_id': self.id,                        
-            })           
-            self.stripe_id = stripe_id 
-        super().save(*args, **kwargs)
+        # The Stripe price is created by the billing outbox job, once the product exists
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.stripe_id is None and self.subscription_id is not None:
+                BillingOutbox.objects.enqueue(BillingOutbox.Action.CREATE_PRICE, self.id)
         if self.featured:
              qs = SubscriptionPrice.objects.filter(
                  subscription=self.subscription,
                  interval=self.interval                 
              ).exclude(id=self.id)
              qs.update(featured=False)            
+        # After the update above, which doesn't send signals
+        cache.invalidate('pricing', 0)
 
 class SubscriptionStatus(models.TextChoices):
     ACTIVE = 'active', 'Active'
@@ -245,33 +243,221 @@ class UserSubscription(models.Model):
         if not self.current_period_end:
             return None
         return int(self.current_period_end.timestamp())
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Groups only need syncing when the plan changes
+        instance._loaded_subscription_id = instance.__dict__.get('subscription_id')
+        return instance
+
     def save(self, *args, **kwargs):
         if (self.original_period_start is None and self.current_period_start is not None):
             self.original_period_start = self.current_period_start
         super().save(*args, **kwargs)
 
-def user_sub_post_save(sender, instance, *args, **kwargs):
-    user_sub_instance = instance
-    user = user_sub_instance.user
-    subscription_obj = user_sub_instance.subscription
-    groups_ids = []
-    if subscription_obj is not None:
-        groups = subscription_obj.groups.all()
-        groups_ids = groups.values_list('id', flat=True)
+def plan_groups():
+    """
+    {subscription_id: (active, frozenset(group_ids))} for every plan, from
+    core.cache until a Subscription or its groups change.
+    """
+    def build():
+        plans = {}
+        for sub_id, active, group_id in Subscription.objects.values_list('id', 'active', 'groups__id'):
+            plans.setdefault(sub_id, (active, set()))[1].add(group_id)
+        return {sub_id: (active, frozenset(group_ids - {None})) for sub_id, (active, group_ids) in plans.items()}
+    return cache.cached('plan_groups', 0, build)
+
+def pricing_snapshot():
+    """
+    {interval: [card]} for the featured prices, with everything the pricing
+    page shows already resolved. From core.cache until a plan or price changes.
+    Prices still waiting for their Stripe id can't be checked out, so they're left out.
+    """
+    def build():
+        snapshot = {interval: [] for interval in SubscriptionPrice.IntervalChoices.values}
+        prices = (
+            SubscriptionPrice.objects.filter(featured=True, stripe_id__isnull=False)
+            .exclude(stripe_id="")
+            .select_related('subscription')
+        )
+        for obj in prices:
+            snapshot.setdefault(obj.interval, []).append({
+                "id": obj.id,
+                "price": obj.price,
+                "interval": obj.interval,
+                "display_sub_name": obj.display_sub_name,
+                "display_sub_subtitle": obj.display_sub_subtitle,
+                "display_features_list": obj.display_features_list,
+                "get_checkout_url": obj.get_checkout_url(),
+            })
+        return snapshot
+    return cache.cached('pricing', 0, build)
+
+def user_sub_post_save(sender, instance, created=False, *args, **kwargs):
+    loaded_subscription_id = getattr(instance, '_loaded_subscription_id', None)
+    instance._loaded_subscription_id = instance.subscription_id
+    if not created and instance.subscription_id == loaded_subscription_id:
+        return
+    plans = plan_groups()
+    _, groups_ids = plans.get(instance.subscription_id, (False, frozenset()))
+    UserGroup = get_user_model().groups.through
+    user_groups = UserGroup.objects.filter(user_id=instance.user_id)
     if not ALLOW_CUSTOM_GROUPS:
-        user.groups.set(groups_ids)
+        user_groups.exclude(group_id__in=groups_ids).delete()
+    else:
+        # Leave groups granted by hand alone, only drop the other active plans' ones
+        subs_groups_set = set()
+        for sub_id, (active, group_ids) in plans.items():
+            if active and sub_id != instance.subscription_id:
+                subs_groups_set |= group_ids
+        remove_ids = subs_groups_set - groups_ids
+        if remove_ids:
+            user_groups.filter(group_id__in=remove_ids).delete()
+    if groups_ids:
+        UserGroup.objects.bulk_create(
+            [UserGroup(user_id=instance.user_id, group_id=group_id) for group_id in groups_ids],
+            ignore_conflicts=True,
+        )
+    from . import entitlements
+    entitlements.rebuild([instance.user_id])
+
+def plan_groups_changed(sender, *args, **kwargs):
+    cache.invalidate('plan_groups', 0)
+
+def pricing_changed(sender, *args, **kwargs):
+    cache.invalidate('pricing', 0)
+
+def entitlement_perms_changed(sender, instance, action, reverse, *args, **kwargs):
+    """
+    Admin edits of a user's groups or permissions, a group's permissions or a
+    plan's permissions. Only the forward side is handled, `manage.py
+    sync_permissions` rebuilds everyone after other changes.
+    """
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    from . import entitlements
+    if isinstance(instance, Subscription):
+        user_ids = UserSubscription.objects.filter(subscription=instance).values_list('user_id', flat=True)
+    elif isinstance(instance, Group):
+        user_ids = instance.user_set.values_list('id', flat=True)
     else:
-        subs_qs = Subscription.objects.filter(active=True)
-        if subscription_obj is not None:
-            subs_qs = subs_qs.exclude(id=subscription_obj.id)
-        subs_groups = subs_qs.values_list("groups__id", flat=True)
-        subs_groups_set = set(subs_groups)
-        # groups_ids = groups.values_list('id', flat=True) # [1, 2, 3] 
-        current_groups = user.groups.all().values_list('id', flat=True)
-        groups_ids_set = set(groups_ids)
-        current_groups_set = set(current_groups) - subs_groups_set
-        final_group_ids = list(groups_ids_set | current_groups_set)
-        user.groups.set(final_group_ids)
-
-
-post_save.connect(user_sub_post_save, sender=UserSubscription)
\ No newline at end of file
+        user_ids = [instance.pk]
+    entitlements.rebuild(user_ids)
+
+
+post_save.connect(user_sub_post_save, sender=UserSubscription)
+for signal, model in ((post_save, Subscription), (post_delete, Subscription), (post_delete, Group), (m2m_changed, Subscription.groups.through)):
+    signal.connect(plan_groups_changed, sender=model)
+for signal, model in ((post_save, Subscription), (post_delete, Subscription), (post_delete, SubscriptionPrice)):
+    signal.connect(pricing_changed, sender=model)
+for through in (Subscription.permissions.through, Group.permissions.through, get_user_model().groups.through, get_user_model().user_permissions.through):
+    m2m_changed.connect(entitlement_perms_changed, sender=through)
+
+
+class StripeEventQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(processed_at__isnull=True, attempts__lt=StripeEvent.MAX_ATTEMPTS)
+
+
+class StripeEvent(models.Model):
+    """
+    A Stripe webhook event, stored as received and applied later by a job
+    on the worker (see subscriptions.webhooks).
+    Stripe retries and redelivers, the unique event_id drops the repeats.
+    """
+    MAX_ATTEMPTS = 5
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=120)
+    object_id = models.CharField(max_length=255, blank=True, db_index=True, help_text='Stripe id of the object the event is about')
+    created = models.DateTimeField(help_text='When Stripe created the event')
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    objects = StripeEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Worker scan for pending events, oldest first
+            models.Index(fields=['processed_at', 'created']),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
+
+
+class UserEntitlement(models.Model):
+    """
+    The subscription permissions a user holds ("subscriptions.pro", ...),
+    denormalized from their plan and groups by subscriptions.entitlements.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='entitlement')
+    perms = models.JSONField(default=list)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {', '.join(self.perms)}"
+
+
+class BillingOutboxQuerySet(models.QuerySet):
+    def enqueue(self, action, object_id):
+        """
+        Queue a Stripe call for `object_id` as part of the caller's transaction.
+        A pending entry for the same object is reused, so repeated saves queue one call.
+        """
+        self.bulk_create([BillingOutbox(action=action, object_id=object_id)], ignore_conflicts=True)
+        jobs.run_soon("subscriptions.outbox.drain")
+
+    def due(self):
+        return self.filter(
+            processed_at__isnull=True,
+            attempts__lt=BillingOutbox.MAX_ATTEMPTS,
+            available_at__lte=timezone.now(),
+        )
+
+
+class BillingOutbox(models.Model):
+    """
+    Stripe objects to create for local rows, written in the same transaction
+    as the row and created later by the job worker (see subscriptions.outbox),
+    which writes the stripe_id back.
+    """
+    MAX_ATTEMPTS = 10
+
+    class Action(models.TextChoices):
+        CREATE_CUSTOMER = 'create_customer', 'Create Customer'
+        CREATE_PRODUCT = 'create_product', 'Create Product'
+        CREATE_PRICE = 'create_price', 'Create Price'
+
+    action = models.CharField(max_length=30, choices=Action.choices)
+    object_id = models.PositiveBigIntegerField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    objects = BillingOutboxQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['action', 'object_id'],
+                condition=Q(processed_at__isnull=True),
+                name='unique_pending_billing_outbox',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['processed_at', 'available_at']),
+        ]
+
+    @property
+    def idempotency_key(self):
+        # Same key on every attempt, Stripe returns the first result for a retry
+        return f"billing-outbox-{self.pk}"
+
+    def __str__(self):
+        return f"{self.action} {self.object_id}"
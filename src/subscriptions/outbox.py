@@ -0,0 +1,131 @@
+"""
+Drains BillingOutbox: creates the queued Stripe customers, products and
+prices and writes their ids back with update(), so save() and its signals
+don't run again.
+
+Retries are safe. Each entry uses the same idempotency key every time, and
+an entry whose row already has a stripe_id is just marked done.
+"""
+import datetime
+import logging
+
+import stripe
+from django.db import transaction
+from django.utils import timezone
+
+import helpers.billing
+from core import cache
+from customers.models import Customer
+from .models import BillingOutbox, Subscription, SubscriptionPrice
+
+logger = logging.getLogger(__name__)
+
+# Seconds before retrying a failed entry, doubled per attempt up to MAX_BACKOFF
+BASE_BACKOFF = 30
+MAX_BACKOFF = 60 * 60
+
+
+class NotReady(Exception):
+    """The entry depends on another Stripe object that doesn't exist yet."""
+
+
+def create_customer(entry):
+    customer = Customer.objects.select_related('user').filter(pk=entry.object_id).first()
+    if customer is None or customer.stripe_id:
+        return
+    stripe_id = helpers.billing.create_customer(email=customer.user.email, metadata={
+        'user_id': customer.user.id,
+        'username': customer.user.username,
+        }, idempotency_key=entry.idempotency_key)
+    Customer.objects.filter(pk=customer.pk, stripe_id__isnull=True).update(stripe_id=stripe_id)
+
+
+def create_product(entry):
+    subscription = Subscription.objects.filter(pk=entry.object_id).first()
+    if subscription is None or subscription.stripe_id:
+        return
+    stripe_id = helpers.billing.create_product(name=subscription.name, metadata={
+        'subscription_plan_id': subscription.id,
+        }, idempotency_key=entry.idempotency_key)
+    Subscription.objects.filter(pk=subscription.pk).update(stripe_id=stripe_id)
+
+
+def create_price(entry):
+    price = SubscriptionPrice.objects.select_related('subscription').filter(pk=entry.object_id).first()
+    if price is None or price.stripe_id:
+        return
+    if price.product_stripe_id is None:
+        raise NotReady(f"Product for {price.subscription} not created yet")
+    stripe_id = helpers.billing.create_price(
+        currency=price.stripe_curreny,
+        unit_amount=price.stripe_price,
+        interval=price.interval,
+        product=price.product_stripe_id,
+        metadata={
+            'subscription_plan_price_id': price.id,
+        },
+        idempotency_key=entry.idempotency_key)
+    SubscriptionPrice.objects.filter(pk=price.pk).update(stripe_id=stripe_id)
+    # update() skips save(), and the price can be shown on the pricing page now
+    cache.invalidate('pricing', 0)
+
+
+HANDLERS = {
+    BillingOutbox.Action.CREATE_CUSTOMER: create_customer,
+    BillingOutbox.Action.CREATE_PRODUCT: create_product,
+    BillingOutbox.Action.CREATE_PRICE: create_price,
+}
+
+
+def process(entry):
+    """Run one locked entry. Returns True when it's done."""
+    try:
+        HANDLERS[entry.action](entry)
+    except NotReady:
+        entry.available_at = timezone.now() + datetime.timedelta(seconds=BASE_BACKOFF)
+        entry.save(update_fields=['available_at'])
+        return False
+    except stripe.error.StripeError as e:
+        logger.exception("Billing outbox entry %s failed", entry.pk)
+        entry.attempts += 1
+        entry.error = repr(e)
+        backoff = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** entry.attempts)
+        entry.available_at = timezone.now() + datetime.timedelta(seconds=backoff)
+        entry.save(update_fields=['attempts', 'error', 'available_at'])
+        return False
+    entry.attempts += 1
+    entry.processed_at = timezone.now()
+    entry.error = ""
+    entry.save(update_fields=['attempts', 'processed_at', 'error'])
+    return True
+
+
+def drain():
+    """
+    Process due entries oldest first, one short transaction each, until none
+    are left. Failed entries are pushed back, so each runs at most once per call.
+    Returns how many completed.
+    """
+    done = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked lets several workers share the queue
+            entry = BillingOutbox.objects.due().select_for_update(skip_locked=True).order_by('id').first()
+            if entry is None:
+                return done
+            done += process(entry)
+
+
+def process_now(action, object_id):
+    """
+    Run a pending entry inline, for a request that can't wait for the worker.
+    Returns False when it's still pending, e.g. because Stripe failed.
+    """
+    with transaction.atomic():
+        entry = (
+            BillingOutbox.objects.filter(action=action, object_id=object_id, processed_at__isnull=True)
+            .select_for_update().first()
+        )
+        if entry is None:
+            return True
+        return process(entry)
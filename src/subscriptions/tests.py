@@ -1,3 +1,396 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import hmac
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+import stripe
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+import helpers.billing
+from commando.models import Job
+from customers.models import Customer
+from . import outbox, utils as subs_utils, webhooks
+from .models import BillingOutbox, StripeEvent, Subscription, SubscriptionPrice, UserSubscription, pricing_snapshot
+
+User = get_user_model()
+
+
+class BillingOutboxTests(TestCase):
+    def make_customer(self, username='buyer'):
+        user = User.objects.create_user(username, email=f'{username}@example.com', password='pw')
+        return Customer.objects.create(user=user, init_email=user.email, init_email_confirmed=True)
+
+    def test_save_queues_one_entry_and_the_drain_job(self):
+        customer = self.make_customer()
+        customer.save()
+        customer.save()
+        self.assertEqual(BillingOutbox.objects.filter(action=BillingOutbox.Action.CREATE_CUSTOMER).count(), 1)
+        self.assertTrue(Job.objects.filter(key='subscriptions.outbox.drain', status=Job.Status.QUEUED).exists())
+
+    @mock.patch('helpers.billing.create_customer')
+    def test_failed_call_is_retried_with_the_same_idempotency_key(self, create_customer):
+        create_customer.side_effect = [stripe.error.APIConnectionError("down"), "cus_123"]
+        customer = self.make_customer()
+        self.assertEqual(outbox.drain(), 0)
+        entry = BillingOutbox.objects.get()
+        self.assertEqual(entry.attempts, 1)
+        self.assertIn("down", entry.error)
+        self.assertGreater(entry.available_at, timezone.now())
+        # Backed off, so a second drain leaves it alone
+        self.assertEqual(outbox.drain(), 0)
+        BillingOutbox.objects.filter(pk=entry.pk).update(available_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(outbox.drain(), 1)
+        keys = {call.kwargs['idempotency_key'] for call in create_customer.call_args_list}
+        self.assertEqual(keys, {entry.idempotency_key})
+        customer.refresh_from_db()
+        self.assertEqual(customer.stripe_id, "cus_123")
+
+    @mock.patch('helpers.billing.create_customer')
+    def test_entry_for_synced_row_makes_no_call(self, create_customer):
+        customer = self.make_customer()
+        Customer.objects.filter(pk=customer.pk).update(stripe_id="cus_existing")
+        self.assertEqual(outbox.drain(), 1)
+        create_customer.assert_not_called()
+
+    @mock.patch('helpers.billing.create_price', return_value="price_123")
+    @mock.patch('helpers.billing.create_product', return_value="prod_123")
+    def test_price_waits_for_product_and_shows_once_synced(self, create_product, create_price):
+        plan = Subscription.objects.create(name='Pro')
+        price = SubscriptionPrice.objects.create(subscription=plan, price=10)
+        self.assertEqual(pricing_snapshot()['month'], [])
+        # The price entry comes first but can't run before the product exists
+        price_entry = BillingOutbox.objects.get(action=BillingOutbox.Action.CREATE_PRICE)
+        self.assertFalse(outbox.process_now(BillingOutbox.Action.CREATE_PRICE, price.id))
+        create_price.assert_not_called()
+        BillingOutbox.objects.filter(pk=price_entry.pk).update(available_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(outbox.drain(), 2)
+        price.refresh_from_db()
+        self.assertEqual(price.stripe_id, "price_123")
+        self.assertEqual([card['id'] for card in pricing_snapshot()['month']], [price.id])
+
+
+class BillingClientDeadlineTests(SimpleTestCase):
+    def failing_call(self, billing, timeouts):
+        def call(*args, params=None, options=None):
+            timeouts.append(billing.http_client._timeout)
+            raise stripe.error.APIConnectionError("down")
+        return call
+
+    @mock.patch('time.sleep')
+    def test_attempt_timeout_is_cut_to_the_deadline(self, sleep):
+        billing = helpers.billing.BillingClient('sk_test_x', timeout=(3.05, 10), deadline=4, max_retries=5)
+        timeouts = []
+        with self.assertRaises(stripe.error.APIConnectionError):
+            billing.read(self.failing_call(billing, timeouts))
+        self.assertTrue(all(connect <= 3.05 and read <= 4 for connect, read in timeouts), timeouts)
+        self.assertEqual(billing.http_client._timeout, (3.05, 10))
+
+    @mock.patch('time.sleep')
+    def test_no_retry_without_time_for_an_attempt(self, sleep):
+        billing = helpers.billing.BillingClient('sk_test_x', deadline=0.5, max_retries=5)
+        timeouts = []
+        with self.assertRaises(stripe.error.APIConnectionError):
+            billing.read(self.failing_call(billing, timeouts))
+        self.assertEqual(len(timeouts), 1)
+        sleep.assert_not_called()
+
+
+class ReadCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        plan = Subscription.objects.create(name='Pro', stripe_id='prod_pro')
+        self.price = SubscriptionPrice.objects.create(subscription=plan, price=10, stripe_id='price_pro')
+
+    def change_price_elsewhere(self):
+        # As if another process saved it, its invalidation lands in that process's cache
+        pricing_snapshot()
+        SubscriptionPrice.objects.filter(pk=self.price.pk).update(price=12)
+        return pricing_snapshot()['month'][0]['price']
+
+    @override_settings(READ_CACHE=True)
+    def test_shared_cache_serves_until_invalidated(self):
+        self.assertEqual(self.change_price_elsewhere(), 10)
+
+    @override_settings(READ_CACHE=False)
+    def test_unshared_cache_is_not_used(self):
+        self.assertEqual(self.change_price_elsewhere(), 12)
+
+
+# The manifest only exists after collectstatic
+@override_settings(READ_CACHE=True, STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class PricingPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        plan = Subscription.objects.create(name='Pro', stripe_id='prod_pro')
+        self.price = SubscriptionPrice.objects.create(subscription=plan, price=17, stripe_id='price_pro')
+
+    def test_fragment_is_served_until_a_price_is_saved(self):
+        self.assertContains(self.client.get('/pricing/'), '$17')
+        with self.assertNumQueries(0):
+            self.client.get('/pricing/')
+        # A write that skips the signal keeps the cached fragment
+        SubscriptionPrice.objects.filter(pk=self.price.pk).update(price=23)
+        self.assertContains(self.client.get('/pricing/'), '$17')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.price.price = 23
+            self.price.save()
+        self.assertContains(self.client.get('/pricing/'), '$23')
+
+
+class CheckoutStartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', email='buyer@example.com', password='pw')
+        self.customer = Customer.objects.create(user=self.user, init_email=self.user.email, init_email_confirmed=True)
+        self.plan = Subscription.objects.create(name='Pro')
+        self.price = SubscriptionPrice.objects.create(subscription=self.plan, price=10)
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+
+    def start(self):
+        session = self.client.session
+        session['checkout_subscription_price_id'] = self.price.id
+        session.save()
+        return self.client.get('/checkout/start/')
+
+    @mock.patch('helpers.billing.start_checkout_session')
+    def test_price_without_stripe_id_is_refused(self, start_checkout_session):
+        response = self.start()
+        self.assertRedirects(response, '/pricing/', fetch_redirect_response=False)
+        start_checkout_session.assert_not_called()
+
+    @mock.patch('helpers.billing.start_checkout_session')
+    @mock.patch('helpers.billing.create_customer', side_effect=stripe.error.APIConnectionError("down"))
+    def test_customer_that_cant_be_created_is_refused(self, create_customer, start_checkout_session):
+        SubscriptionPrice.objects.filter(pk=self.price.pk).update(stripe_id="price_123")
+        response = self.start()
+        self.assertRedirects(response, '/pricing/', fetch_redirect_response=False)
+        start_checkout_session.assert_not_called()
+
+    @mock.patch('helpers.billing.start_checkout_session', return_value="https://checkout.stripe.test/s")
+    @mock.patch('helpers.billing.create_customer', return_value="cus_123")
+    def test_pending_customer_is_created_inline(self, create_customer, start_checkout_session):
+        SubscriptionPrice.objects.filter(pk=self.price.pk).update(stripe_id="price_123")
+        response = self.start()
+        self.assertRedirects(response, "https://checkout.stripe.test/s", fetch_redirect_response=False)
+        self.assertEqual(start_checkout_session.call_args.args[0], "cus_123")
+
+
+def make_plan(name, codename):
+    """A plan whose group and plan both grant subscriptions.<codename>, with a price_<codename> price."""
+    plan = Subscription.objects.create(name=name, stripe_id=f'prod_{codename}')
+    group = Group.objects.create(name=name)
+    plan.groups.add(group)
+    plan.permissions.add(Permission.objects.get(content_type__app_label='subscriptions', codename=codename))
+    SubscriptionPrice.objects.create(subscription=plan, price=10, stripe_id=f'price_{codename}')
+    return plan, group
+
+
+def stripe_subscription(stripe_id, plan, status='active'):
+    return stripe.Subscription.construct_from({
+        'id': stripe_id, 'status': status, 'cancel_at_period_end': False,
+        'current_period_start': 1700000000, 'current_period_end': 1702000000,
+        'plan': {'id': plan, 'object': 'plan'},
+    }, 'sk_test')
+
+
+class BatchedRefreshTests(TestCase):
+    def setUp(self):
+        self.basic, self.basic_group = make_plan('Basic', 'basic')
+        self.pro, self.pro_group = make_plan('Pro', 'pro')
+        self.user_subs = [
+            UserSubscription.objects.create(
+                user=User.objects.create_user(f'subscriber-{n}'), subscription=self.basic,
+                stripe_id=f'sub_{n}', status='active',
+            )
+            for n in range(3)
+        ]
+
+    @mock.patch('helpers.billing.get_subscriptions')
+    def test_chunks_pick_up_stripe_state_and_plan_changes(self, get_subscriptions):
+        get_subscriptions.side_effect = lambda stripe_ids, workers: {
+            # sub_2 failed to load and is left as it was
+            'sub_0': stripe_subscription('sub_0', 'price_basic', status='past_due'),
+            'sub_1': stripe_subscription('sub_1', 'price_pro'),
+        }
+        self.assertFalse(subs_utils.refresh_active_users_subscriptions(batched=True, chunk_size=2))
+        self.assertEqual([call.args[0] for call in get_subscriptions.call_args_list], [['sub_0', 'sub_1'], ['sub_2']])
+        past_due, upgraded, failed = (UserSubscription.objects.get(pk=obj.pk) for obj in self.user_subs)
+        self.assertEqual((past_due.subscription, past_due.status), (self.basic, 'past_due'))
+        self.assertEqual((upgraded.subscription, upgraded.status), (self.pro, 'active'))
+        self.assertEqual(upgraded.original_period_start, upgraded.current_period_start)
+        self.assertEqual(list(upgraded.user.groups.all()), [self.pro_group])
+        self.assertEqual((failed.status, failed.current_period_start), ('active', None))
+
+
+class GroupSyncTests(TestCase):
+    def setUp(self):
+        self.basic, self.basic_group = make_plan('Basic', 'basic')
+        self.pro, self.pro_group = make_plan('Pro', 'pro')
+        self.staff = Group.objects.create(name='Staff')
+        self.user = User.objects.create_user('subscriber')
+        self.user.groups.add(self.staff)
+        self.user_sub = UserSubscription.objects.create(user=self.user, subscription=self.basic)
+
+    def groups(self):
+        return set(self.user.groups.all())
+
+    def test_plan_change_swaps_plan_groups_only(self):
+        self.assertEqual(self.groups(), {self.staff, self.basic_group})
+        self.user_sub.subscription = self.pro
+        self.user_sub.save()
+        self.assertEqual(self.groups(), {self.staff, self.pro_group})
+
+    def test_save_without_plan_change_leaves_groups_alone(self):
+        self.user.groups.remove(self.basic_group)
+        with self.assertNumQueries(1):
+            self.user_sub.status = 'past_due'
+            self.user_sub.save()
+        self.assertEqual(self.groups(), {self.staff})
+
+
+@override_settings(READ_CACHE=True)
+class EntitlementBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.basic, _ = make_plan('Basic', 'basic')
+        self.pro, _ = make_plan('Pro', 'pro')
+        self.user = User.objects.create_user('subscriber')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_sub = UserSubscription.objects.create(user=self.user, subscription=self.basic)
+
+    def perms(self):
+        # A fresh user object, has_perm results are kept on the instance
+        user = User.objects.get(pk=self.user.pk)
+        return {perm for perm in ('subscriptions.basic', 'subscriptions.pro') if user.has_perm(perm)}
+
+    def test_plan_change_revokes_the_old_entitlement(self):
+        self.assertEqual(self.perms(), {'subscriptions.basic'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_sub.subscription = self.pro
+            self.user_sub.save()
+        self.assertEqual(self.perms(), {'subscriptions.pro'})
+
+    def test_warm_check_makes_no_queries(self):
+        self.perms()
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('subscriptions.basic'))
+            self.assertFalse(user.has_perm('subscriptions.pro'))
+
+    def test_other_perms_fall_through(self):
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(user.has_perm('auth.add_group'))
+        user.user_permissions.add(Permission.objects.get(content_type__app_label='auth', codename='add_group'))
+        self.assertTrue(User.objects.get(pk=self.user.pk).has_perm('auth.add_group'))
+
+
+def subscription_event(event_id, type, created, plan='price_pro', status='active'):
+    return {'id': event_id, 'type': type, 'created': created, 'data': {'object': {
+        'id': 'sub_1', 'object': 'subscription', 'customer': 'cus_1', 'status': status,
+        'cancel_at_period_end': False, 'current_period_start': 1700000000, 'current_period_end': 1702000000,
+        'plan': {'id': plan, 'object': 'plan'},
+    }}}
+
+
+@mock.patch('helpers.billing.STRIPE_WEBHOOK_SECRET', 'whsec_test')
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.basic = Subscription.objects.create(name='Basic', stripe_id='prod_basic')
+        self.pro = Subscription.objects.create(name='Pro', stripe_id='prod_pro')
+        SubscriptionPrice.objects.create(subscription=self.basic, stripe_id='price_basic')
+        SubscriptionPrice.objects.create(subscription=self.pro, stripe_id='price_pro')
+        self.user = User.objects.create_user('subscriber')
+        Customer.objects.create(user=self.user, stripe_id='cus_1')
+
+    def post(self, event, signature=None):
+        body = json.dumps(event)
+        if signature is None:
+            timestamp = int(time.time())
+            digest = hmac.new(b'whsec_test', f'{timestamp}.{body}'.encode(), hashlib.sha256).hexdigest()
+            signature = f't={timestamp},v1={digest}'
+        return self.client.post('/checkout/webhook/', body, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+
+    def user_sub(self):
+        return UserSubscription.objects.get(user=self.user)
+
+    def test_redelivered_event_is_stored_once(self):
+        event = subscription_event('evt_1', 'customer.subscription.created', 100)
+        self.assertEqual(self.post(event).status_code, 200)
+        self.assertEqual(self.post(event).status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertTrue(Job.objects.filter(key='subscriptions.webhooks.process_pending', status=Job.Status.QUEUED).exists())
+
+    def test_bad_signature_is_rejected(self):
+        response = self.post(subscription_event('evt_1', 'customer.subscription.created', 100), signature='t=1,v1=bad')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_older_event_does_not_roll_back(self):
+        self.post(subscription_event('evt_2', 'customer.subscription.updated', 200, plan='price_basic'))
+        webhooks.process_pending()
+        self.post(subscription_event('evt_1', 'customer.subscription.updated', 100, status='past_due'))
+        webhooks.process_pending()
+        self.assertEqual((self.user_sub().subscription, self.user_sub().status), (self.basic, 'active'))
+
+    def test_same_second_created_after_updated_is_skipped(self):
+        self.post(subscription_event('evt_1', 'customer.subscription.created', 100, status='incomplete'))
+        self.post(subscription_event('evt_2', 'customer.subscription.updated', 100, plan='price_basic'))
+        webhooks.process_pending()
+        # Stripe redelivers the created event later in the same second's order
+        StripeEvent.objects.filter(event_id='evt_1').update(processed_at=None)
+        webhooks.process_pending()
+        self.assertEqual((self.user_sub().subscription, self.user_sub().status), (self.basic, 'active'))
+
+    @mock.patch('helpers.billing.get_subscription_session')
+    def test_same_second_updates_use_current_stripe_state(self, get_subscription_session):
+        current = subscription_event('-', '-', 0, plan='price_basic')['data']['object']
+        get_subscription_session.return_value = stripe.Subscription.construct_from(current, 'sk_test')
+        self.post(subscription_event('evt_1', 'customer.subscription.updated', 100, plan='price_basic'))
+        webhooks.process_pending()
+        # Arrives second but may be the older state
+        self.post(subscription_event('evt_2', 'customer.subscription.updated', 100, status='past_due'))
+        webhooks.process_pending()
+        get_subscription_session.assert_called_once_with('sub_1')
+        self.assertEqual((self.user_sub().subscription, self.user_sub().status), (self.basic, 'active'))
+
+    def test_deleted_cancels(self):
+        self.post(subscription_event('evt_1', 'customer.subscription.created', 100))
+        self.post(subscription_event('evt_2', 'customer.subscription.deleted', 200, status='canceled'))
+        self.assertEqual(webhooks.process_pending(), 2)
+        self.assertEqual(self.user_sub().status, 'canceled')
+
+
+class DanglingSubscriptionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('subscriber')
+        Customer.objects.create(user=self.user, stripe_id='cus_1')
+        self.old = int(time.time()) - 3600
+
+    def stripe_sub(self, stripe_id, created):
+        return stripe.Subscription.construct_from({'id': stripe_id, 'customer': 'cus_1', 'created': created}, 'sk_test')
+
+    @mock.patch('helpers.billing.cancel_subscriptions', side_effect=lambda ids, **kwargs: ids)
+    @mock.patch('helpers.billing.iter_active_subscriptions')
+    def test_only_subscriptions_nobody_points_at_are_cancelled(self, iter_active_subscriptions, cancel_subscriptions):
+        UserSubscription.objects.create(user=User.objects.create_user('known'), stripe_id='sub_known')
+
+        def subscriptions():
+            yield self.stripe_sub('sub_known', self.old)
+            yield self.stripe_sub('sub_dangling', self.old)
+            # A checkout completes while the pass is running
+            yield self.stripe_sub('sub_new', int(time.time()) + 1)
+            yield self.stripe_sub('sub_checkout', self.old)
+            UserSubscription.objects.create(user=self.user, stripe_id='sub_checkout')
+
+        iter_active_subscriptions.return_value = subscriptions()
+        self.assertEqual(subs_utils.clear_dangling_subs(verbose=False), ['sub_dangling'])
+        self.assertEqual(cancel_subscriptions.call_args.args[0], ['sub_dangling'])
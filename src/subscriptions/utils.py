@@ -1,8 +1,15 @@
+import itertools
+import time
+
 import helpers.billing
 
 from django.db.models import Q
 from customers.models import Customer
-from subscriptions.models import Subscription, UserSubscription, SubscriptionStatus
+from subscriptions import entitlements
+from subscriptions.models import Subscription, SubscriptionPrice, UserSubscription, SubscriptionStatus, user_sub_post_save
+
+# Fields the batched sync may change, written with one bulk_update per chunk
+SYNC_FIELDS = ['subscription', 'status', 'original_period_start', 'current_period_start', 'current_period_end']
 
 
 def refresh_active_users_subscriptions(
@@ -12,7 +19,10 @@ def refresh_active_users_subscriptions(
         days_ago=-1,
         day_start=-1,
         day_end=-1,
-        verbose=False):
+        verbose=False,
+        batched=False,
+        workers=8,
+        chunk_size=500):
     qs = UserSubscription.objects.all()
     if active_only:
         qs = qs.by_active_trialing()
@@ -24,6 +34,8 @@ def refresh_active_users_subscriptions(
         qs = qs.by_days_left(days_left=days_left)
     if day_start > -1 and day_end > -1:
         qs = qs.by_range(days_start=day_start, days_end=day_end, verbose=verbose)
+    if batched:
+        return refresh_users_subscriptions_batched(qs, workers=workers, chunk_size=chunk_size, verbose=verbose)
     complete_count = 0
     qs_count = qs.count()
     for obj in qs:
@@ -37,23 +49,91 @@ def refresh_active_users_subscriptions(
             complete_count += 1
     return complete_count == qs_count
 
-def clear_dangling_subs():
-    qs = Customer.objects.filter(stripe_id__isnull=False)
-    for customer_obj in qs:
-        user = customer_obj.user
-        customer_stripe_id = customer_obj.stripe_id
-        print(f"Sync {user} - {customer_stripe_id} subs and remove old ones")
-        subs =  helpers.billing.get_customer_active_subscriptions(customer_stripe_id)
-        for sub in subs:
-            existing_user_subs_qs = UserSubscription.objects.filter(stripe_id__iexact=f"{sub.id}".strip())
-            if existing_user_subs_qs.exists():
+def refresh_users_subscriptions_batched(qs, workers=8, chunk_size=500, verbose=False):
+    """
+    Same result as the one-at-a-time refresh, for large runs. Streams `qs`
+    in chunks, fetches each chunk from Stripe concurrently (rate limited),
+    writes only the rows that changed with one bulk_update, and recalculates
+    groups only for users whose plan changed. Also picks up plan changes
+    made in Stripe, which the serial refresh ignores.
+    """
+    plans = dict(
+        SubscriptionPrice.objects.filter(stripe_id__isnull=False, subscription__isnull=False)
+        .values_list('stripe_id', 'subscription_id')
+    )
+    qs_count = qs.count()
+    complete_count = 0
+    rows = qs.exclude(stripe_id__isnull=True).exclude(stripe_id="").order_by('pk').iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        responses = helpers.billing.get_subscriptions([obj.stripe_id for obj in chunk], workers=workers)
+        changed = []
+        plan_changed = []
+        for obj in chunk:
+            response = responses.get(obj.stripe_id)
+            if response is None:
                 continue
-            helpers.billing.cancel_subscription(sub.id, reason="Dangling active subscription", cancel_at_period_end=False)
-            # print(sub.id, existing_user_subs_qs.exists())
+            complete_count += 1
+            data = helpers.billing.serialize_subscription_data(response)
+            plan = getattr(response, "plan", None)
+            data["subscription_id"] = plans.get(plan.id, obj.subscription_id) if plan else obj.subscription_id
+            if obj.original_period_start is None and data["current_period_start"] is not None:
+                data["original_period_start"] = data["current_period_start"]
+            updates = {k: v for k, v in data.items() if getattr(obj, k) != v}
+            if not updates:
+                continue
+            if "subscription_id" in updates:
+                plan_changed.append(obj)
+            for k, v in updates.items():
+                setattr(obj, k, v)
+            changed.append(obj)
+        UserSubscription.objects.bulk_update(changed, SYNC_FIELDS)
+        for obj in plan_changed:
+            # bulk_update skips post_save, so only these users get their groups recalculated
+            user_sub_post_save(UserSubscription, obj)
+        if verbose:
+            print(f"Synced {complete_count}/{qs_count}, {len(changed)} changed, {len(plan_changed)} changed plan")
+    return complete_count == qs_count
+
+def _known_subscription_ids():
+    return {
+        stripe_id.strip()
+        for stripe_id in UserSubscription.objects.filter(stripe_id__isnull=False).values_list('stripe_id', flat=True)
+    }
+
+def clear_dangling_subs(dry_run=False, workers=8, verbose=True):
+    """
+    Cancel active Stripe subscriptions of our customers that no
+    UserSubscription points at. One pass over the account's active
+    subscriptions, diffed against the ids we know in memory. With
+    `dry_run`, only report them. Returns the dangling ids.
+
+    A checkout can finish while the pass runs, so subscriptions created
+    after it started are skipped and the known ids are read again right
+    before cancelling.
+    """
+    started = int(time.time())
+    customer_ids = set(Customer.objects.filter(stripe_id__isnull=False).values_list('stripe_id', flat=True))
+    known_ids = _known_subscription_ids()
+    dangling = [
+        sub.id for sub in helpers.billing.iter_active_subscriptions()
+        if sub.customer in customer_ids and sub.id not in known_ids and sub.created < started
+    ]
+    if dangling:
+        known_ids = _known_subscription_ids()
+        dangling = [stripe_id for stripe_id in dangling if stripe_id not in known_ids]
+    if verbose:
+        for stripe_id in dangling:
+            print(f"{'Would cancel' if dry_run else 'Cancelling'} dangling subscription {stripe_id}")
+    if not dry_run and dangling:
+        cancelled = helpers.billing.cancel_subscriptions(dangling, reason="Dangling active subscription", workers=workers)
+        if verbose:
+            print(f"Cancelled {len(cancelled)} of {len(dangling)} dangling subscriptions")
+    return dangling
 
 def sync_subs_group_permissions():
     qs = Subscription.objects.filter(active=True)
     for obj in qs:
         sub_perms = obj.permissions.all()
         for group in obj.groups.all():
-            group.permissions.set(sub_perms)
\ No newline at end of file
+            group.permissions.set(sub_perms)
+    entitlements.rebuild_all()
\ No newline at end of file
@@ -1,17 +1,30 @@
+from django.conf import settings
 from django.contrib import messages
 import helpers.billing
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render, redirect
 from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from subscriptions.models import SubscriptionPrice, UserSubscription
+from commando import jobs
+from helpers.db import replica_view
+from core import cache as core_cache
+from subscriptions.models import SubscriptionPrice, UserSubscription, pricing_snapshot
 from subscriptions import utils as subs_utils
+from subscriptions import webhooks
 
 @login_required
 def user_subscription_view(request,):
     user_sub_obj, created = UserSubscription.objects.get_or_create(user=request.user)
     sub_data = user_sub_obj.serialize()    
     if request.method == "POST":
+        if settings.BACKGROUND_JOBS:
+            jobs.enqueue(subs_utils.refresh_active_users_subscriptions,
+                         kwargs={"user_ids": [request.user.id], "active_only": False}, priority=10)
+            messages.success(request, "Your plan is being updated, check back in a moment")
+            return redirect(user_sub_obj.get_absolute_url())
         finished = subs_utils.refresh_active_users_subscriptions(user_ids=[request.user.id], active_only=False)
         if finished:
             messages.success(request, "Your plan have been updated")
@@ -44,24 +57,31 @@ def user_subscription_cancel_view(request,):
     return render(request, 'subscriptions/user_cancel_view.html',
                   {"subscription": user_sub_obj})
 
+@replica_view
 def subscription_price_view(request, interval="month"):
-    qs = SubscriptionPrice.objects.filter(featured=True)
     inv_mo = SubscriptionPrice.IntervalChoices.MONTHLY
     inv_yr = SubscriptionPrice.IntervalChoices.YEARLY
     url_path_name = "pricing_interval"
     mo_url = reverse(url_path_name, kwargs={"interval": inv_mo})
     yr_url = reverse(url_path_name, kwargs={"interval": inv_yr})
-    active = inv_mo
-    monthly_qs = qs.filter(interval=SubscriptionPrice.IntervalChoices.MONTHLY)
-    yearly_qs = SubscriptionPrice.objects.filter(interval=SubscriptionPrice.IntervalChoices.YEARLY)
-
-    object_list = qs.filter(interval=inv_mo)
-    if interval == inv_yr:
-        active = inv_yr
-        object_list = qs.filter(interval=inv_yr)
+    active = inv_yr if interval == inv_yr else inv_mo
     return render(request, "subscriptions/pricing.html", {
-        'object_list': object_list,   
+        'object_list': pricing_snapshot()[active],
+        'pricing_version': core_cache.generation('pricing', 0),
+        # 0 never stores the fragment, the version can't reach other processes without a shared cache
+        'pricing_cache_seconds': core_cache.TIMEOUT if settings.READ_CACHE else 0,
         'mo_url': mo_url,
         'yr_url': yr_url,
         'active': active,
-    })
\ No newline at end of file
+    })
+
+@csrf_exempt
+@require_POST
+def stripe_webhook_view(request):
+    # Only verify and store here, the job worker applies the event
+    try:
+        event = helpers.billing.verify_webhook_event(request.body, request.META.get("HTTP_STRIPE_SIGNATURE"))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid signature")
+    webhooks.record(event)
+    return HttpResponse(status=200)
@@ -0,0 +1,162 @@
+"""
+Stripe webhooks: the view stores each event (record), and a job on the
+worker applies them (process_pending).
+
+Events are applied oldest first. An event about an object that already had
+a newer event applied is skipped, so a late redelivery can't roll a
+subscription back. Stripe only timestamps events to the second, so ties
+are ordered by event type, and a tie that type can't break is resolved by
+asking Stripe for the subscription's current state.
+"""
+import datetime
+import logging
+
+import stripe
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+import helpers.billing
+from commando import jobs
+from customers.models import Customer
+from .models import StripeEvent, SubscriptionPrice, SubscriptionStatus, UserSubscription
+
+logger = logging.getLogger(__name__)
+
+
+def record(event):
+    """Store a verified event dict. Returns False for one already stored."""
+    data_object = event.get("data", {}).get("object", {})
+    try:
+        with transaction.atomic():
+            StripeEvent.objects.create(
+                event_id=event["id"],
+                type=event["type"],
+                object_id=data_object.get("id") or "",
+                created=datetime.datetime.fromtimestamp(event["created"], tz=datetime.timezone.utc),
+                payload=event,
+            )
+            jobs.run_soon("subscriptions.webhooks.process_pending")
+    except IntegrityError:
+        return False
+    return True
+
+
+def apply_subscription(event, refetch=False):
+    """
+    customer.subscription.created / updated / deleted. With `refetch` the
+    subscription's current state comes from Stripe instead of the payload.
+    """
+    if refetch:
+        response = helpers.billing.get_subscription_session(event.object_id)
+    else:
+        response = stripe.Subscription.construct_from(event.payload["data"]["object"], stripe.api_key)
+    user_sub = UserSubscription.objects.filter(stripe_id=response.id).first()
+    if user_sub is None:
+        if event.type == "customer.subscription.deleted":
+            return
+        # Arrived before checkout finalized: attach it unless the user still has another live subscription
+        user_sub = UserSubscription.objects.filter(user__customer__stripe_id=response.customer).first()
+        if user_sub is None:
+            customer = Customer.objects.filter(stripe_id=response.customer).first()
+            if customer is None:
+                return
+            user_sub = UserSubscription(user_id=customer.user_id)
+        elif user_sub.stripe_id and user_sub.is_active_status:
+            return
+        user_sub.stripe_id = response.id
+    for k, v in helpers.billing.serialize_subscription_data(response).items():
+        setattr(user_sub, k, v)
+    user_sub.cancel_at_period_end = bool(response.cancel_at_period_end)
+    plan = getattr(response, "plan", None)
+    if plan is not None:
+        price = SubscriptionPrice.objects.filter(stripe_id=plan.id).only("subscription_id").first()
+        if price is not None and price.subscription_id is not None:
+            user_sub.subscription_id = price.subscription_id
+    if event.type == "customer.subscription.deleted":
+        user_sub.status = SubscriptionStatus.CANCELED
+    user_sub.save()
+
+
+def apply_customer_deleted(event):
+    # update() rather than save(), which would create a new Stripe customer
+    Customer.objects.filter(stripe_id=event.object_id).update(stripe_id=None)
+
+
+HANDLERS = {
+    "customer.subscription.created": apply_subscription,
+    "customer.subscription.updated": apply_subscription,
+    "customer.subscription.deleted": apply_subscription,
+    "customer.deleted": apply_customer_deleted,
+}
+
+
+# Stripe's `created` is in whole seconds. Events about one subscription in
+# the same second happened in this order.
+SAME_SECOND_ORDER = {
+    "customer.subscription.created": 0,
+    "customer.subscription.updated": 1,
+    "customer.subscription.deleted": 2,
+}
+
+
+def _applied_same_object(event):
+    return StripeEvent.objects.filter(
+        object_id=event.object_id,
+        processed_at__isnull=False,
+    ).exclude(pk=event.pk)
+
+
+def _superseded(event):
+    """An event that comes after this one has already been applied."""
+    rank = SAME_SECOND_ORDER.get(event.type)
+    later_types = [t for t, r in SAME_SECOND_ORDER.items() if rank is not None and r > rank]
+    return _applied_same_object(event).filter(
+        Q(created__gt=event.created) | Q(created=event.created, type__in=later_types)
+    ).exists()
+
+
+def _ambiguous(event):
+    # Two updates in the same second can't be ordered, only Stripe knows which state is current
+    return _applied_same_object(event).filter(created=event.created, type=event.type).exists()
+
+
+def process(event):
+    handler = HANDLERS.get(event.type)
+    try:
+        with transaction.atomic():
+            if handler is not None and not (event.object_id and _superseded(event)):
+                if handler is apply_subscription and _ambiguous(event):
+                    handler(event, refetch=True)
+                else:
+                    handler(event)
+    except Exception as e:
+        logger.exception("Could not apply Stripe event %s", event.event_id)
+        event.attempts += 1
+        event.error = repr(e)
+        event.save(update_fields=["attempts", "error"])
+        return False
+    event.attempts += 1
+    event.processed_at = timezone.now()
+    event.error = ""
+    event.save(update_fields=["attempts", "processed_at", "error"])
+    return True
+
+
+def process_pending(batch_size=100):
+    """Apply pending events oldest first. Returns how many were applied."""
+    applied = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked lets a second worker pass over a batch instead of waiting on it
+            events = list(
+                StripeEvent.objects.pending()
+                .select_for_update(skip_locked=True)
+                .order_by("created", "id")[:batch_size]
+            )
+            if not events:
+                return applied
+            for event in events:
+                applied += process(event)
+        if len(events) < batch_size:
+            return applied
@@ -36,7 +36,7 @@ def verify():
          Profile.objects.create(user=kid_user, role=Profile.Role.KID)
     else:
         kid_user.profile.role = Profile.Role.KID
-        kid_user.profile.parent = parent_user.profile
+        kid_user.profile.set_parent(parent_user.profile)
         kid_user.profile.save()
 
     print(f"Kid created: {kid_user.username} - Role: {kid_user.profile.role} - Parent: {kid_user.profile.parent.user.username}")
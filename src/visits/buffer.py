@@ -0,0 +1,142 @@
+"""
+Write-behind page visit counting.
+
+Each process keeps the visits it has seen in memory and writes them out in
+one go: a bulk_create into PageVisit plus one increment per (path, day) in
+PageVisitDaily. That happens on a background thread once FLUSH_SIZE visits
+are pending or FLUSH_SECONDS after the first unflushed one, and at exit. Totals are read from the shared
+Django cache, so a warm request makes no queries. Visits still in a
+process's buffer when it is killed are lost, which is fine for a counter.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import PageVisit, PageVisitDaily, visit_count
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = 100
+FLUSH_SECONDS = 10
+
+# Cached totals are rebuilt from PageVisitDaily at least this often, which
+# bounds any drift from increments that raced a rebuild
+TOTALS_TIMEOUT = 5 * 60
+
+
+def _total_key(path=None):
+    if path is None:
+        return 'visits:total'
+    return f'visits:path:{hashlib.md5(path.encode()).hexdigest()}'
+
+
+class VisitBuffer:
+    def __init__(self, flush_size=FLUSH_SIZE, flush_seconds=FLUSH_SECONDS):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._pending = []
+        self._lock = threading.Lock()
+        # Serializes flushes so a timer flush and the one at exit don't interleave
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def record(self, path):
+        """Queue a visit. Never touches the database: flushes run on a background thread."""
+        with self._lock:
+            self._pending.append(PageVisit(path=path, timestamp=timezone.now()))
+            full = len(self._pending) >= self.flush_size
+            if self._timer is not None and (not full or self._timer.interval == 0):
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            # A full buffer is flushed right away, but off the request thread
+            self._timer = threading.Timer(0 if full else self.flush_seconds, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def pending_count(self, path=None):
+        with self._lock:
+            if path is None:
+                return len(self._pending)
+            return sum(1 for visit in self._pending if visit.path == path)
+
+    def flush(self):
+        """Write out everything pending. Returns the number of visits written."""
+        with self._flush_lock:
+            with self._lock:
+                visits, self._pending = self._pending, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not visits:
+                return 0
+            counts = Counter((visit.path, timezone.localdate(visit.timestamp)) for visit in visits)
+            try:
+                with transaction.atomic():
+                    PageVisit.objects.bulk_create(visits)
+                    for (path, day), count in counts.items():
+                        PageVisitDaily.objects.add(path, day, count)
+            except Exception:
+                logger.exception("Could not flush %s page visits", len(visits))
+                return 0
+            _bump_totals(visits)
+            return len(visits)
+
+    def _flush_from_timer(self):
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            # Timer threads don't go through the request cycle that would close this
+            connection.close()
+
+
+def _bump_totals(visits):
+    for key, count in Counter(_total_key(visit.path) for visit in visits).items():
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            # Not cached right now, the next read rebuilds it from the database
+            pass
+    try:
+        cache.incr(_total_key(), len(visits))
+    except ValueError:
+        pass
+
+
+def _cached_total(path=None):
+    key = _total_key(path)
+    total = cache.get(key)
+    if total is None:
+        total = visit_count(path)
+        cache.add(key, total, TOTALS_TIMEOUT)
+    return total
+
+
+buffer = VisitBuffer()
+atexit.register(buffer.flush)
+
+
+def record_visit(path):
+    buffer.record(path)
+
+
+def visit_totals(path):
+    """
+    (visits to `path`, all visits) including this process's unflushed ones.
+    Warm, that's one cache round trip and no queries.
+    """
+    totals = cache.get_many([_total_key(path), _total_key()])
+    page_total = totals.get(_total_key(path))
+    total = totals.get(_total_key())
+    if page_total is None:
+        page_total = _cached_total(path)
+    if total is None:
+        total = _cached_total()
+    return page_total + buffer.pending_count(path), total + buffer.pending_count()
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageVisitDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.TextField(blank=True, null=True)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pagevisit',
+            index=models.Index(fields=['timestamp'], name='visits_page_timesta_bea5a4_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pagevisitdaily',
+            constraint=models.UniqueConstraint(fields=('path', 'day'), name='unique_page_visit_daily'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:40
+
+from django.db import migrations
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+
+
+def backfill_page_visit_daily(apps, schema_editor):
+    # PageVisitDaily so far only held archived visits, fold the live ones in too
+    PageVisit = apps.get_model('visits', 'PageVisit')
+    PageVisitDaily = apps.get_model('visits', 'PageVisitDaily')
+    rows = (
+        PageVisit.objects.order_by()
+        .annotate(day=TruncDate('timestamp'))
+        .values('path', 'day')
+        .annotate(count=Count('id'))
+    )
+    for row in rows.iterator():
+        updated = PageVisitDaily.objects.filter(path=row['path'], day=row['day']).update(count=F('count') + row['count'])
+        if not updated:
+            PageVisitDaily.objects.create(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visits', '0002_pagevisitdaily_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_page_visit_daily, migrations.RunPython.noop),
+    ]
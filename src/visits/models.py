@@ -1,8 +1,55 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Sum
 
 # Create your models here.
 class PageVisit(models.Model):
     # db -> table
     # id -> hidden -> primary key -> autofield -> 1, 2, 3, 4, 5
     path = models.TextField(blank=True, null=True) # col
-    timestamp = models.DateTimeField(auto_now_add=True) # col
\ No newline at end of file
+    timestamp = models.DateTimeField(auto_now_add=True) # col
+
+    class Meta:
+        indexes = [
+            # Range scans for archive_events
+            models.Index(fields=['timestamp']),
+        ]
+
+
+class PageVisitDailyQuerySet(models.QuerySet):
+    def add(self, path, day, count):
+        """Add `count` visits to the (path, day) row, creating it on first use."""
+        rows = self.filter(path=path, day=day)
+        if rows.update(count=F('count') + count):
+            return
+        try:
+            with transaction.atomic():
+                self.create(path=path, day=day, count=count)
+        except IntegrityError:
+            # Another worker created the row in between
+            rows.update(count=F('count') + count)
+
+
+class PageVisitDaily(models.Model):
+    """
+    Visit counts per path per day. visits.buffer adds to these as it flushes,
+    so they cover every visit, including the ones archive_events has moved
+    out of PageVisit.
+    """
+    path = models.TextField(blank=True, null=True)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    objects = PageVisitDailyQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['path', 'day'], name='unique_page_visit_daily'),
+        ]
+
+
+def visit_count(path=None):
+    """All-time visits, to `path` if given, from the daily counts."""
+    rows = PageVisitDaily.objects.all()
+    if path is not None:
+        rows = rows.filter(path=path)
+    return rows.aggregate(total=Sum('count'))['total'] or 0
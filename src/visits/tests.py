@@ -1,3 +1,19 @@
-from django.test import TestCase
+from django.test import TransactionTestCase
 
-# Create your tests here.
+from .buffer import VisitBuffer
+from .models import PageVisit, PageVisitDaily
+
+
+class VisitBufferTests(TransactionTestCase):
+    def test_record_never_writes_in_the_request(self):
+        buffer = VisitBuffer(flush_size=3, flush_seconds=60)
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                buffer.record('/pricing/')
+        # The full buffer went to a background flush instead
+        timer = buffer._timer
+        self.assertEqual(timer.interval, 0)
+        timer.join(5)
+        self.assertEqual(PageVisit.objects.filter(path='/pricing/').count(), 3)
+        self.assertEqual(PageVisitDaily.objects.get(path='/pricing/').count, 3)
+        self.assertEqual(buffer.pending_count(), 0)